@@ -0,0 +1,364 @@
+#!/usr/bin/python
+
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+# This script measures the hot paths of this package on synthetic data.
+#
+# It generates daily CSV files and JSON dumps with socorro.synthetic, then
+# times parsing, filtering and each of the parse_crashdata.py reports. Every
+# benchmark runs in a fresh process so its peak memory can be measured.
+# Results are printed as a table on stderr and written as JSON, which can be
+# compared against a previous run with --compare.
+
+from datetime import datetime
+from multiprocessing import Process, Queue
+from optparse import OptionParser
+from os import listdir, makedirs
+from os.path import exists, join
+from Queue import Empty
+from sys import exit, stderr, stdout
+
+import json
+import platform
+import resource
+import shutil
+import tempfile
+import time
+
+from socorro.analysis import CrashAggregator, CrashFilter
+from socorro.analysis import build_csv_cache, process_csv_file
+from socorro.analysis import process_json_files
+from socorro.crashdata import CrashData, CrashDataParser
+from socorro.synthetic import CrashGenerator
+
+import gzip
+
+op = OptionParser()
+op.add_option('--rows', dest='rows', default=200000, type='int',
+              help='Number of rows in the generated CSV file')
+op.add_option('--dumps', dest='dumps', default=5000, type='int',
+              help='Number of generated JSON dumps')
+op.add_option('--signatures', dest='signatures', default=2000, type='int',
+              help='Number of distinct signatures')
+op.add_option('--stack-depth', dest='stack_depth', default=30, type='int',
+              help='Number of frames in each thread of a dump')
+op.add_option('--modules', dest='modules', default=100, type='int',
+              help='Number of modules in each dump')
+op.add_option('--seed', dest='seed', default=0, type='int',
+              help='Seed for the data generator')
+op.add_option('--repeat', dest='repeat', default=3, type='int',
+              help='Number of times to run each benchmark. The fastest run is reported')
+op.add_option('--only', dest='only', default=None,
+              help='Only run benchmarks whose name contains this string')
+op.add_option('--workdir', dest='workdir', default=None,
+              help='Directory for generated data. Data is reused if it was generated with the same parameters')
+op.add_option('--output', '-o', dest='output', default=None,
+              help='Write JSON results to this file instead of stdout')
+op.add_option('--compare', dest='compare', default=None,
+              help='JSON results of a previous run to compare against')
+
+(options, args) = op.parse_args()
+
+params = {
+    'rows': options.rows,
+    'dumps': options.dumps,
+    'signatures': options.signatures,
+    'stack_depth': options.stack_depth,
+    'modules': options.modules,
+    'seed': options.seed,
+}
+
+DAY = datetime(2011, 7, 15)
+
+def generate(workdir):
+    '''Generate benchmark data into workdir unless it is already there.'''
+    params_path = join(workdir, 'params.json')
+    if exists(params_path):
+        with open(params_path, 'rb') as fh:
+            if json.load(fh) == params:
+                return
+
+        shutil.rmtree(workdir)
+
+    if not exists(workdir):
+        makedirs(workdir)
+
+    print >>stderr, 'Generating benchmark data in %s' % workdir
+
+    generator = CrashGenerator(seed=options.seed,
+                               signatures=options.signatures,
+                               stack_depth=options.stack_depth,
+                               modules=options.modules)
+
+    generator.write_csv(join(workdir, 'crashdata.csv.gz'), options.rows, DAY)
+
+    makedirs(join(workdir, 'dumps'))
+    generator.write_dumps(join(workdir, 'dumps'), options.dumps, DAY)
+
+    # The cache benchmarks need a separate copy of the CSV file, since the
+    # others must not pick up the cache.
+    shutil.copy(join(workdir, 'crashdata.csv.gz'),
+                join(workdir, 'cached.csv.gz'))
+    build_csv_cache(join(workdir, 'cached.csv.gz'))
+
+    with open(params_path, 'wb') as fh:
+        json.dump(params, fh)
+
+# A signature near the end of the long tail, so filtering on it is selective.
+def rare_signature():
+    generator = CrashGenerator(seed=options.seed,
+                               signatures=options.signatures,
+                               stack_depth=options.stack_depth,
+                               modules=options.modules)
+    return generator.signatures[-1][0]
+
+def json_files(workdir):
+    directory = join(workdir, 'dumps')
+    return [join(directory, p) for p in listdir(directory)]
+
+class NullWriter(object):
+    def write(self, s):
+        pass
+
+def aggregate_csv(filename, crash_filter, report, **settings):
+    aggregator = CrashAggregator(**settings)
+    process_csv_file(filename, crash_filter, aggregator.add)
+    getattr(aggregator, report)(NullWriter())
+
+def aggregate_json(workdir, crash_filter, report, **settings):
+    aggregator = CrashAggregator(**settings)
+    process_json_files(json_files(workdir), crash_filter, aggregator.add)
+    getattr(aggregator, report)(NullWriter())
+
+def bench_csv_parse_eager(workdir):
+    for crash in CrashDataParser().parse_handle(gzip.open(join(workdir, 'crashdata.csv.gz'))):
+        pass
+
+    return options.rows
+
+def bench_csv_parse_lazy(workdir):
+    for crash in CrashDataParser(lazy=True).parse_handle(gzip.open(join(workdir, 'crashdata.csv.gz'))):
+        crash.uuid
+
+    return options.rows
+
+def bench_csv_signature_filter(workdir):
+    crash_filter = CrashFilter(signature=rare_signature())
+    process_csv_file(join(workdir, 'crashdata.csv.gz'), crash_filter,
+                     lambda crash: crash.uuid)
+
+    return options.rows
+
+def bench_csv_print_versions(workdir):
+    aggregate_csv(join(workdir, 'crashdata.csv.gz'), CrashFilter(),
+                  'print_versions')
+
+    return options.rows
+
+def bench_csv_print_builds(workdir):
+    aggregate_csv(join(workdir, 'crashdata.csv.gz'), CrashFilter(),
+                  'print_builds', collect_builds=True)
+
+    return options.rows
+
+def bench_cache_signature_filter(workdir):
+    crash_filter = CrashFilter(signature=rare_signature())
+    process_csv_file(join(workdir, 'cached.csv.gz'), crash_filter,
+                     lambda crash: crash.uuid)
+
+    return options.rows
+
+def bench_cache_print_builds(workdir):
+    aggregate_csv(join(workdir, 'cached.csv.gz'), CrashFilter(),
+                  'print_builds', collect_builds=True)
+
+    return options.rows
+
+def bench_json_parse(workdir):
+    for filename in json_files(workdir):
+        with open(filename, 'rb') as fh:
+            crash = CrashData(json=fh.read())
+
+    return options.dumps
+
+def bench_json_stack_symbol_filter(workdir):
+    crash_filter = CrashFilter(stack_symbol='memcpy')
+    process_json_files(json_files(workdir), crash_filter,
+                       lambda crash: crash.uuid)
+
+    return options.dumps
+
+def bench_json_print_frame_counts(workdir):
+    aggregate_json(workdir, CrashFilter(), 'print_frame_counts',
+                   collect_frames=True)
+
+    return options.dumps
+
+def bench_json_print_frame_position_counts(workdir):
+    aggregate_json(workdir, CrashFilter(), 'print_frame_position_counts',
+                   collect_frames=True)
+
+    return options.dumps
+
+BENCHMARKS = [
+    ('csv_parse_eager', bench_csv_parse_eager),
+    ('csv_parse_lazy', bench_csv_parse_lazy),
+    ('csv_signature_filter', bench_csv_signature_filter),
+    ('csv_print_versions', bench_csv_print_versions),
+    ('csv_print_builds', bench_csv_print_builds),
+    ('cache_signature_filter', bench_cache_signature_filter),
+    ('cache_print_builds', bench_cache_print_builds),
+    ('json_parse', bench_json_parse),
+    ('json_stack_symbol_filter', bench_json_stack_symbol_filter),
+    ('json_print_frame_counts', bench_json_print_frame_counts),
+    ('json_print_frame_position_counts', bench_json_print_frame_position_counts),
+]
+
+def run_one(func, workdir, queue):
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    rows = func(workdir)
+    elapsed = time.time() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    queue.put((rows, elapsed, peak_rss - start_rss))
+
+def run(func, workdir):
+    '''Run a benchmark in a child process. Returns (rows, seconds, peak
+    memory growth in KB), or the child's exit code if it died without a
+    result.'''
+    queue = Queue()
+    p = Process(target=run_one, args=(func, workdir, queue))
+    p.start()
+
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1)
+        except Empty:
+            if p.is_alive():
+                continue
+
+            # The child may have exited just after putting its result.
+            try:
+                result = queue.get(timeout=1)
+            except Empty:
+                break
+
+    p.join()
+
+    if result is None:
+        return p.exitcode
+
+    return result
+
+workdir = options.workdir
+if workdir is None:
+    workdir = tempfile.mkdtemp(prefix='socorro-bench-')
+
+generate(workdir)
+
+results = {}
+failed = {}
+for name, func in BENCHMARKS:
+    if options.only and options.only not in name:
+        continue
+
+    runs = []
+    for i in range(options.repeat):
+        r = run(func, workdir)
+        if not isinstance(r, tuple):
+            failed[name] = r
+            break
+
+        runs.append(r)
+
+    if name in failed:
+        print >>stderr, '%s failed with exit code %s' % ( name, failed[name] )
+        continue
+
+    rows, seconds, peak_kb = min(runs, key=lambda r: r[1])
+
+    results[name] = {
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_sec': rows / seconds if seconds else None,
+        'peak_kb': max(r[2] for r in runs),
+    }
+
+if options.workdir is None:
+    shutil.rmtree(workdir)
+
+baseline = {}
+if options.compare:
+    with open(options.compare, 'rb') as fh:
+        baseline = json.load(fh)['results']
+
+print >>stderr, '%s %12s %10s %10s %8s' % ( 'benchmark'.ljust(34), 'rows/sec', 'seconds', 'peak KB', 'speedup' )
+for name, func in BENCHMARKS:
+    if name not in results:
+        continue
+
+    r = results[name]
+    speedup = ''
+    if name in baseline and baseline[name]['seconds'] and r['seconds']:
+        speedup = '%.2fx' % (baseline[name]['seconds'] / r['seconds'])
+
+    rate = '-'
+    if r['rows_per_sec'] is not None:
+        rate = '%d' % r['rows_per_sec']
+
+    print >>stderr, '%s %12s %10.3f %10d %8s' % ( name.ljust(34), rate, r['seconds'], r['peak_kb'], speedup )
+
+output = {
+    'python': platform.python_version(),
+    'params': params,
+    'results': results,
+    'failed': failed,
+}
+
+if options.output:
+    with open(options.output, 'wb') as fh:
+        json.dump(output, fh, indent=2, sort_keys=True)
+else:
+    json.dump(output, stdout, indent=2, sort_keys=True)
+    print
+
+if failed:
+    exit(1)
@@ -38,10 +38,20 @@
 # ***** END LICENSE BLOCK *****
 
 # This script downloads all the available crash data from Mozilla's servers.
+#
+# Files are streamed to a .part file next to the destination and renamed
+# into place once complete, so an existing destination file is always whole.
+# An interrupted download leaves the .part file behind and is resumed from
+# where it stopped on the next run. A download is only renamed into place
+# once the .part file has the size the server announced; a connection that
+# ends early leaves the .part file to be resumed.
 
 from datetime import date, timedelta
 from optparse import OptionParser
-from os.path import exists, join
+from os import rename
+from os.path import exists, getsize, join
+from Queue import Queue
+from threading import Lock, Thread
 
 import urllib2
 
@@ -49,6 +59,8 @@ op = OptionParser()
 op.add_option('--base-uri', dest='uri', default='https://crash-analysis.mozilla.com/crash_analysis/')
 op.add_option('--days', '-d', dest='days', default=30, type='int',
               help='The number of days to fetch')
+op.add_option('--parallel', '-p', dest='parallel', default=4, type='int',
+              help='The number of days to download at the same time')
 
 (options, args) = op.parse_args()
 
@@ -56,9 +68,104 @@ if len(args) != 1:
     print 'Must specify output directory as argument'
     exit(1)
 
+CHUNK_SIZE = 256 * 1024
+
+output_lock = Lock()
+
+def log(message):
+    with output_lock:
+        print message
+
+def expected_size(url, offset):
+    '''Returns the size the complete file should have, or None if the
+    response doesn't say.'''
+    info = url.info()
+
+    if offset:
+        # Content-Range: bytes <start>-<end>/<total>
+        total = (info.getheader('Content-Range') or '').rpartition('/')[2]
+        if total.isdigit():
+            return int(total)
+
+        return None
+
+    length = info.getheader('Content-Length')
+    if length and length.isdigit():
+        return int(length)
+
+    return None
+
+def download(uri, filename):
+    '''Stream a URI to a file, resuming a previous partial download.'''
+    part = filename + '.part'
+
+    request = urllib2.Request(uri)
+    offset = 0
+    if exists(part):
+        offset = getsize(part)
+        request.add_header('Range', 'bytes=%d-' % offset)
+
+    try:
+        url = urllib2.urlopen(request)
+    except urllib2.HTTPError, e:
+        # The partial file is larger than the remote file. Start over.
+        if e.code != 416:
+            raise
+
+        offset = 0
+        url = urllib2.urlopen(uri)
+
+    # 206 means the server honored the range request. Anything else is the
+    # full file.
+    if offset and url.getcode() == 206:
+        log('Resuming %s at %d bytes' % ( filename, offset ))
+        mode = 'ab'
+    else:
+        offset = 0
+        mode = 'wb'
+
+    size = expected_size(url, offset)
+
+    with open(part, mode) as fh:
+        while True:
+            chunk = url.read(CHUNK_SIZE)
+            if not chunk:
+                break
+
+            fh.write(chunk)
+
+    url.close()
+
+    # An early EOF just ends the reads above, so check nothing is missing
+    # before committing the file under its final name.
+    received = getsize(part)
+    if size is not None and received != size:
+        raise Exception('Received %d of %d bytes; keeping %s to resume' % (
+            received, size, part ))
+
+    rename(part, filename)
+
+def worker(queue, failures):
+    while True:
+        job = queue.get()
+        if job is None:
+            break
+
+        uri, filename = job
+        log('Downloading %s to %s' % ( uri, filename ))
+
+        try:
+            download(uri, filename)
+        except Exception, e:
+            log('Error downloading %s: %s' % ( uri, e ))
+            failures.append(uri)
+
 outdir = args[0]
 today = date.today()
 
+queue = Queue()
+failures = []
+
 for i in range(1, options.days):
     d = today - timedelta(i)
     ds = d.strftime('%Y%m%d')
@@ -70,8 +177,18 @@ for i in range(1, options.days):
         print 'Destination filename exists. Skipping: %s' % filename
         continue
 
-    print 'Downloading %s to %s' % ( uri, filename )
-    url = urllib2.urlopen(uri)
-    with open(filename, 'wb') as fh:
-        fh.write(url.read())
+    queue.put((uri, filename))
+
+threads = []
+for i in range(max(1, options.parallel)):
+    queue.put(None)
 
+    t = Thread(target=worker, args=(queue, failures))
+    t.start()
+    threads.append(t)
+
+for t in threads:
+    t.join()
+
+if failures:
+    exit(1)
@@ -40,24 +40,50 @@
 # This script reads crash UUIDs from stdin and fetches the raw dumps from the
 # crash server.
 
+from optparse import OptionParser
 from os.path import exists, join
-from sys import argv, stdin
+from sys import stdin
 from socorro.crashdata import DumpFetcher
+from socorro.dumpstore import DumpStore
 
-if len(argv) != 2:
+op = OptionParser(usage='./download_dumps.py [options] /path/to/output/directory < file_of_uuids')
+op.add_option('--concurrency', '-c', dest='concurrency', default=1, type='int',
+              help='Number of dumps to fetch in parallel')
+op.add_option('--pack', dest='pack', default=False, action='store_true',
+              help='Treat the output path as a pack file and append dumps to it instead of writing one file per dump')
+op.add_option('--retries', dest='retries', default=3, type='int',
+              help='Number of times to retry a failed fetch')
+
+(options, args) = op.parse_args()
+
+if len(args) != 1:
     print 'Usage: ./download_dumps.py /path/to/output/directory < file_of_uuids'
     exit(1)
 
-outdir = argv[1]
-if not exists(outdir):
+outdir = args[0]
+store = None
+if options.pack:
+    store = DumpStore(outdir, 'a')
+elif not exists(outdir):
     print 'Output directory does not exist: %s' % outdir
     exit(1)
 
-fetcher = DumpFetcher('crash-stats.mozilla.com', True)
+fetcher = DumpFetcher('crash-stats.mozilla.com', True,
+                      concurrency=options.concurrency,
+                      retries=options.retries)
 
 ids = []
 for line in stdin:
     id = line.strip()
+
+    if store is not None:
+        if id in store:
+            print 'Skipping %s because it exists in %s' % ( id, outdir )
+            continue
+
+        ids.append(id)
+        continue
+
     filename = join(outdir, '%s.json' % id)
     if exists(filename):
         print 'Skipping %s because it exists: %s' % ( id, filename )
@@ -66,9 +92,17 @@ for line in stdin:
     ids.append(id)
 
 for (id, jsonz) in fetcher.fetch_dumps(ids):
+    if store is not None:
+        store.add(id, jsonz)
+        print 'Wrote %s to %s' % ( id, outdir )
+        continue
+
     filename = join(outdir, '%s.json' % id)
 
     with open(filename, 'wb') as fh:
         fh.write(jsonz)
 
     print 'Wrote %s to %s' % ( id, filename )
+
+if store is not None:
+    store.close()
@@ -50,121 +50,143 @@
 # from the daily crash CSV files. These JSON files were likely obtained from
 # the crash server.
 
-from socorro.crashdata import CrashDataParser, CrashData
+from socorro.analysis import aggregate_csv_block, aggregate_csv_file
+from socorro.analysis import aggregate_dump_store, aggregate_json_files
+from socorro.analysis import aggregate_csv_files_with_rollups
+from socorro.analysis import build_csv_cache, open_csv_file
+from socorro.analysis import process_csv_file, process_csv_handle
+from socorro.analysis import process_dump_store, process_json_data
+from socorro.analysis import process_json_files
+from socorro.cache import open_cache
+from socorro.crashdata import CrashDataParser
+from socorro.dumpstore import DumpStore
+from socorro.export import SQLiteExporter
+from socorro.follow import WindowedCounts, follow_json_dir, follow_lines
+from socorro.query import Query, QueryError, add_query_options
+from socorro.sample import CSVSampler, SampleError, aggregate_sample
+from multiprocessing import Pool
 from optparse import OptionParser
-from os import listdir
+from os import listdir, makedirs
 from os.path import exists, join
 from sys import stdin, stderr
-
-import gzip
+from time import time
 
 op = OptionParser()
-op.add_option('--signature', '-s', dest='signature', default=None,
-              help='Filter crashes by those containing this string in signature')
+add_query_options(op)
 op.add_option('--json-dir', dest='json_dir', default=None,
               help='Directory containing .json files for raw crash dumps to read')
+op.add_option('--dump-pack', dest='dump_pack', default=None,
+              help='Pack file of raw crash dumps to read, as written by download_dumps.py --pack')
 op.add_option('--ids-on-stdin', dest='ids_on_stdin', default=False,
               action='store_true',
               help='When reading from directories or daily dump files, only read UUIDs specified from stdin')
-op.add_option('--filter-stack-symbol', dest='filter_stack_symbol', default=None,
-              help='Filter by the presence of a symbol on the stack. Performs substring matching')
-op.add_option('--print-versions', dest='print_versions', default=False,
+op.add_option('--follow', '-f', dest='follow', default=False,
               action='store_true',
-              help='Print a summary of version counts')
-op.add_option('--print-builds', dest='print_builds', default=False,
+              help='Watch stdin, a growing CSV file or --json-dir for new crashes and periodically print version, signature and frame counts over a sliding window')
+op.add_option('--window', dest='window', default=3600, type='int',
+              help='With --follow, seconds of date_processed time to count over (default 3600)')
+op.add_option('--bucket', dest='bucket', default=60, type='int',
+              help='With --follow, granularity in seconds at which old crashes leave the window (default 60)')
+op.add_option('--snapshot-interval', dest='snapshot_interval', default=60.0,
+              type='float',
+              help='With --follow, seconds between printed snapshots (default 60)')
+op.add_option('--poll-interval', dest='poll_interval', default=1.0,
+              type='float',
+              help='With --follow, seconds to wait before checking a file or directory for new data (default 1)')
+op.add_option('--sample', dest='sample', default=None, type='int',
+              help='Only parse a uniform random sample of this many rows of the CSV input, and print estimated counts with 95% confidence intervals')
+op.add_option('--sample-per-day', dest='sample_per_day', default=False,
               action='store_true',
-              help='Print a summary of crashes by builds')
-op.add_option('--print-frame-counts', dest='print_frame_counts', default=False,
+              help='With --sample, sample that many rows from each day of date_processed instead')
+op.add_option('--sample-seed', dest='sample_seed', default=None, type='int',
+              help='With --sample, seed for the random choice of rows, to make a run repeatable')
+op.add_option('--jobs', '-j', dest='jobs', default=1, type='int',
+              help='Number of processes to spread input over. A single large file or stdin is split into blocks')
+op.add_option('--rollup-dir', dest='rollup_dir', default=None,
+              help='Directory to save per-file aggregates in. Files that have not changed since a previous run with the same filters are not parsed again')
+op.add_option('--build-cache', dest='build_cache', default=False,
               action='store_true',
-              help='Print a count of symols seen in crashed stacks')
-op.add_option('--print-frame-position-counts', dest='print_frame_position_counts',
-              default=False, action='store_true',
-              help='Like --print-frame-counts but groups frames by stack position')
+              help='Write a columnar cache next to each specified file and exit. Later runs read the cache instead of the file')
+op.add_option('--export-sqlite', dest='export_sqlite', default=None,
+              help='Write matching crashes, and for dumps their crashed thread frames and modules, to this SQLite database instead of printing UUIDs. Files exported before are skipped unless they changed')
+op.add_option('--stats', dest='stats', default=False, action='store_true',
+              help='Print counters and time spent per stage to stderr when done')
+op.add_option('--stats-interval', dest='stats_interval', default=None,
+              type='float',
+              help='With --stats, also print progress to stderr every this many seconds')
+op.add_option('--stats-json', dest='stats_json', default=None,
+              help='Write counters and stage timings to this file as JSON')
 
 (options, args) = op.parse_args()
 
-read_files = len(args) > 0
-read_json = options.json_dir
-print_uuids = True
+try:
+    query = Query(options, collect_stats=options.stats or bool(options.stats_json))
+except QueryError, e:
+    op.error(str(e))
 
-collect_frames = False
-collect_builds = False
+if (options.dedupe or options.dedupe_duplicate_of) and \
+   (options.jobs > 1 or options.rollup_dir):
+    op.error('--dedupe options cannot be combined with --jobs or --rollup-dir')
 
-if options.print_versions:
-    print_uuids = False
+if options.follow:
+    if options.jobs > 1 or options.rollup_dir or options.dump_pack or \
+       options.ids_on_stdin:
+        op.error('--follow cannot be combined with --jobs, --rollup-dir, --dump-pack or --ids-on-stdin')
 
-if options.print_builds:
-    print_uuids = False
-    collect_builds = True
+    if len(args) > 1 or [a for a in args if a[-3:] == '.gz']:
+        op.error('--follow reads a single uncompressed file')
 
-if options.print_frame_counts or options.print_frame_position_counts:
-    print_uuids = False
-    collect_frames = True
+if options.export_sqlite:
+    if options.follow or options.jobs > 1 or options.rollup_dir:
+        op.error('--export-sqlite cannot be combined with --follow, --jobs or --rollup-dir')
 
-version_counts = {}
-build_counts = {}
-frame_counts = {} # key is tuple so we track different areas of occurence
-frame_symbol_counts = {} # key is symbol name
+    if options.dump_pack and options.ids_on_stdin:
+        op.error('--export-sqlite exports whole dump packs, not --ids-on-stdin')
 
-def handle_crash(crash):
-    # filter stage
-    relevant = True
+if options.sample is not None:
+    if options.sample < 1:
+        op.error('--sample needs a positive number of rows')
 
-    if options.signature is not None:
-        if not crash.has_signature(options.signature):
-            return
+    if options.json_dir or options.dump_pack:
+        op.error('--sample reads daily CSV files or stdin')
 
-    if options.filter_stack_symbol:
-        if not crash.has_symbol_in_crashed_stack(options.filter_stack_symbol):
-            return
+    if options.follow or options.jobs > 1 or options.rollup_dir or \
+       options.export_sqlite or options.approx or options.dedupe or \
+       options.dedupe_duplicate_of:
+        op.error('--sample cannot be combined with --follow, --jobs, --rollup-dir, --export-sqlite, --approx or --dedupe options')
 
-    # data collection
-    version = crash.version
-    if version not in version_counts:
-        version_counts[version] = 1
-    else:
-        version_counts[version] += 1
+if options.rollup_dir and (options.json_dir or options.dump_pack or not args):
+    op.error('--rollup-dir only applies to daily CSV files')
 
-    if collect_builds:
-        t = ( crash.version, crash.build_date )
+if options.cluster_stacks and not (options.json_dir or options.dump_pack):
+    op.error('--cluster-stacks requires --json-dir or --dump-pack')
 
-        if t not in build_counts:
-            build_counts[t] = 1
-        else:
-            build_counts[t] += 1
+if options.build_cache:
+    if options.jobs > 1:
+        counts = Pool(options.jobs).map(build_csv_cache, args)
+    else:
+        counts = map(build_csv_cache, args)
 
-    if collect_frames:
-        stack = crash.get_crashed_stack()
+    for filename, count in zip(args, counts):
+        if count is not None:
+            print >>stderr, 'Cached %d rows from %s' % ( count, filename )
 
-        if stack:
-            for frame in stack:
-                # TODO need better API for stacks/frames
-                key = (frame[1], frame[2], frame[3])
+    exit(0)
 
-                if key in frame_counts:
-                    frame_counts[key] += 1
-                else:
-                    frame_counts[key] = 1
+read_files = len(args) > 0
+read_json = options.json_dir
+read_pack = options.dump_pack
 
-                if frame[3] in frame_symbol_counts:
-                    frame_symbol_counts[frame[3]] += 1
-                else:
-                    frame_symbol_counts[frame[3]] = 1
+crash_filter = query.crash_filter
+aggregator = query.aggregator
+handle_crash = query.handle
 
-    # individual printing
-    if print_uuids:
-        print crash.uuid
+stats = aggregator.stats
+if stats is not None and options.stats:
+    stats.progress_interval = options.stats_interval
 
-parser = CrashDataParser()
+json_files = []
 if read_json:
-    def open_and_handle(filename):
-        with open(filename, 'rb') as fh:
-            try:
-                crash = CrashData(json=fh.read())
-                handle_crash(crash)
-            except:
-                print >>stderr, 'Error loading crash data: %s' % filename
-
     if options.ids_on_stdin:
         for line in stdin:
             id = line.strip()
@@ -173,77 +195,235 @@ if read_json:
                 print >>stderr, 'File not found: %s' % filename
                 continue
 
-            open_and_handle(filename)
+            json_files.append(filename)
     else:
         for p in listdir(read_json):
             if p[-5:] != '.json':
                 continue
 
-            filename = join(read_json, p)
-            open_and_handle(filename)
+            json_files.append(join(read_json, p))
 
-elif not read_files:
-    for row in parser.parse_handle(stdin):
-        handle_crash(row)
-else:
+store = None
+pack_ids = None
+if read_pack:
+    store = DumpStore(read_pack)
+
+    if options.ids_on_stdin:
+        pack_ids = []
+        for line in stdin:
+            id = line.strip()
+            if id not in store:
+                print >>stderr, 'Dump not found: %s' % id
+                continue
+
+            pack_ids.append(id)
+
+csv_files = []
+if read_files and not read_json and not read_pack:
     for filename in args:
         if not exists(filename):
             print >>stderr, 'Specified file does not exist: %s' % filename
             continue
 
-        # automagically perform gzip uncompression
-        if filename[-3:] == '.gz':
-            gz = gzip.open(filename, 'rb')
-            for row in parser.parse_handle(gz):
-                handle_crash(row)
+        csv_files.append(filename)
 
+def merge_results(results):
+    for result in results:
+        query.merge(result)
+
+        if stats is not None:
+            stats.progress()
+
+if options.follow:
+    windowed = WindowedCounts(options.window, options.bucket)
+    top = options.top or 20
+    next_snapshot = [time() + options.snapshot_interval]
+
+    def maybe_snapshot():
+        if time() >= next_snapshot[0]:
+            windowed.print_snapshot(top=top)
+            next_snapshot[0] = time() + options.snapshot_interval
+
+    def follow_crash(crash):
+        if query.deduper is not None and not query.deduper.accept(crash):
+            return
+
+        if not windowed.add(crash) and stats is not None:
+            stats.count('undated_crashes')
+
+        maybe_snapshot()
+
+    try:
+        if read_json:
+            items = follow_json_dir(read_json, options.poll_interval,
+                                    maybe_snapshot, horizon=options.window)
+            process_json_data(items, crash_filter, follow_crash, stats)
+        elif csv_files:
+            with open(csv_files[0], 'rb') as fh:
+                lines = follow_lines(fh, options.poll_interval, maybe_snapshot)
+                process_csv_handle(lines, crash_filter, follow_crash, stats)
         else:
-            for row in parser.parse_file(filename):
-                handle_crash(row)
+            process_csv_handle(follow_lines(stdin), crash_filter, follow_crash,
+                               stats)
+    except KeyboardInterrupt:
+        pass
+
+    windowed.print_snapshot(top=top)
+
+elif options.export_sqlite:
+    exporter = SQLiteExporter(options.export_sqlite)
+    query.exporter = exporter
+    query.print_uuids = False
 
-if options.print_versions:
-    keys = version_counts.keys()
-    keys.sort()
+    # Rows already exported under other options are not reused.
+    export_key = repr(crash_filter.key() + ('dedupe', options.dedupe,
+                                            options.dedupe_duplicate_of))
 
-    for k in keys:
-        print '%d\t%s' % ( version_counts[k], k )
+    def export(path, process, *args):
+        if path is not None and exporter.is_current(path, export_key):
+            exporter.sources_skipped += 1
+            return
+
+        exporter.begin_source(path, export_key)
+        process(*args)
+        exporter.end_source()
+
+    try:
+        if read_json:
+            for filename in json_files:
+                export(filename, process_json_files, [filename], crash_filter,
+                       handle_crash, stats)
+        elif read_pack:
+            export(read_pack, process_dump_store, store, crash_filter,
+                   handle_crash, None, stats)
+        elif not read_files:
+            export(None, process_csv_handle, stdin, crash_filter, handle_crash,
+                   stats)
+        else:
+            for filename in csv_files:
+                export(filename, process_csv_file, filename, crash_filter,
+                       handle_crash, stats)
+    finally:
+        exporter.close()
+
+    print >>stderr, 'Exported %d crashes from %d inputs to %s (%d unchanged inputs skipped)' % (
+        exporter.exported, exporter.sources_exported, options.export_sqlite,
+        exporter.sources_skipped )
+
+elif options.sample is not None:
+    # Rows are sampled from the raw text, so caches are not used.
+    sampler = CSVSampler(options.sample, per_day=options.sample_per_day,
+                         seed=options.sample_seed)
+
+    if stats is not None:
+        stats.push('sample')
+
+    try:
+        if not read_files:
+            sampler.add_lines(stdin)
+
+        for filename in csv_files:
+            with open_csv_file(filename) as fh:
+                sampler.add_lines(fh, filename)
+    except SampleError, e:
+        print >>stderr, e
+        exit(1)
+
+    if stats is not None:
+        stats.pop()
+        stats.count('rows_seen', sampler.seen())
+        stats.count('rows_sampled', sampler.sampled())
+
+    query.strata = []
+    for result in aggregate_sample(sampler, crash_filter, query.settings()):
+        query.strata.append(result)
+        query.merge(result[2])
+
+elif options.rollup_dir and csv_files:
+    settings = query.settings()
+
+    if not exists(options.rollup_dir):
+        makedirs(options.rollup_dir)
+
+    if options.jobs > 1:
+        pool = Pool(options.jobs)
+        merge_results(aggregate_csv_files_with_rollups(
+            csv_files, crash_filter, settings, options.rollup_dir, pool.imap))
+        pool.close()
+        pool.join()
+    else:
+        merge_results(aggregate_csv_files_with_rollups(
+            csv_files, crash_filter, settings, options.rollup_dir))
+
+elif options.jobs > 1:
+    # Each worker aggregates a share of the inputs. Results come back in
+    # input order and are merged into the parent's aggregator.
+    settings = query.settings()
 
-if options.print_builds:
-    versions = {}
-    for k, v in build_counts.iteritems():
-        version = k[0]
-        build = k[1]
-        if version not in versions:
-            versions[version] = {}
+    pool = Pool(options.jobs)
 
-        key = versions[version]
+    if read_json:
+        size = max(1, min(256, len(json_files) / (options.jobs * 4)))
+        tasks = [(json_files[i:i + size], crash_filter, settings)
+                 for i in range(0, len(json_files), size)]
+        merge_results(pool.imap(aggregate_json_files, tasks))
 
-        if build not in key:
-            key[build] = v
+    elif read_pack:
+        if pack_ids is None:
+            locations = store.locations()
         else:
-            key[build] += v
+            locations = [(id,) + store.index[id] for id in pack_ids]
 
-    version_keys = versions.keys()
-    version_keys.sort()
+        size = max(1, min(1024, len(locations) / (options.jobs * 4)))
+        tasks = [(read_pack, locations[i:i + size], crash_filter, settings)
+                 for i in range(0, len(locations), size)]
+        merge_results(pool.imap(aggregate_dump_store, tasks))
 
-    for version in version_keys:
-        d = versions[version]
+    elif len(csv_files) >= options.jobs:
+        tasks = [(filename, crash_filter, settings) for filename in csv_files]
+        merge_results(pool.imap(aggregate_csv_file, tasks))
 
-        dates = d.keys()
-        dates.sort()
+    else:
+        # Too few inputs to keep every process busy with whole files, so cut
+        # each stream into blocks instead.
+        parser = CrashDataParser()
+        extra = (crash_filter, settings)
+        depth = options.jobs * 2
+
+        if not read_files:
+            merge_results(parser.map_blocks(stdin, pool, aggregate_csv_block,
+                                            extra, depth=depth))
+
+        for filename in csv_files:
+            # Cached files are cheap enough to read whole.
+            cache = open_cache(filename)
+            if cache is not None:
+                cache.close()
+                task = (filename, crash_filter, settings)
+                merge_results([aggregate_csv_file(task)])
+                continue
+
+            with open_csv_file(filename) as fh:
+                merge_results(parser.map_blocks(fh, pool, aggregate_csv_block,
+                                                extra, depth=depth))
 
-        total = 0
+    pool.close()
+    pool.join()
 
-        for date in dates:
-            print '%s\t%s\t%s' % ( version.ljust(12), str(date).ljust(20), str(d[date]).rjust(7) )
-            total += d[date]
+elif read_json:
+    process_json_files(json_files, crash_filter, handle_crash, stats)
+elif read_pack:
+    process_dump_store(store, crash_filter, handle_crash, pack_ids, stats)
+elif not read_files:
+    process_csv_handle(stdin, crash_filter, handle_crash, stats)
+else:
+    for filename in csv_files:
+        process_csv_file(filename, crash_filter, handle_crash, stats)
 
-        print '%s\t%s\t%s' % ( version.ljust(12), 'Total'.ljust(20), str(total).rjust(7) )
+query.print_reports()
 
-if options.print_frame_counts:
-    for k, v in frame_symbol_counts.iteritems():
-        print '%d\t%s' % ( v, k )
+if options.stats:
+    stats.print_summary()
 
-if options.print_frame_position_counts:
-    for k, v in frame_counts.iteritems():
-        print '%d\t%d\t%s' % ( v, k[0], k[2] )
+if options.stats_json:
+    stats.write_json(options.stats_json)
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+# This script sends a query to a running serve_crashdata.py and prints the
+# result exactly as parse_crashdata.py would have, exiting with the same
+# status.
+#
+# The first argument is the server's Unix socket path or HOST:PORT. The
+# rest are parse_crashdata.py filter and report options, e.g.
+#
+#   ./query_crashdata.py /tmp/crashdata.sock -s js_ --print-versions
+
+from socket import error as socket_error
+from sys import argv, exit, stderr, stdout
+from socorro.server import send_query
+
+if len(argv) < 2 or argv[1] in ('-h', '--help'):
+    print >>stderr, 'Usage: ./query_crashdata.py (SOCKET | HOST:PORT) [parse_crashdata.py options]'
+    exit(2)
+
+try:
+    status, out, err = send_query(argv[1], argv[2:])
+except (socket_error, IOError), e:
+    print >>stderr, 'Error querying %s: %s' % (argv[1], e)
+    exit(1)
+
+stdout.write(out)
+stderr.write(err)
+exit(status)
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+# This script loads crash data once and answers parse_crashdata.py queries
+# against it until interrupted. Queries are sent with query_crashdata.py.
+#
+# Daily CSV files are given as arguments. Files without a current cache are
+# cached into a temporary directory (or --cache-dir) when the server starts.
+# Alternatively, dumps are loaded from --json-dir or --dump-pack.
+
+from optparse import OptionParser
+from os import makedirs, unlink
+from os.path import exists
+from shutil import rmtree
+from signal import SIGTERM, signal
+from socket import error as socket_error
+from sys import exit, stderr
+from tempfile import mkdtemp
+from socorro.server import ResidentCrashes, TCPQueryServer, UnixQueryServer
+
+op = OptionParser(usage='./serve_crashdata.py (--socket PATH | --port PORT) [options] [daily CSV files]')
+op.add_option('--socket', dest='socket', default=None,
+              help='Unix socket to listen on')
+op.add_option('--port', dest='port', default=None, type='int',
+              help='TCP port to listen on, on 127.0.0.1 only')
+op.add_option('--json-dir', dest='json_dir', default=None,
+              help='Directory containing .json files for raw crash dumps to load')
+op.add_option('--dump-pack', dest='dump_pack', default=None,
+              help='Pack file of raw crash dumps to load, as written by download_dumps.py --pack')
+op.add_option('--cache-dir', dest='cache_dir', default=None,
+              help='Directory to build caches in for CSV files that have none. Defaults to a temporary directory removed on exit')
+
+(options, args) = op.parse_args()
+
+if bool(options.socket) == (options.port is not None):
+    op.error('Exactly one of --socket and --port is required')
+
+if not (args or options.json_dir or options.dump_pack):
+    op.error('No crash data to load')
+
+def terminate(signum, frame):
+    raise KeyboardInterrupt()
+
+# Shut down cleanly when killed, not just on Ctrl-C.
+signal(SIGTERM, terminate)
+
+cache_dir = options.cache_dir
+temporary = cache_dir is None and bool(args)
+if temporary:
+    cache_dir = mkdtemp(prefix='crashdata-')
+elif cache_dir and not exists(cache_dir):
+    makedirs(cache_dir)
+
+server = None
+try:
+    crashes = ResidentCrashes(args, options.json_dir, options.dump_pack,
+                              cache_dir)
+
+    try:
+        if options.socket:
+            server = UnixQueryServer(options.socket, crashes)
+            address = options.socket
+        else:
+            server = TCPQueryServer(options.port, crashes)
+            address = '127.0.0.1:%d' % options.port
+    except socket_error, e:
+        print >>stderr, 'Unable to listen: %s' % e
+        exit(1)
+
+    print >>stderr, 'Loaded %d crashes. Listening on %s' % (len(crashes), address)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        crashes.close()
+finally:
+    if server is not None and options.socket and exists(options.socket):
+        unlink(options.socket)
+
+    if temporary:
+        rmtree(cache_dir, ignore_errors=True)
@@ -0,0 +1,787 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+# This file contains the filtering and aggregation logic used by
+# parse_crashdata.py. Aggregates are kept in plain dicts on CrashAggregator
+# instances so partial results from separate processes can be merged.
+
+import cPickle
+import gzip
+import hashlib
+import heapq
+import os
+
+from os.path import abspath, exists, join
+from sys import stderr, stdout
+
+from socorro.cache import CacheError, build_cache, open_cache
+from socorro.cache import build_signature_index, index_path_for
+from socorro.cache import open_signature_index
+from socorro.cluster import StackClusterer
+from socorro.crashdata import CrashDataParser, CrashData, memo_counts
+from socorro.dumpstore import read_dumps
+from socorro.expression import And, Comparison, parse_expression
+from socorro.groupby import GroupCounter
+from socorro.sketch import SpaceSaving
+from socorro.stats import Stats
+
+# Strings made only of these characters are never escaped by JSON encoders,
+# so they appear verbatim in the raw JSON text of a matching crash.
+JSON_LITERAL_CHARS = set(chr(c) for c in range(32, 127)) - set('"\\/')
+
+class CrashFilter(object):
+    '''Decides whether a crash is relevant.
+
+    where is an optional filter expression (see socorro.expression). It is
+    combined with the signature and stack symbol filters and all tests run
+    cheapest first.
+    '''
+
+    def __init__(self, signature=None, stack_symbol=None, where=None):
+        self.signature = signature
+        self.stack_symbol = stack_symbol
+        self.where = where
+
+        self._compile()
+
+    def __getstate__(self):
+        # Compiled tests are closures, which can't be pickled for pool
+        # workers. Workers compile their own.
+        return {'signature': self.signature,
+                'stack_symbol': self.stack_symbol,
+                'where': self.where}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+    def _compile(self):
+        nodes = []
+        names = {}
+
+        if self.where:
+            nodes.extend(parse_expression(self.where).conjuncts())
+
+        if self.signature is not None:
+            node = Comparison('signature', '~', self.signature)
+            names[node] = 'signature'
+            nodes.append(node)
+
+        if self.stack_symbol:
+            node = Comparison('stack', '~', self.stack_symbol)
+            names[node] = 'stack_symbol'
+            nodes.append(node)
+
+        if nodes:
+            nodes = And(nodes).conjuncts()
+
+        self._conjuncts = nodes
+        self._tests = [(names.get(node, node.text), node.compile())
+                       for node in nodes]
+
+    def key(self):
+        '''Returns a tuple identifying what this filter matches.'''
+        return ('signature', self.signature, 'stack_symbol', self.stack_symbol,
+                'where', self.where)
+
+    def matches(self, crash):
+        for name, test in self._tests:
+            if not test(crash):
+                return False
+
+        return True
+
+    def rejected_by(self, crash):
+        '''Returns the name of the first test a crash fails or None if it
+        passes them all.'''
+        for name, test in self._tests:
+            if not test(crash):
+                return name
+
+        return None
+
+    def index_signature(self):
+        '''Returns a string the signature must contain for a match or None.
+
+        Used to look up candidate rows in a signature index.
+        '''
+        for node in self._conjuncts:
+            if isinstance(node, Comparison) and node.field == 'signature' \
+               and node.op == '~':
+                return node.value
+
+        return None
+
+    def csv_prefilters(self):
+        '''Returns prefilters for CrashDataParser.
+
+        These are cheap substring tests on raw CSV lines. They are only
+        necessary conditions; matches() still performs the real filtering.
+        '''
+        prefilters = {}
+        for node in self._conjuncts:
+            needle = node.needle()
+            if not needle:
+                continue
+
+            for column in node.columns():
+                prefilters.setdefault(column, needle)
+
+        return prefilters
+
+    def json_prefilters(self):
+        '''Returns strings that must appear in the raw JSON of a match.'''
+        needles = [node.needle() for node in self._conjuncts]
+        return [s for s in needles if s and set(s) <= JSON_LITERAL_CHARS]
+
+def _top_items(counts, n):
+    '''Returns the n (key, count) items of a dict with the largest counts.'''
+    return heapq.nsmallest(n, counts.iteritems(),
+                           key=lambda item: (-item[1], item[0]))
+
+class CrashAggregator(object):
+    '''Accumulates counts over a set of crashes.
+
+    If approx_capacity is set, frame and signature counts are kept in
+    SpaceSaving summaries of that many keys instead of dicts. Memory then
+    stays bounded however many distinct frames and signatures there are, at
+    the price of approximate counts for all but the most frequent keys.
+
+    If cluster_threshold is set, crashed stacks are collected for
+    clustering with a StackClusterer (see socorro.cluster).
+
+    If group_by is a tuple of field names, crashes are counted by their
+    combined values with a GroupCounter (see socorro.groupby).
+    '''
+
+    def __init__(self, collect_builds=False, collect_frames=False,
+                 collect_uuids=False, collect_stats=False,
+                 collect_signatures=False, approx_capacity=None,
+                 cluster_threshold=None, cluster_depth=10, group_by=None):
+        self.collect_builds = collect_builds
+        self.collect_frames = collect_frames
+        self.collect_uuids = collect_uuids
+        self.collect_stats = collect_stats
+        self.collect_signatures = collect_signatures
+        self.approx_capacity = approx_capacity
+        self.cluster_threshold = cluster_threshold
+        self.cluster_depth = cluster_depth
+        self.group_by = group_by
+
+        # Pool workers fill this in and it travels back with the counts.
+        self.stats = Stats() if collect_stats else None
+
+        self.version_counts = {}
+        self.build_counts = {}
+
+        if approx_capacity:
+            self.frame_counts = SpaceSaving(approx_capacity)
+            self.frame_symbol_counts = SpaceSaving(approx_capacity)
+            self.signature_counts = SpaceSaving(approx_capacity)
+        else:
+            self.frame_counts = {} # key is tuple so we track different areas of occurence
+            self.frame_symbol_counts = {} # key is symbol name
+            self.signature_counts = {}
+
+        self.clusterer = None
+        if cluster_threshold is not None:
+            self.clusterer = StackClusterer(cluster_threshold, cluster_depth)
+
+        self.groups = None
+        if group_by:
+            self.groups = GroupCounter(group_by)
+
+        self.uuids = []
+
+    def settings(self):
+        '''Returns the arguments needed to construct an empty aggregator
+        collecting the same things.'''
+        return {
+            'collect_builds': self.collect_builds,
+            'collect_frames': self.collect_frames,
+            'collect_uuids': self.collect_uuids,
+            'collect_stats': self.collect_stats,
+            'collect_signatures': self.collect_signatures,
+            'approx_capacity': self.approx_capacity,
+            'cluster_threshold': self.cluster_threshold,
+            'cluster_depth': self.cluster_depth,
+            'group_by': self.group_by,
+        }
+
+    def add(self, crash):
+        version_counts = self.version_counts
+
+        version = crash.version
+        if version not in version_counts:
+            version_counts[version] = 1
+        else:
+            version_counts[version] += 1
+
+        if self.collect_builds:
+            t = ( crash.version, crash.build_date )
+
+            if t not in self.build_counts:
+                self.build_counts[t] = 1
+            else:
+                self.build_counts[t] += 1
+
+        if self.collect_signatures:
+            signature = ' | '.join(crash.signature)
+
+            if self.approx_capacity:
+                self.signature_counts.add(signature)
+            elif signature in self.signature_counts:
+                self.signature_counts[signature] += 1
+            else:
+                self.signature_counts[signature] = 1
+
+        if self.collect_frames:
+            stack = crash.get_crashed_stack()
+
+            if stack and self.approx_capacity:
+                for frame in stack:
+                    self.frame_counts.add(frame.key)
+                    self.frame_symbol_counts.add(frame.symbol)
+
+            elif stack:
+                frame_counts = self.frame_counts
+                frame_symbol_counts = self.frame_symbol_counts
+
+                for frame in stack:
+                    key = frame.key
+
+                    if key in frame_counts:
+                        frame_counts[key] += 1
+                    else:
+                        frame_counts[key] = 1
+
+                    symbol = frame.symbol
+                    if symbol in frame_symbol_counts:
+                        frame_symbol_counts[symbol] += 1
+                    else:
+                        frame_symbol_counts[symbol] = 1
+
+        if self.clusterer is not None:
+            stack = crash.get_crashed_stack()
+
+            if stack:
+                self.clusterer.add(crash.uuid,
+                                   [frame.symbol for frame in stack])
+
+        if self.groups is not None:
+            self.groups.add(crash)
+
+        if self.collect_uuids:
+            self.uuids.append(crash.uuid)
+
+    def merge(self, other):
+        '''Add the counts from another aggregator to this one.'''
+        for ours, theirs in ((self.version_counts, other.version_counts),
+                             (self.build_counts, other.build_counts),
+                             (self.frame_counts, other.frame_counts),
+                             (self.frame_symbol_counts, other.frame_symbol_counts),
+                             (self.signature_counts, other.signature_counts)):
+            if isinstance(ours, SpaceSaving):
+                ours.merge(theirs)
+                continue
+
+            for k, v in theirs.iteritems():
+                if k in ours:
+                    ours[k] += v
+                else:
+                    ours[k] = v
+
+        if self.clusterer is not None:
+            self.clusterer.merge(other.clusterer)
+
+        if self.groups is not None:
+            self.groups.merge(other.groups)
+
+        if self.collect_uuids:
+            self.uuids.extend(other.uuids)
+
+        if self.stats is not None and other.stats is not None:
+            self.stats.merge(other.stats)
+
+    def print_versions(self, fh=stdout):
+        keys = self.version_counts.keys()
+        keys.sort()
+
+        for k in keys:
+            print >>fh, '%d\t%s' % ( self.version_counts[k], k )
+
+    def print_builds(self, fh=stdout):
+        versions = {}
+        for k, v in self.build_counts.iteritems():
+            version = k[0]
+            build = k[1]
+            if version not in versions:
+                versions[version] = {}
+
+            key = versions[version]
+
+            if build not in key:
+                key[build] = v
+            else:
+                key[build] += v
+
+        version_keys = versions.keys()
+        version_keys.sort()
+
+        for version in version_keys:
+            d = versions[version]
+
+            dates = d.keys()
+            dates.sort()
+
+            total = 0
+
+            for date in dates:
+                print >>fh, '%s\t%s\t%s' % ( version.ljust(12), str(date).ljust(20), str(d[date]).rjust(7) )
+                total += d[date]
+
+            print >>fh, '%s\t%s\t%s' % ( version.ljust(12), 'Total'.ljust(20), str(total).rjust(7) )
+
+    # The print methods below take an optional top argument, which limits
+    # output to that many keys, most frequent first. Approximate counts are
+    # followed by their maximum overcount.
+
+    def print_frame_counts(self, fh=stdout, top=None):
+        counts = self.frame_symbol_counts
+
+        if self.approx_capacity:
+            for k, v, error in counts.top(top or len(counts)):
+                print >>fh, '%d\t%d\t%s' % ( v, error, k )
+            return
+
+        items = counts.iteritems() if top is None else _top_items(counts, top)
+        for k, v in items:
+            print >>fh, '%d\t%s' % ( v, k )
+
+    def print_frame_position_counts(self, fh=stdout, top=None):
+        counts = self.frame_counts
+
+        if self.approx_capacity:
+            for k, v, error in counts.top(top or len(counts)):
+                print >>fh, '%d\t%d\t%d\t%s' % ( v, error, k[0], k[2] )
+            return
+
+        items = counts.iteritems() if top is None else _top_items(counts, top)
+        for k, v in items:
+            print >>fh, '%d\t%d\t%s' % ( v, k[0], k[2] )
+
+    def print_signatures(self, fh=stdout, top=None):
+        counts = self.signature_counts
+
+        if self.approx_capacity:
+            for k, v, error in counts.top(top or len(counts)):
+                print >>fh, '%d\t%d\t%s' % ( v, error, k )
+            return
+
+        for k, v in _top_items(counts, top or len(counts)):
+            print >>fh, '%d\t%s' % ( v, k )
+
+    def print_stack_clusters(self, fh=stdout, min_size=2):
+        '''Print clusters of crashes with similar crashed stacks.
+
+        Each cluster is a line with its size and representative stack,
+        followed by one indented line per crash UUID.
+        '''
+        for uuids, stack in self.clusterer.clusters(min_size):
+            print >>fh, '%d\t%s' % ( len(uuids), ' | '.join(stack) )
+
+            for uuid in uuids:
+                print >>fh, '\t%s' % uuid
+
+    def print_groups(self, fh=stdout, top=None):
+        '''Print crash counts for each combination of the group_by fields,
+        one tab separated line per combination with the count first.'''
+        self.groups.print_counts(fh, top)
+
+    def approx_error_bounds(self):
+        '''Returns (report name, max error) for each approximate report.'''
+        if not self.approx_capacity:
+            return []
+
+        bounds = []
+        if self.collect_signatures:
+            bounds.append(('signature', self.signature_counts.max_error()))
+
+        if self.collect_frames:
+            bounds.append(('frame', self.frame_symbol_counts.max_error()))
+            bounds.append(('frame position', self.frame_counts.max_error()))
+
+        return bounds
+
+def open_csv_file(filename):
+    '''Open a daily CSV file, uncompressing .gz files automatically.'''
+    if filename[-3:] == '.gz':
+        return gzip.open(filename, 'rb')
+
+    return open(filename, 'rb')
+
+def _count_memo_use(stats, before):
+    '''Count the field conversion memo hits and misses since a
+    memo_counts() snapshot.'''
+    for name, (hits, misses) in memo_counts().iteritems():
+        old_hits, old_misses = before.get(name, (0, 0))
+        if hits > old_hits:
+            stats.count('memo_hits.%s' % name, hits - old_hits)
+        if misses > old_misses:
+            stats.count('memo_misses.%s' % name, misses - old_misses)
+
+def process_crashes(crashes, crash_filter, handle, stats=None,
+                    count_memos=True):
+    '''Calls handle for every crash that passes a filter.
+
+    If stats is given, crashes read and matched and the crashes each test
+    rejected are counted, and the construct, filter and aggregate stages are
+    timed. Field conversion memo use is counted too, unless count_memos is
+    False because the caller counts it.
+    '''
+    if stats is None:
+        for crash in crashes:
+            if crash_filter.matches(crash):
+                handle(crash)
+
+        return
+
+    before = memo_counts() if count_memos else None
+
+    counts = stats.counts
+    push = stats.push
+    pop = stats.pop
+
+    for crash in stats.timed(crashes, 'construct'):
+        stats.count('crashes_read')
+
+        push('filter')
+        rejected = crash_filter.rejected_by(crash)
+        pop()
+
+        if rejected is not None:
+            stats.count('filtered_out.%s' % rejected)
+        else:
+            counts['crashes_matched'] = counts.get('crashes_matched', 0) + 1
+            push('aggregate')
+            handle(crash)
+            pop()
+
+        stats.progress()
+
+    if before is not None:
+        _count_memo_use(stats, before)
+
+def process_csv_handle(fh, crash_filter, handle, stats=None):
+    '''Calls handle for every crash in a CSV stream that passes a filter.'''
+    # Fields are only converted when a filter or output stage needs them.
+    parser = CrashDataParser(lazy=True, prefilters=crash_filter.csv_prefilters(),
+                             stats=stats)
+
+    process_crashes(parser.parse_handle(fh), crash_filter, handle, stats)
+
+def process_cache(cache, crash_filter, handle, stats=None, index=None,
+                  crashes=None):
+    '''Calls handle for every crash in an open CrashDataCache that passes a
+    filter.
+
+    index is the cache's SignatureIndex, if it has one. It is used to skip
+    rows when the filter constrains the signature.
+
+    crashes is a list of crashes the cache produced for all of its rows
+    earlier. If given, they are reused instead of producing new ones.
+    '''
+    needle = crash_filter.index_signature()
+
+    if index is not None and needle is not None:
+        rows = index.rows_matching(needle)
+        if crashes is None:
+            crashes = cache.crashes(rows)
+        else:
+            crashes = [crashes[i] for i in rows]
+
+        if stats is not None:
+            stats.count('rows_skipped_by_index', cache.rows - len(rows))
+    elif crashes is None:
+        crashes = cache.crashes()
+
+    if stats is not None:
+        stats.count('cached_files')
+
+    process_crashes(crashes, crash_filter, handle, stats)
+
+def process_csv_file(filename, crash_filter, handle, stats=None):
+    '''Calls handle for every crash in a daily CSV file that passes a filter.
+
+    If the file has a current cache (see socorro.cache), crashes are read
+    from the cache instead.
+    '''
+    cache = open_cache(filename)
+    if cache is not None:
+        index = None
+        if crash_filter.index_signature() is not None:
+            index = open_signature_index(filename, cache)
+
+        try:
+            process_cache(cache, crash_filter, handle, stats, index)
+        finally:
+            if index is not None:
+                index.close()
+
+            cache.close()
+
+        return
+
+    if stats is not None and filename[-3:] == '.gz':
+        stats.count('bytes_compressed', os.path.getsize(filename))
+
+    with open_csv_file(filename) as fh:
+        process_csv_handle(fh, crash_filter, handle, stats)
+
+def process_json_data(items, crash_filter, handle, stats=None):
+    '''Calls handle for every crash that passes a filter.
+
+    items yields (name, JSON text) tuples. Crashes that fail to load or
+    handle are reported on stderr by name and skipped.
+    '''
+    prefilters = crash_filter.json_prefilters()
+
+    if stats is not None:
+        items = stats.timed(items, 'read')
+        depth = stats.depth()
+        before = memo_counts()
+
+    for name, data in items:
+        try:
+            if [s for s in prefilters if s not in data]:
+                if stats is not None:
+                    stats.count('rows_prefiltered_out')
+                continue
+
+            if stats is None:
+                crash = CrashData(json=data, lazy=True)
+                if crash_filter.matches(crash):
+                    handle(crash)
+            else:
+                stats.count('bytes_read', len(data))
+                stats.push('construct')
+                crash = CrashData(json=data, lazy=True)
+                stats.pop()
+                process_crashes((crash,), crash_filter, handle, stats,
+                                count_memos=False)
+        except:
+            if stats is not None:
+                stats.unwind(depth)
+                stats.count('errors')
+            print >>stderr, 'Error loading crash data: %s' % name
+
+    if stats is not None:
+        _count_memo_use(stats, before)
+
+def _read_files(filenames):
+    for filename in filenames:
+        with open(filename, 'rb') as fh:
+            yield filename, fh.read()
+
+def process_json_files(filenames, crash_filter, handle, stats=None):
+    '''Calls handle for every crash in a list of .json files that passes a
+    filter.'''
+    process_json_data(_read_files(filenames), crash_filter, handle, stats)
+
+def process_dump_store(store, crash_filter, handle, ids=None, stats=None):
+    '''Calls handle for every crash in a DumpStore that passes a filter.
+
+    If ids is given, only those dumps are read. Otherwise the whole store is
+    read sequentially.
+    '''
+    if ids is None:
+        items = iter(store)
+    else:
+        items = ((id, store.get(id)) for id in ids)
+
+    process_json_data(items, crash_filter, handle, stats)
+
+def aggregate_csv_file(args):
+    '''Process pool entry point. Aggregates a single CSV file.
+
+    args is a tuple of (filename, CrashFilter, aggregator settings).
+    '''
+    filename, crash_filter, settings = args
+
+    aggregator = CrashAggregator(**settings)
+    process_csv_file(filename, crash_filter, aggregator.add, aggregator.stats)
+
+    return aggregator
+
+def build_csv_cache(filename):
+    '''Process pool entry point. Builds the cache for a CSV file.
+
+    The signature index is built along with the cache. Returns the number
+    of rows cached or None if the cache could not be built.
+    '''
+    with open_csv_file(filename) as fh:
+        try:
+            rows = build_cache(fh, filename)
+        except CacheError, e:
+            print >>stderr, 'Could not build cache: %s' % e
+            return None
+
+    cache = open_cache(filename)
+    try:
+        build_signature_index(cache, index_path_for(filename))
+    finally:
+        cache.close()
+
+    return rows
+
+def aggregate_csv_block(args):
+    '''Process pool entry point. Aggregates a block of a CSV stream.
+
+    args is a tuple of (header, block, CrashFilter, aggregator settings), as
+    passed by CrashDataParser.map_blocks().
+    '''
+    header, block, crash_filter, settings = args
+
+    aggregator = CrashAggregator(**settings)
+    parser = CrashDataParser(lazy=True, prefilters=crash_filter.csv_prefilters(),
+                             stats=aggregator.stats)
+
+    process_crashes(parser.parse_block(header, block), crash_filter,
+                    aggregator.add, aggregator.stats)
+
+    return aggregator
+
+def aggregate_json_files(args):
+    '''Process pool entry point. Aggregates a batch of .json files.
+
+    args is a tuple of (filenames, CrashFilter, aggregator settings).
+    '''
+    filenames, crash_filter, settings = args
+
+    aggregator = CrashAggregator(**settings)
+    process_json_files(filenames, crash_filter, aggregator.add,
+                       aggregator.stats)
+
+    return aggregator
+
+def aggregate_dump_store(args):
+    '''Process pool entry point. Aggregates a batch of dumps from a pack.
+
+    args is a tuple of (pack path, list of DumpStore locations, CrashFilter,
+    aggregator settings).
+    '''
+    path, locations, crash_filter, settings = args
+
+    aggregator = CrashAggregator(**settings)
+    process_json_data(read_dumps(path, locations), crash_filter,
+                      aggregator.add, aggregator.stats)
+
+    return aggregator
+
+# Bump when CrashAggregator's contents change so stale rollups are ignored.
+ROLLUP_VERSION = 6
+
+def rollup_key(filename, crash_filter, settings):
+    '''Returns the key a file's rollup is stored under.
+
+    The key covers the file's path, size and modification time, the filter
+    and what the aggregator collects. A rollup is only reused if all of them
+    match. The modification time is kept at full precision, so a file
+    rewritten within the same second isn't mistaken for the old one.
+    '''
+    # Stats don't change the counts, so they don't invalidate a rollup.
+    settings = dict(settings)
+    settings.pop('collect_stats', None)
+
+    st = os.stat(filename)
+    parts = (ROLLUP_VERSION, abspath(filename), st.st_size, repr(st.st_mtime),
+             crash_filter.key(), sorted(settings.items()))
+
+    return hashlib.sha1(repr(parts)).hexdigest()
+
+def load_rollup(directory, key):
+    '''Returns the CrashAggregator saved under a key or None.'''
+    path = join(directory, '%s.rollup' % key)
+    if not exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as fh:
+            return cPickle.load(fh)
+    except Exception:
+        return None
+
+def save_rollup(directory, key, aggregator):
+    '''Save a file's CrashAggregator so later runs can reuse it.'''
+    path = join(directory, '%s.rollup' % key)
+    tmp_path = path + '.tmp'
+
+    # Stats describe the run that computed the rollup, not the data.
+    stats = aggregator.stats
+    aggregator.stats = None
+    try:
+        with open(tmp_path, 'wb') as fh:
+            cPickle.dump(aggregator, fh, cPickle.HIGHEST_PROTOCOL)
+    finally:
+        aggregator.stats = stats
+
+    os.rename(tmp_path, path)
+
+def aggregate_csv_files_with_rollups(filenames, crash_filter, settings,
+                                     directory, map=map):
+    '''Yields a CrashAggregator for each CSV file, in order.
+
+    Files with a saved rollup are not parsed. The others are aggregated with
+    map (which may be a process pool's imap) and their rollups saved.
+    '''
+    keys = [rollup_key(f, crash_filter, settings) for f in filenames]
+    rollups = [load_rollup(directory, key) for key in keys]
+
+    tasks = [(f, crash_filter, settings)
+             for f, rollup in zip(filenames, rollups) if rollup is None]
+    computed = iter(map(aggregate_csv_file, tasks))
+
+    for key, rollup in zip(keys, rollups):
+        if rollup is None:
+            rollup = computed.next()
+            save_rollup(directory, key, rollup)
+        elif settings.get('collect_stats'):
+            rollup.stats = Stats()
+            rollup.stats.count('rollups_reused')
+
+        yield rollup
@@ -0,0 +1,733 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+# This file contains a binary columnar cache for daily crash CSV files.
+#
+# Parsing a daily CSV means gunzip, CSV splitting and strptime for every row,
+# every time. A cache holds the same rows column by column: dates and
+# integers as fixed width arrays, low cardinality strings as dictionary codes
+# and everything else as a string blob with offsets. Caches are memory mapped
+# and a column is only read when a crash field backed by it is accessed.
+#
+# File format:
+#
+#   SOCORRO-CACHE <version>\n
+#   <JSON metadata>\n
+#   <column data>
+#
+# Offsets in the metadata are relative to the start of the column data.
+#
+# A cache may be accompanied by a signature index, which uses the same layout
+# with a different magic. It maps trigrams to the distinct signatures
+# containing them, and each distinct signature to the rows having it. A
+# substring query then costs about the size of its answer.
+
+import calendar
+import csv
+import json
+import mmap
+import os
+import sys
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from tempfile import TemporaryFile
+
+from socorro.crashdata import CrashData, FieldDecoder, FIELDS, SHARED_SLOTS
+
+MAGIC = 'SOCORRO-CACHE'
+INDEX_MAGIC = 'SOCORRO-SIGINDEX'
+VERSION = 1
+
+# Columns that are dictionary encoded. All other string columns are stored as
+# a blob with offsets.
+DICT_COLUMNS = set([
+    'addons_checked',
+    'app_notes',
+    'branch',
+    'build',
+    'cpu_info',
+    'cpu_name',
+    'distributor',
+    'distributor_version',
+    'duplicate_of',
+    'flash_version',
+    'os_name',
+    'os_version',
+    'process_type',
+    'processType',
+    'product',
+    'reason',
+    'release_channel',
+    'ReleaseChannel',
+    'signature',
+    'topmost_filenames',
+    'version',
+])
+
+# Array type codes. Sizes are recorded in the metadata and checked on open.
+INT_TYPE = 'i'
+OFFSET_TYPE = 'l'
+
+class CacheError(Exception):
+    '''Raised when a cache cannot be built.'''
+
+def cache_path_for(path):
+    '''Returns the cache filename for a daily CSV file.'''
+    return path + '.cache'
+
+def index_path_for(path):
+    '''Returns the signature index filename for a daily CSV file.'''
+    return path + '.sigindex'
+
+def _source_info(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime': st.st_mtime}
+
+class _StrBuilder(object):
+    def __init__(self):
+        self.blob = TemporaryFile()
+        self.offsets = array(OFFSET_TYPE, [0])
+        self.length = 0
+
+    def append(self, v):
+        self.blob.write(v)
+        self.length += len(v)
+        self.offsets.append(self.length)
+
+    def write(self, fh):
+        meta = {'kind': 'str', 'count': len(self.offsets) - 1}
+        meta['offsets'] = _write_array(fh, self.offsets)
+
+        self.blob.seek(0)
+        meta['blob'] = {'offset': fh.tell(), 'length': self.length}
+        while True:
+            chunk = self.blob.read(1024 * 1024)
+            if not chunk:
+                break
+
+            fh.write(chunk)
+
+        self.blob.close()
+        return meta
+
+class _DictBuilder(object):
+    def __init__(self):
+        self.codes = array(INT_TYPE)
+        self.lookup = {}
+        self.values = []
+
+    def append(self, v):
+        code = self.lookup.get(v, None)
+        if code is None:
+            code = len(self.values)
+            self.lookup[v] = code
+            self.values.append(v)
+
+        self.codes.append(code)
+
+    def write(self, fh):
+        values = _StrBuilder()
+        for v in self.values:
+            values.append(v)
+
+        meta = {'kind': 'dict'}
+        meta['codes'] = _write_array(fh, self.codes)
+        meta['values'] = values.write(fh)
+        return meta
+
+class _TypedBuilder(object):
+    '''Stores converted values if every value converts. Otherwise the
+    column is stored dictionary encoded.'''
+
+    def __init__(self, kind, converter):
+        self.kind = kind
+        self.converter = converter
+        self.values = array(INT_TYPE)
+        self.fallback = _DictBuilder()
+        self.typed = True
+
+    def append(self, v):
+        self.fallback.append(v)
+
+        if self.typed:
+            try:
+                self.values.append(self.converter(v))
+            except (ValueError, OverflowError, TypeError):
+                self.typed = False
+                self.values = None
+
+    def write(self, fh):
+        if not self.typed:
+            return self.fallback.write(fh)
+
+        return {'kind': self.kind, 'values': _write_array(fh, self.values)}
+
+def _epoch_seconds(v):
+    return calendar.timegm(datetime.strptime(v, '%Y%m%d%H%M').timetuple())
+
+def _write_array(fh, a):
+    meta = {
+        'offset': fh.tell(),
+        'length': len(a) * a.itemsize,
+        'typecode': a.typecode,
+        'itemsize': a.itemsize,
+    }
+    a.tofile(fh)
+    return meta
+
+def build_cache(fh, path, cache_path=None):
+    '''Build the cache for a daily CSV file.
+
+    fh is an open handle to the (uncompressed) contents of the file at path.
+    The cache is written to a temporary file and renamed into place, so a
+    partially written cache is never picked up. Returns the number of rows
+    cached.
+    '''
+    if cache_path is None:
+        cache_path = cache_path_for(path)
+
+    source = _source_info(path)
+
+    reader = csv.reader(fh, delimiter='\t')
+    try:
+        header = reader.next()
+    except StopIteration:
+        header = []
+
+    builders = []
+    for k in header:
+        converter = FIELDS.get(k, (None, None))[1]
+        if converter is True:
+            builders.append(_TypedBuilder('date', _epoch_seconds))
+        elif converter is int:
+            builders.append(_TypedBuilder('int', int))
+        elif k in DICT_COLUMNS:
+            builders.append(_DictBuilder())
+        else:
+            builders.append(_StrBuilder())
+
+    width = len(header)
+    rows = 0
+    for row in reader:
+        if not row:
+            continue
+
+        if len(row) != width:
+            raise CacheError('Malformed row %d in %s' % ( reader.line_num, path ))
+
+        for builder, v in zip(builders, row):
+            builder.append(v)
+
+        rows += 1
+
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w+b') as out:
+        data = TemporaryFile()
+        columns = [builder.write(data) for builder in builders]
+
+        meta = {
+            'source': source,
+            'rows': rows,
+            'header': header,
+            'columns': columns,
+            'byteorder': sys.byteorder,
+        }
+
+        out.write('%s %d\n' % ( MAGIC, VERSION ))
+        out.write(json.dumps(meta))
+        out.write('\n')
+
+        data.seek(0)
+        while True:
+            chunk = data.read(1024 * 1024)
+            if not chunk:
+                break
+
+            out.write(chunk)
+
+        data.close()
+
+    os.rename(tmp_path, cache_path)
+    return rows
+
+class _Column(object):
+    typed = False
+
+    def __init__(self, cache, meta):
+        self.cache = cache
+        self.meta = meta
+
+    def _array(self, meta):
+        a = array(meta['typecode'])
+        start = self.cache.data_offset + meta['offset']
+        a.fromstring(self.cache.mm[start:start + meta['length']])
+        return a
+
+class _StrColumn(_Column):
+    def __init__(self, cache, meta):
+        _Column.__init__(self, cache, meta)
+        self.offsets = None
+        self.start = cache.data_offset + meta['blob']['offset']
+
+    def string(self, i):
+        if self.offsets is None:
+            self.offsets = self._array(self.meta['offsets'])
+
+        offsets = self.offsets
+        return self.cache.mm[self.start + offsets[i]:self.start + offsets[i + 1]]
+
+    def get(self, i, converter):
+        v = self.string(i)
+        if converter is not None:
+            v = converter(v)
+
+        return v
+
+class _DictColumn(_Column):
+    def __init__(self, cache, meta):
+        _Column.__init__(self, cache, meta)
+        self.codes = None
+        self.values = None
+
+        # converter -> list of converted values, indexed by code
+        self.converted = {}
+
+    def load(self):
+        self.codes = self._array(self.meta['codes'])
+
+        values = _StrColumn(self.cache, self.meta['values'])
+        self.values = [values.string(i)
+                       for i in xrange(self.meta['values']['count'])]
+
+    def string(self, i):
+        if self.codes is None:
+            self.load()
+
+        return self.values[self.codes[i]]
+
+    def get(self, i, converter):
+        if self.codes is None:
+            self.load()
+
+        if converter is None:
+            return self.values[self.codes[i]]
+
+        # Each distinct value is only converted once.
+        values = self.converted.get(converter, None)
+        if values is None:
+            values = [None] * len(self.values)
+            self.converted[converter] = values
+
+        code = self.codes[i]
+        v = values[code]
+        if v is None:
+            v = converter(self.values[code])
+            values[code] = v
+
+        return v
+
+class _IntColumn(_Column):
+    typed = True
+
+    def __init__(self, cache, meta):
+        _Column.__init__(self, cache, meta)
+        self.values = None
+
+    def get(self, i, converter):
+        if self.values is None:
+            self.values = self._array(self.meta['values'])
+
+        return self.values[i]
+
+class _DateColumn(_IntColumn):
+    def get(self, i, converter):
+        return datetime.utcfromtimestamp(_IntColumn.get(self, i, converter))
+
+COLUMN_TYPES = {
+    'str': _StrColumn,
+    'dict': _DictColumn,
+    'int': _IntColumn,
+    'date': _DateColumn,
+}
+
+class CrashDataCache(object):
+    '''A memory mapped columnar cache of a daily CSV file.
+
+    Crashes produced by a cache are lazy: each field is read from its column
+    the first time it is accessed. Use open_cache() to obtain an instance for
+    a CSV file if a current cache exists.
+    '''
+
+    def __init__(self, cache_path):
+        self.path = cache_path
+        self.fh = open(cache_path, 'rb')
+
+        magic = self.fh.readline().split()
+        if magic != [MAGIC, str(VERSION)]:
+            raise CacheError('Not a crash data cache: %s' % cache_path)
+
+        self.meta = json.loads(self.fh.readline())
+        self.data_offset = self.fh.tell()
+        self.rows = self.meta['rows']
+
+        if self.rows:
+            self.mm = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.mm = ''
+
+        self.columns = [COLUMN_TYPES[c['kind']](self, c)
+                        for c in self.meta['columns']]
+
+        # Reuse the CSV decoder so slots, converters and hooks are exactly
+        # the ones used when parsing the CSV itself.
+        decoder = FieldDecoder(self.meta['header'], by_index=True)
+        self.unhandled = decoder.unhandled
+        self.slots = {}
+        for slot, entries in decoder.slots.iteritems():
+            self.slots[slot] = [(self.columns[i], converter, hook)
+                                for i, converter, hook in entries]
+
+            # Dictionary encoded columns already share their strings.
+            if slot in SHARED_SLOTS:
+                self.slots[slot] = [
+                    (column, None if isinstance(column, _DictColumn) else converter, hook)
+                    for column, converter, hook in self.slots[slot]]
+
+    def is_current(self, path):
+        '''Returns whether this cache matches the CSV file at path.'''
+        if self.meta.get('byteorder') != sys.byteorder:
+            return False
+
+        for c in self.meta['columns']:
+            for a in (c.get('values'), c.get('codes'), c.get('offsets')):
+                if isinstance(a, dict) and 'typecode' in a:
+                    if array(a['typecode']).itemsize != a['itemsize']:
+                        return False
+
+        return self.meta['source'] == _source_info(path)
+
+    def close(self):
+        if self.rows:
+            self.mm.close()
+
+        self.fh.close()
+
+    def load(self, crash, slot):
+        '''Populate a single slot of a crash. Called by CrashData.'''
+        entries = self.slots.get(slot, None)
+        if entries is None:
+            return False
+
+        i = crash._raw
+        for column, converter, hook in entries:
+            if hook is not None:
+                hook(crash, column.string(i))
+                continue
+
+            setattr(crash, slot, column.get(i, converter))
+
+        return True
+
+    def encoded(self, slot):
+        '''Returns (codes, values) if a slot is read from a single dictionary
+        encoded column, so that row i has the value values[codes[i]].
+        Returns None otherwise.'''
+        entries = self.slots.get(slot, None)
+        if entries is None or len(entries) != 1:
+            return None
+
+        column, converter, hook = entries[0]
+        if hook is not None or not isinstance(column, _DictColumn):
+            return None
+
+        if column.codes is None:
+            column.load()
+
+        if converter is None:
+            return column.codes, column.values
+
+        values = column.converted.get(converter, None)
+        if values is None:
+            values = [None] * len(column.values)
+            column.converted[converter] = values
+
+        for code, v in enumerate(values):
+            if v is None:
+                values[code] = converter(column.values[code])
+
+        return column.codes, values
+
+    def column(self, name):
+        '''Returns the column for a CSV header name or None.'''
+        header = self.meta['header']
+        if name not in header:
+            return None
+
+        return self.columns[header.index(name)]
+
+    def __iter__(self):
+        return self.crashes()
+
+    def crashes(self, rows=None):
+        '''Yields crashes for the specified row numbers, or all rows.'''
+        if rows is None:
+            rows = xrange(self.rows)
+
+        for i in rows:
+            crash = CrashData()
+            crash._decoder = self
+            crash._raw = i
+
+            for column, hook in self.unhandled:
+                hook(crash, self.columns[column].string(i))
+
+            yield crash
+
+def open_cache(path):
+    '''Returns a CrashDataCache for a CSV file or None if there is no
+    current cache for it.'''
+    cache_path = cache_path_for(path)
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        cache = CrashDataCache(cache_path)
+    except (CacheError, ValueError, IOError):
+        return None
+
+    if not cache.is_current(path):
+        cache.close()
+        return None
+
+    return cache
+
+def _trigram(s, i):
+    return (ord(s[i]) << 16) | (ord(s[i + 1]) << 8) | ord(s[i + 2])
+
+def _trigrams(s):
+    return set(_trigram(s, i) for i in xrange(len(s) - 2))
+
+def build_signature_index(cache, index_path):
+    '''Build the signature index for a cache.
+
+    Returns the number of distinct signatures indexed or None if the cache
+    has no signature column.
+    '''
+    column = cache.column('signature')
+    if not isinstance(column, _DictColumn):
+        return None
+
+    column.load()
+    values = column.values
+
+    grams = {}
+    for vid, v in enumerate(values):
+        for g in _trigrams(v):
+            if g in grams:
+                grams[g].append(vid)
+            else:
+                grams[g] = [vid]
+
+    gram_keys = array(INT_TYPE, sorted(grams))
+    gram_offsets = array(OFFSET_TYPE, [0])
+    gram_postings = array(INT_TYPE)
+    for g in gram_keys:
+        gram_postings.extend(grams[g])
+        gram_offsets.append(len(gram_postings))
+
+    by_value = [[] for v in values]
+    for row, code in enumerate(column.codes):
+        by_value[code].append(row)
+
+    row_offsets = array(OFFSET_TYPE, [0])
+    rows = array(INT_TYPE)
+    for l in by_value:
+        rows.extend(l)
+        row_offsets.append(len(rows))
+
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w+b') as out:
+        data = TemporaryFile()
+        arrays = {
+            'gram_keys': _write_array(data, gram_keys),
+            'gram_offsets': _write_array(data, gram_offsets),
+            'gram_postings': _write_array(data, gram_postings),
+            'row_offsets': _write_array(data, row_offsets),
+            'rows': _write_array(data, rows),
+        }
+
+        meta = {
+            'source': cache.meta['source'],
+            'arrays': arrays,
+            'byteorder': sys.byteorder,
+        }
+
+        out.write('%s %d\n' % ( INDEX_MAGIC, VERSION ))
+        out.write(json.dumps(meta))
+        out.write('\n')
+
+        data.seek(0)
+        while True:
+            chunk = data.read(1024 * 1024)
+            if not chunk:
+                break
+
+            out.write(chunk)
+
+        data.close()
+
+    os.rename(tmp_path, index_path)
+    return len(values)
+
+class SignatureIndex(object):
+    '''Trigram index over the distinct signatures of a cache.
+
+    rows_matching() returns the cache rows whose signature has a component
+    containing a string, i.e. the rows for which CrashData.has_signature()
+    is True.
+    '''
+
+    def __init__(self, index_path, cache):
+        self.cache = cache
+        self.fh = open(index_path, 'rb')
+
+        magic = self.fh.readline().split()
+        if magic != [INDEX_MAGIC, str(VERSION)]:
+            raise CacheError('Not a signature index: %s' % index_path)
+
+        self.meta = json.loads(self.fh.readline())
+        self.data_offset = self.fh.tell()
+        self.mm = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.gram_keys = None
+        self.gram_offsets = None
+        self.row_offsets = None
+
+    def is_current(self):
+        if self.meta.get('byteorder') != sys.byteorder:
+            return False
+
+        for a in self.meta['arrays'].itervalues():
+            if array(a['typecode']).itemsize != a['itemsize']:
+                return False
+
+        return self.meta['source'] == self.cache.meta['source']
+
+    def close(self):
+        self.mm.close()
+        self.fh.close()
+
+    def _array(self, name, start=0, end=None):
+        meta = self.meta['arrays'][name]
+        a = array(meta['typecode'])
+
+        offset = self.data_offset + meta['offset']
+        if end is None:
+            end = meta['length'] / a.itemsize
+
+        a.fromstring(self.mm[offset + start * a.itemsize:offset + end * a.itemsize])
+        return a
+
+    def _postings(self, g):
+        if self.gram_keys is None:
+            self.gram_keys = self._array('gram_keys')
+            self.gram_offsets = self._array('gram_offsets')
+
+        i = bisect_left(self.gram_keys, g)
+        if i == len(self.gram_keys) or self.gram_keys[i] != g:
+            return None
+
+        return self._array('gram_postings', self.gram_offsets[i],
+                           self.gram_offsets[i + 1])
+
+    def rows_matching(self, s):
+        column = self.cache.column('signature')
+        if column.codes is None:
+            column.load()
+
+        values = column.values
+
+        if len(s) < 3:
+            candidates = xrange(len(values))
+        else:
+            candidates = None
+            for postings in sorted((self._postings(g) for g in _trigrams(s)),
+                                   key=lambda p: len(p) if p is not None else -1):
+                if postings is None:
+                    return []
+
+                if candidates is None:
+                    candidates = set(postings)
+                else:
+                    candidates.intersection_update(postings)
+
+                if not candidates:
+                    return []
+
+        if self.row_offsets is None:
+            self.row_offsets = self._array('row_offsets')
+
+        rows = []
+        for vid in candidates:
+            for sig in values[vid].split(' | '):
+                if sig.find(s) != -1:
+                    rows.extend(self._array('rows', self.row_offsets[vid],
+                                            self.row_offsets[vid + 1]))
+                    break
+
+        rows.sort()
+        return rows
+
+def open_signature_index(path, cache):
+    '''Returns the SignatureIndex for a CSV file and its open cache, or
+    None if there is no current index.'''
+    index_path = index_path_for(path)
+    if not os.path.exists(index_path):
+        return None
+
+    try:
+        index = SignatureIndex(index_path, cache)
+    except (CacheError, ValueError, IOError):
+        return None
+
+    if not index.is_current():
+        index.close()
+        return None
+
+    return index
@@ -0,0 +1,238 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+
+# This file contains near-duplicate clustering of crashes by stack.
+#
+# Each crash's crashed thread stack is reduced to the set of its top frame
+# symbols and summarized by a MinHash signature, in which the fraction of
+# equal positions estimates the Jaccard similarity of two sets. Signatures
+# are cut into bands and crashes sharing a band are candidate pairs
+# (locality-sensitive hashing). Only candidates are compared, and those at
+# least threshold similar are joined, so the cost stays close to linear in
+# the number of crashes instead of comparing every pair.
+
+import random
+import zlib
+
+from array import array
+from itertools import izip
+
+# The largest prime below 2 ** 32, so hash values fit an array('L') on every
+# platform (Python 2 has no 'Q' typecode). The few feature hashes at or
+# above it share values with those PRIME lower, which is harmless.
+PRIME = 4294967291
+
+# Most crashes share their symbols, so the hash values of each symbol are
+# kept. The table is cleared when it reaches this many symbols.
+MAX_CACHED_FEATURES = 100000
+
+_coefficients = {}
+_feature_values = {}
+
+def _hash_coefficients(num_perm):
+    '''Returns the (a, b) pairs of the hash functions used for MinHash.
+
+    They come from a fixed seed, so signatures computed in different
+    processes can be compared.
+    '''
+    coefficients = _coefficients.get(num_perm, None)
+    if coefficients is None:
+        r = random.Random(num_perm)
+        coefficients = [(r.randint(1, 2 ** 31 - 1), r.randint(0, PRIME - 1))
+                        for i in xrange(num_perm)]
+        _coefficients[num_perm] = coefficients
+
+    return coefficients
+
+def _values(feature, num_perm):
+    key = (feature, num_perm)
+    values = _feature_values.get(key, None)
+    if values is None:
+        if len(_feature_values) >= MAX_CACHED_FEATURES:
+            _feature_values.clear()
+
+        data = feature
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+
+        h = zlib.crc32(data) & 0xffffffff
+        values = [(a * h + b) % PRIME
+                  for a, b in _hash_coefficients(num_perm)]
+        _feature_values[key] = values
+
+    return values
+
+def minhash(features, num_perm=64):
+    '''Returns the MinHash signature of a non-empty set of strings.'''
+    rows = [_values(feature, num_perm) for feature in features]
+    if len(rows) == 1:
+        return array('L', rows[0])
+
+    return array('L', map(min, *rows))
+
+def similarity(a, b):
+    '''Returns the Jaccard similarity estimated from two signatures.'''
+    same = 0
+    for x, y in izip(a, b):
+        if x == y:
+            same += 1
+
+    return float(same) / len(a)
+
+def choose_bands(num_perm, threshold):
+    '''Returns (bands, rows) for LSH over signatures of num_perm values.
+
+    Pairs with similarity s become candidates with probability
+    1 - (1 - s^rows)^bands, which rises steepest around
+    (1 / bands)^(1 / rows). The split putting that closest to threshold is
+    chosen.
+    '''
+    best = None
+    for rows in xrange(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+
+        bands = num_perm // rows
+        distance = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or distance < best[0]:
+            best = (distance, bands, rows)
+
+    return best[1], best[2]
+
+class StackClusterer(object):
+    '''Groups crashes whose crashed stacks share most of their top frames.
+
+    threshold is the estimated Jaccard similarity of frame symbol sets at
+    which two crashes are joined. depth is the number of frames from the top
+    of the stack that are considered.
+    '''
+
+    def __init__(self, threshold=0.5, depth=10, num_perm=64):
+        self.threshold = threshold
+        self.depth = depth
+        self.num_perm = num_perm
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+
+        self.uuids = []
+        self.stacks = []
+        self.signatures = []
+
+    def add(self, uuid, symbols):
+        '''Record a crash by its UUID and crashed stack symbols.'''
+        symbols = tuple(s or '' for s in symbols[:self.depth])
+        if not symbols:
+            return
+
+        self.uuids.append(uuid)
+        self.stacks.append(symbols)
+        self.signatures.append(minhash(set(symbols), self.num_perm))
+
+    def merge(self, other):
+        self.uuids.extend(other.uuids)
+        self.stacks.extend(other.stacks)
+        self.signatures.extend(other.signatures)
+
+    def clusters(self, min_size=2):
+        '''Returns clusters of at least min_size crashes, largest first.
+
+        Each cluster is a tuple of (UUIDs, representative stack), where the
+        representative is the most common stack among the members.
+        '''
+        signatures = self.signatures
+        threshold = self.threshold
+
+        parent = range(len(signatures))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+
+            return i
+
+        for band in xrange(self.bands):
+            start = band * self.rows
+            end = start + self.rows
+
+            buckets = {}
+            for i, signature in enumerate(signatures):
+                key = tuple(signature[start:end])
+                if key in buckets:
+                    buckets[key].append(i)
+                else:
+                    buckets[key] = [i]
+
+            for members in buckets.itervalues():
+                if len(members) < 2:
+                    continue
+
+                first = members[0]
+                for i in members[1:]:
+                    a = find(first)
+                    b = find(i)
+                    if a == b:
+                        continue
+
+                    if similarity(signatures[first], signatures[i]) >= threshold:
+                        parent[b] = a
+
+        groups = {}
+        for i in xrange(len(signatures)):
+            groups.setdefault(find(i), []).append(i)
+
+        clusters = []
+        for members in groups.itervalues():
+            if len(members) < min_size:
+                continue
+
+            stack_counts = {}
+            for i in members:
+                stack = self.stacks[i]
+                stack_counts[stack] = stack_counts.get(stack, 0) + 1
+
+            # Ties go to the stack of the earliest member.
+            representative = max(members,
+                                 key=lambda i: (stack_counts[self.stacks[i]], -i))
+
+            clusters.append(([self.uuids[i] for i in members],
+                             self.stacks[representative]))
+
+        clusters.sort(key=lambda c: (-len(c[0]), c[0][0]))
+
+        return clusters
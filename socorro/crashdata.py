@@ -37,35 +37,581 @@
 
 import csv
 import httplib
+import socket
+import threading
+import time
 
+from cStringIO import StringIO
+from collections import deque
 from datetime import datetime
 from json import loads
+from Queue import Full, Queue
 
-# TODO make crash parsing more efficient. Currently it converts CSV to dict
-# then to another dict. Lots of extra shuffling that can be eliminated.
+from socorro.memo import LRUMemo
+
+# Default size of the raw blocks handed to parallel workers.
+BLOCK_SIZE = 4 * 1024 * 1024
+
+def _csv_datetime(v):
+    return datetime.strptime(v, '%Y%m%d%H%M')
+
+def _json_datetime(v):
+    i = v.find('.')
+    if i != -1:
+        v = v[0:i]
+
+    return datetime.strptime(v, '%Y-%m-%d %H:%M:%S')
+
+# List valued fields are tuples: the memos below share one converted value
+# between every crash with the same raw value, so it must not be mutable.
+def _bug_list(v):
+    return tuple([int(b) for b in v.split(',') if len(b) > 0])
+
+def _split_pipes(v):
+    return tuple(v.split(' | '))
+
+def _duplicate_of(v):
+    if v == '\\N':
+        return None
+
+    # TODO convert to UUID
+    return v
+
+def _uuid_from_url(crash, v):
+    i = v.find('/report/index/')
+
+    if i != -1:
+        crash.uuid = v[i + len('/report/index/'):]
+
+def _unhandled_key(k):
+    def hook(crash, v):
+        print 'UNHANDLED KEY: %s = %s' % ( k, v )
+
+    return hook
+
+# Maps source keys to (slot, converter). A converter of None stores the value
+# as-is. A converter of True marks a date, whose format depends on whether
+# the source is CSV or JSON.
+FIELDS = {
+    'addons': ('addons', None),
+    'address': ('address', None),
+    'adu_count': ('adu_count', None),
+    'addons_checked': ('addons_checked', None),
+    'app_notes': ('app_notes', None),
+    'build': ('build', None),
+    'build_date': ('build_date', True),
+    'branch': ('branch', None),
+    'bug_list': ('bugs', _bug_list),
+    'client_crash_date': ('crash_date', True),
+    'completeddatetime': ('completed_date', True),
+    'cpu_info': ('cpu_info', _split_pipes),
+    'cpu_name': ('cpu_name', None),
+    # while thread IDs are typically integers, we can't assume
+    'crashedThread': ('crashed_thread', str),
+    'date_processed': ('date_processed', True),
+    'distributor': ('distributor', None),
+    'distributor_version': ('distributor_version', None),
+    'duplicate_of': ('duplicate_of', _duplicate_of),
+    'flash_version': ('flash_version', None),
+    'hangid': ('hangid', None),
+    'id': ('id', None),
+    'install_age': ('install_age', int),
+    'last_crash': ('last_crash', None),
+    'os_name': ('os_name', None),
+    'os_version': ('os_version', None),
+    'pluginFilename': ('plugin_filename', None),
+    'pluginName': ('plugin_name', None),
+    'pluginVersion': ('plugin_version', None),
+    'process_type': ('process_type', None),
+    'processType': ('process_type', None),
+    'processor_notes': ('processor_notes', None),
+    'product': ('product', None),
+    'reason': ('reason', None),
+    'release_channel': ('release_channel', None),
+    'ReleaseChannel': ('release_channel', None),
+    'signature': ('signature', _split_pipes),
+    'startedDateTime': ('started_time', True),
+    'success': ('success', None),
+    'topmost_filenames': ('topmost_filenames', None),
+    'truncated': ('truncated', None),
+    'uptime_seconds': ('uptime', int),
+    'uptime': ('uptime', int),
+    'user_comments': ('user_comments', None),
+    'uuid': ('uuid', None),
+    'uuid_url': ('uuid_url', None),
+    'version': ('version', None),
+}
+
+# Slots whose raw strings are shared between crashes having the same value,
+# rather than each crash keeping its own copy.
+SHARED_SLOTS = set([
+    'branch',
+    'build',
+    'cpu_name',
+    'flash_version',
+    'os_name',
+    'os_version',
+    'process_type',
+    'product',
+    'reason',
+    'release_channel',
+    'version',
+])
+
+def _shared_string(v):
+    return v
+
+# Converters whose inputs repeat across rows, mapped to the memo used in
+# their place. Memos are shared by all decoders, so conversions are reused
+# across files as well as rows.
+MEMOS = dict((f, LRUMemo(f, name)) for f, name in (
+    (_csv_datetime, 'csv_date'),
+    (_json_datetime, 'json_date'),
+    (_bug_list, 'bug_list'),
+    (_split_pipes, 'split_pipes'),
+    (_shared_string, 'shared_string'),
+))
+
+def memo_counts():
+    '''Returns a dict of memo name to (hits, misses) so far.'''
+    return dict((m.name, (m.hits, m.misses)) for m in MEMOS.itervalues())
+
+# Keys that need more than a plain slot assignment. Maps to (hook, slots the
+# hook may populate).
+HOOKS = {
+    'uuid_url': (_uuid_from_url, ('uuid',)),
+}
+
+# Keys that are known but not stored. 'dump' is handled by from_dict.
+# TODO parse Winsock_LSP
+IGNORED_KEYS = set(['', 'dump', 'URL (removed)', 'Winsock_LSP'])
+
+class FieldDecoder(object):
+    '''Precompiled mapping of source fields to CrashData slots.
+
+    A decoder is built once for a set of keys (a CSV header or the keys of a
+    JSON object) and is then applied to every record having those keys. If
+    by_index is True, records are lists and values are read by position.
+    Otherwise records are dicts and values are read by key.
+
+    Decoding can be eager (decode) or lazy (attach). A lazily attached crash
+    keeps a reference to the record and converts a slot the first time it is
+    accessed.
+    '''
+
+    def __init__(self, keys, full=False, by_index=False):
+        date = _json_datetime if full else _csv_datetime
+
+        self.keys = list(keys)
+        self.fields = []
+        self.hooks = []
+        self.unhandled = []
+
+        # slot -> list of (source, converter, hook) in decode order
+        self.slots = {}
+
+        for i, k in enumerate(self.keys):
+            source = i if by_index else k
+
+            if k in FIELDS:
+                slot, converter = FIELDS[k]
+                if converter is True:
+                    converter = date
+                elif converter is None and slot in SHARED_SLOTS:
+                    converter = _shared_string
+
+                converter = MEMOS.get(converter, converter)
+
+                self.fields.append((source, slot, converter))
+                self.slots.setdefault(slot, []).append(
+                    (source, converter, None))
+            elif k not in IGNORED_KEYS:
+                self.unhandled.append((source, _unhandled_key(k)))
+
+        for i, k in enumerate(self.keys):
+            if k in HOOKS:
+                source = i if by_index else k
+                hook, slots = HOOKS[k]
+
+                self.hooks.append((source, hook))
+                for slot in slots:
+                    self.slots.setdefault(slot, []).append(
+                        (source, None, hook))
+
+    def decode(self, crash, values):
+        '''Populate a CrashData instance from a record.'''
+        for source, slot, converter in self.fields:
+            v = values[source]
+            if converter is not None:
+                v = converter(v)
+
+            setattr(crash, slot, v)
+
+        for source, hook in self.hooks:
+            hook(crash, values[source])
+
+        for source, hook in self.unhandled:
+            hook(crash, values[source])
+
+    def attach(self, crash, values):
+        '''Lazily populate a CrashData instance from a record.
+
+        Nothing is converted until a slot is accessed, at which point load()
+        is called by CrashData.__getattr__.
+        '''
+        crash._decoder = self
+        crash._raw = values
+
+        for source, hook in self.unhandled:
+            hook(crash, values[source])
+
+    def load(self, crash, slot):
+        '''Populate a single slot from the record attached to a crash.
+
+        Returns whether the slot is provided by this decoder.
+        '''
+        entries = self.slots.get(slot, None)
+        if entries is None:
+            return False
+
+        values = crash._raw
+        for source, converter, hook in entries:
+            if hook is not None:
+                hook(crash, values[source])
+                continue
+
+            v = values[source]
+            if converter is not None:
+                v = converter(v)
+
+            setattr(crash, slot, v)
+
+        return True
 
 class CrashDataParser(object):
+    '''Parses daily crash CSV files into CrashData instances.
+
+    If lazy is True, crashes are attached to their raw rows and fields are
+    only converted when accessed. This is much cheaper when only a few
+    fields of each crash are looked at.
+
+    prefilters is an optional dict of CSV column name to substring. Raw lines
+    whose column does not contain the substring are dropped before any CSV
+    parsing happens. This is a necessary condition only: callers must still
+    apply their real filters to the crashes that come out.
 
-    def __init__(self):
-        pass
+    stats is an optional socorro.stats.Stats. If given, lines, bytes and
+    prefiltered rows are counted and the read, prefilter and csv stages are
+    timed.
+    '''
+
+    def __init__(self, lazy=False, prefilters=None, stats=None):
+        self.lazy = lazy
+        self.prefilters = prefilters or {}
+        self.stats = stats
+
+    def _prefilter_lines(self, lines):
+        '''Drop raw lines that cannot satisfy the prefilters.
+
+        Lines containing a quote character are always passed through, as are
+        all lines inside a quoted (possibly multi-line) field. So only plain
+        tab-separated records are ever tested and dropped, which keeps the
+        stream valid for csv.reader.
+        '''
+        try:
+            header_line = lines.next()
+        except StopIteration:
+            return
+
+        yield header_line
+
+        header = csv.reader([header_line], delimiter='\t').next()
+        tests = []
+        for column, needle in self.prefilters.iteritems():
+            if column in header and needle:
+                tests.append((header.index(column), needle))
+
+        if not tests:
+            for line in lines:
+                yield line
+
+            return
+
+        split_at = max(i for i, needle in tests) + 1
+        quoted = False
+        dropped = 0
+
+        try:
+            for line in lines:
+                if quoted or '"' in line:
+                    if line.count('"') % 2:
+                        quoted = not quoted
+
+                    yield line
+                    continue
+
+                fields = None
+                for i, needle in tests:
+                    # Searching the whole line is fast and rejects most lines
+                    # before we pay for the split.
+                    if needle not in line:
+                        break
+
+                    if fields is None:
+                        fields = line.split('\t', split_at)
+
+                    if len(fields) > i and needle not in fields[i]:
+                        break
+                else:
+                    yield line
+                    continue
+
+                dropped += 1
+        finally:
+            if self.stats is not None:
+                self.stats.count('rows_prefiltered_out', dropped)
 
     def _handle_reader(self, reader):
+        '''Yields CrashData instances from a csv.reader.
+
+        The first row is the header. It is compiled to a FieldDecoder, which
+        then populates each crash directly from the row list.
+        '''
+        try:
+            header = reader.next()
+        except StopIteration:
+            return
+
+        decoder = FieldDecoder(header, by_index=True)
+        decode = decoder.attach if self.lazy else decoder.decode
+        width = len(header)
+
         for row in reader:
-            yield CrashData(csv_row_dict=row)
+            # DictReader skips blank lines
+            if not row:
+                continue
+
+            crash = CrashData()
+
+            if len(row) == width:
+                decode(crash, row)
+            else:
+                # Pad or overflow the row like DictReader would, so malformed
+                # rows behave exactly as they always have.
+                d = dict(zip(header, row))
+                for k in header[len(row):]:
+                    d[k] = None
+                if len(row) > width:
+                    d[None] = row[width:]
+
+                crash.from_dict(d, full=False, lazy=self.lazy)
+
+            yield crash
 
     def parse_handle(self, fh):
-        reader = csv.DictReader(fh, delimiter='\t')
+        stats = self.stats
+
+        lines = iter(fh)
+        if stats is not None:
+            lines = stats.lines(lines)
+
+        if self.prefilters:
+            lines = self._prefilter_lines(lines)
+            if stats is not None:
+                lines = stats.timed(lines, 'prefilter')
+
+        reader = csv.reader(lines, delimiter='\t')
+        if stats is not None:
+            reader = stats.timed(reader, 'csv')
+
         return self._handle_reader(reader)
 
     def parse_file(self, path):
         with open(path, 'rb') as fh:
-            reader = csv.DictReader(fh, delimiter='\t')
-            return self._handle_reader(reader)
+            for crash in self.parse_handle(fh):
+                yield crash
+
+    def parse_block(self, header, block):
+        '''Parse a block produced by iter_blocks().'''
+        return self.parse_handle(StringIO(header + block))
+
+    def iter_blocks(self, fh, block_size=BLOCK_SIZE):
+        '''Cut a CSV stream into blocks of raw lines.
+
+        Yields (header, block) tuples, where header is the header line and
+        block is roughly block_size bytes of complete records. Blocks never
+        end inside a quoted field, so each one can be parsed on its own with
+        parse_block().
+        '''
+        header = fh.readline()
+        if not header:
+            return
+
+        while True:
+            block = fh.read(block_size)
+            if not block:
+                break
+
+            parts = [block]
+            quotes = block.count('"')
+
+            if block[-1] != '\n':
+                line = fh.readline()
+                parts.append(line)
+                quotes += line.count('"')
+
+            while quotes % 2:
+                line = fh.readline()
+                if not line:
+                    break
+
+                parts.append(line)
+                quotes += line.count('"')
+
+            yield header, ''.join(parts)
+
+    def map_blocks(self, fh, pool, func, extra=(), block_size=BLOCK_SIZE,
+                   depth=8):
+        '''Apply a function to blocks of a CSV stream on a process pool.
+
+        func is called in a worker with a (header, block) + extra tuple and
+        should return something small, such as aggregated counts. Results are
+        yielded in input order. At most depth blocks are in flight at once,
+        which bounds memory no matter how large the input is.
+        '''
+        pending = deque()
+
+        for header, block in self.iter_blocks(fh, block_size):
+            pending.append(pool.apply_async(func, ((header, block) + extra,)))
+
+            if len(pending) >= depth:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+
+# Intern tables shared by all crashes. Module names, symbols and source files
+# repeat across nearly every dump, so each distinct value is stored once.
+# intern() can't be used because JSON strings are unicode. A table is cleared
+# when it reaches MAX_INTERNED values, so long running processes (--follow,
+# the query server) don't grow it forever.
+MAX_INTERNED = 100000
+
+_strings = {}
+_frame_keys = {}
+
+def _intern(s, table=_strings):
+    v = table.get(s, None)
+    if v is None:
+        if len(table) >= MAX_INTERNED:
+            table.clear()
+
+        v = table[s] = s
+
+    return v
+
+class _Record(object):
+    '''Base class for compact records parsed from '|' separated dump lines.
+
+    Records can be indexed like the lists of fields they used to be.
+    '''
+
+    __slots__ = ()
+    _fields = ()
+
+    def __getitem__(self, i):
+        return getattr(self, self._fields[i])
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __iter__(self):
+        for name in self._fields:
+            yield getattr(self, name)
+
+    def __eq__(self, other):
+        if not isinstance(other, (_Record, tuple, list)):
+            return NotImplemented
+
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+
+        return not eq
+
+    def __repr__(self):
+        return '%s(%r)' % ( self.__class__.__name__, list(self) )
+
+class Frame(_Record):
+    '''A single stack frame from a dump.
+
+    key is the (index, module, symbol) tuple frames are counted by. It is
+    shared between all frames having the same values.
+    '''
+
+    __slots__ = [
+        'thread',
+        'index',
+        'module',
+        'symbol',
+        'source',
+        'line',
+        'offset',
+        'key',
+    ]
+
+    _fields = __slots__[:7]
+
+    def __init__(self, fields):
+        n = len(fields)
+
+        self.thread = _intern(fields[0])
+        self.index = int(fields[1])
+        self.module = _intern(fields[2]) if n > 2 else None
+        self.symbol = _intern(fields[3]) if n > 3 else None
+        self.source = _intern(fields[4]) if n > 4 else None
+        self.line = fields[5] if n > 5 else None
+        self.offset = fields[6] if n > 6 else None
+
+        self.key = _intern((self.index, self.module, self.symbol),
+                           _frame_keys)
+
+class Module(_Record):
+    '''A loaded module from a dump.'''
+
+    __slots__ = [
+        'type',
+        'filename',
+        'version',
+        'debug_file',
+        'debug_id',
+        'base_address',
+        'max_address',
+        'is_main',
+    ]
+
+    _fields = __slots__
+
+    def __init__(self, fields):
+        for name, v in zip(self._fields, fields):
+            setattr(self, name, _intern(v))
+
+        for name in self._fields[len(fields):]:
+            setattr(self, name, None)
 
 class CrashData(object):
     '''Represents a single crash report'''
 
     __slots__ = [
+        '_decoder',
+        '_dump',
+        '_raw',
+        '_thread_spans',
+        '_thread_stacks',
+        '_modules_span',
         'addons',
         'adu_count',
         'address',
@@ -113,203 +659,187 @@ class CrashData(object):
         'version',
     ]
 
-    def __init__(self, csv_row_dict=None, json=None):
+    def __init__(self, csv_row_dict=None, json=None, lazy=False):
         '''Construct a crash data instance.
 
         Crash data can be reconstructed from a number of sources.
         JSON is the most complete crash data.
+
+        If lazy is True, fields are converted on first access instead of
+        up front. Conversion errors are then raised on access.
         '''
 
-        self.modules = []
-        self.stacks = {}
+        self._decoder = None
+        self._dump = None
 
         if json is not None:
-            self.from_json(json)
+            self.from_json(json, lazy=lazy)
         elif csv_row_dict is not None:
-            self.from_csv_dict(csv_row_dict)
+            self.from_csv_dict(csv_row_dict, lazy=lazy)
+
+    def __getattr__(self, name):
+        # Only called when normal lookup fails, i.e. for unset slots.
+        if name[0] == '_':
+            raise AttributeError(name)
+
+        if name == 'modules':
+            self.modules = self._parse_modules()
+            return self.modules
+
+        if name == 'stacks':
+            self.stacks = self._parse_stacks()
+            return self.stacks
 
-    def from_csv_dict(self, row):
+        decoder = self._decoder
+        if decoder is None or not decoder.load(self, name):
+            raise AttributeError(name)
+
+        return object.__getattribute__(self, name)
+
+    def from_csv_dict(self, row, lazy=False):
         '''Creates a new instance from a parsed CSV row created by DictReader
 
         This will likely only be called from CrashDataParser.
         '''
-        self.from_dict(row, full=False)
+        self.from_dict(row, full=False, lazy=lazy)
 
 
-    def from_json(self, json):
+    def from_json(self, json, lazy=False):
         '''Populate data from a JSON-string
 
         The string should be the JSON representation of an object. This JSON
         blob likely comes from the crash-stats HTTP server.
         '''
-        self.from_dict(loads(json), full=True)
+        self.from_dict(loads(json), full=True, lazy=lazy)
 
-    def from_dict(self, d, full=False):
-        def string_to_datetime(v, full=False):
-            fmt = '%Y%m%d%H%M'
+    # FieldDecoder instances keyed by (keys, full)
+    _decoders = {}
 
-            if full:
-                i = v.find('.')
-                if i != -1:
-                    v = v[0:i]
+    def from_dict(self, d, full=False, lazy=False):
+        key = (tuple(d), full)
+        decoder = CrashData._decoders.get(key, None)
+        if decoder is None:
+            decoder = FieldDecoder(key[0], full=full)
+            CrashData._decoders[key] = decoder
 
-                fmt = '%Y-%m-%d %H:%M:%S'
+        if lazy:
+            decoder.attach(self, d)
+        else:
+            decoder.decode(self, d)
 
-            return datetime.strptime(v, fmt)
+        if 'dump' in d:
+            # The dump is kept as text and parsed when modules or stacks are
+            # accessed. Lazy crashes only parse the threads that are asked
+            # for.
+            self._dump = d['dump']
+            self._thread_spans = None
+            self._thread_stacks = {}
 
-        for k, v in d.iteritems():
-            if k == '':
-                continue
-            elif k == 'addons':
-                self.addons = v
-            elif k == 'address':
-                self.address = v
-            elif k == 'adu_count':
-                self.adu_count = v
-            elif k == 'addons_checked':
-                self.addons_checked = v
-            elif k == 'app_notes':
-                self.app_notes = v
-            elif k == 'build':
-                self.build = v
-            elif k == 'build_date':
-                self.build_date = string_to_datetime(v, full)
-            elif k == 'branch':
-                self.branch = v
-            elif k == 'bug_list':
-                self.bugs = [int(b) for b in v.split(',') if len(b) > 0]
-            elif k == 'client_crash_date':
-                self.crash_date = string_to_datetime(v, full)
-            elif k == 'completeddatetime':
-                self.completed_date = string_to_datetime(v, full)
-            elif k == 'cpu_info':
-                self.cpu_info = v.split(' | ')
-            elif k == 'cpu_name':
-                self.cpu_name = v
-            elif k == 'crashedThread':
-                # while thread IDs are typically integers, we can't assume
-                self.crashed_thread = str(v)
-            elif k == 'date_processed':
-                self.date_processed = string_to_datetime(v, full)
-            elif k == 'distributor':
-                self.distributor = v
-            elif k == 'distributor_version':
-                self.distributor_version = v
-            elif k == 'dump':
-                # this is handled specially later
-                pass
-            elif k == 'duplicate_of':
-                do = None
-                if v != '\\N':
-                    # TODO convert to UUID
-                    do = v
-                self.duplicate_of = do
-
-            elif k == 'flash_version':
-                self.flash_version = v
-            elif k == 'hangid':
-                self.hangid = v
-            elif k == 'id':
-                self.id = v
-            elif k == 'install_age':
-                self.install_age = int(v)
-            elif k == 'last_crash':
-                self.last_crash = v
-            elif k == 'os_name':
-                self.os_name = v
-            elif k == 'os_version':
-                self.os_version = v
-            elif k == 'pluginFilename':
-                self.plugin_filename = v
-            elif k == 'pluginName':
-                self.plugin_name = v
-            elif k == 'pluginVersion':
-                self.plugin_version = v
-            elif k == 'process_type':
-                self.process_type = v
-            elif k == 'processType':
-                self.process_type = v
-            elif k == 'processor_notes':
-                self.processor_notes = v
-            elif k == 'product':
-                self.product = v
-            elif k == 'reason':
-                self.reason = v
-            elif k == 'release_channel':
-                self.release_channel = v
-            elif k == 'ReleaseChannel':
-                self.release_channel = v
-            elif k == 'signature':
-                self.signature = v.split(' | ')
-            elif k == 'startedDateTime':
-                self.started_time = string_to_datetime(v, full)
-            elif k == 'success':
-                self.success = v
-            elif k == 'topmost_filenames':
-                self.topmost_filenames = v
-            elif k == 'truncated':
-                self.truncated = v
-            elif k == 'URL (removed)':
-                continue
-            elif k == 'uptime_seconds':
-                self.uptime = int(v)
-            elif k == 'uptime':
-                self.uptime = int(v)
-            elif k == 'user_comments':
-                self.user_comments = v
-            elif k == 'uuid':
-                self.uuid = v
-            elif k == 'uuid_url':
-                self.uuid_url = v
-
-                i = v.find('/report/index/')
-
-                if i != -1:
-                    self.uuid = v[i + len('/report/index/'):]
-            elif k == 'version':
-                self.version = v
-            elif k == 'Winsock_LSP':
-                # TODO parse it
-                pass
+            if not lazy:
+                self.modules
+                self.stacks
+
+    def _index_dump(self):
+        '''Locate the module list and the lines of each thread in the dump.
+
+        Thread lines are recorded as [start, end) character spans, with
+        adjacent lines of the same thread merged into a single span.
+        '''
+        dump = self._dump
+        n = len(dump)
+
+        # The first 3 lines are the OS, CPU and crash info.
+        # TODO do stuff with these
+        pos = 0
+        for i in range(3):
+            end = dump.find('\n', pos)
+            if end == -1:
+                raise Exception('Invalid dump format')
+
+            pos = end + 1
+
+        modules_start = pos
+        modules_end = None
+        threads = {}
 
+        while pos <= n:
+            end = dump.find('\n', pos)
+            if end == -1:
+                end = n
+
+            # module list
+            if modules_end is None:
+                line = dump[pos:end].strip()
+                if line[0:7] == 'Module|':
+                    pass
+                elif len(line) == 0:
+                    modules_end = pos
+                else:
+                    raise Exception('Invalid dump format')
+            # stacks
             else:
-                print 'UNHANDLED KEY: %s = %s' % ( k, v )
+                bar = dump.find('|', pos, end)
+                thread = dump[pos:end if bar == -1 else bar].strip()
 
-        if 'dump' in d:
-            dump = d['dump']
-            lines = dump.split('\n')
-
-            # TODO do stuff with these
-            os = lines[0]
-            cpu = lines[1]
-            crash = lines[2]
-
-            i = 3
-            mode = 0
-            while i < len(lines):
-                line = lines[i].strip()
-                i += 1
-
-                # module list
-                if mode == 0:
-                    if line[0:7] == 'Module|':
-                        self.modules.append(line.split('|'))
-                    elif len(line) == 0:
-                        mode = 1
-                    else:
-                        raise Exception('Invalid dump format')
-                # stacks
-                elif mode == 1:
-                    frame = line.split('|')
-                    frame = map(lambda s: s.strip(), frame)
-
-                    thread = str(frame[0])
-                    frame[1] = int(frame[1])
-
-                    if thread not in self.stacks:
-                        self.stacks[thread] = [frame]
-                    else:
-                        self.stacks[thread].append(frame)
+                spans = threads.get(thread, None)
+                if spans is None:
+                    threads[thread] = [[pos, end]]
+                elif spans[-1][1] + 1 == pos:
+                    spans[-1][1] = end
+                else:
+                    spans.append([pos, end])
+
+            pos = end + 1
+
+        if modules_end is None:
+            modules_end = n
+
+        self._modules_span = (modules_start, modules_end)
+        self._thread_spans = threads
+
+    def _parse_modules(self):
+        if self._dump is None:
+            return []
+
+        if self._thread_spans is None:
+            self._index_dump()
+
+        start, end = self._modules_span
+        return [Module(line.strip().split('|'))
+                for line in self._dump[start:end].split('\n') if line.strip()]
+
+    def _parse_thread(self, thread):
+        '''Parse the frames of a single thread from the dump.
+
+        Returns None if the thread has no frames.
+        '''
+        if self._thread_spans is None:
+            self._index_dump()
+
+        if thread in self._thread_stacks:
+            return self._thread_stacks[thread]
+
+        spans = self._thread_spans.get(thread, None)
+        if spans is None:
+            return None
+
+        stack = []
+        for start, end in spans:
+            for line in self._dump[start:end].split('\n'):
+                stack.append(Frame([f.strip() for f in line.strip().split('|')]))
+
+        self._thread_stacks[thread] = stack
+        return stack
+
+    def _parse_stacks(self):
+        if self._dump is None:
+            return {}
+
+        if self._thread_spans is None:
+            self._index_dump()
+
+        return dict((thread, self._parse_thread(thread))
+                    for thread in self._thread_spans)
 
     def has_signature(self, s):
         '''Returns whether the current crash has the specified signature'''
@@ -321,8 +851,25 @@ class CrashData(object):
 
     def has_stacks(self):
         '''Returns whether we have stacks for the current crash'''
+        if self._dump is not None:
+            if self._thread_spans is None:
+                self._index_dump()
+
+            return len(self._thread_spans) > 0
+
         return len(self.stacks) > 0
 
+    def get_stack(self, thread):
+        '''Returns the stack for a thread
+
+        Only the requested thread is parsed from the dump. Returns an array
+        of frames on success or None if stack not found.
+        '''
+        if self._dump is not None:
+            return self._parse_thread(thread)
+
+        return self.stacks.get(thread, None)
+
     def get_crashed_stack(self):
         '''Returns the stack for the crashed thread
 
@@ -330,10 +877,10 @@ class CrashData(object):
         '''
         thread = self.crashed_thread
 
-        if not thread or thread not in self.stacks:
+        if not thread:
             return None
 
-        return self.stacks[thread]
+        return self.get_stack(thread)
 
     def has_symbol_in_crashed_stack(self, s):
         '''Returns whether a specied string appears in the symbols for the
@@ -344,44 +891,162 @@ class CrashData(object):
             return False
 
         for frame in stack:
-            if frame[3].find(s) != -1:
+            if frame.symbol.find(s) != -1:
                 return True
 
         return False
 
 class DumpFetcher(object):
-    '''Utility class to fetch dumps from the server.'''
+    '''Utility class to fetch dumps from the server.
+
+    Dumps are fetched over up to concurrency persistent connections, each
+    driven by its own thread. Failed requests (connection errors and 5xx
+    responses) are retried with exponential backoff.
+    '''
 
-    def __init__(self, domain, is_secure=True):
+    def __init__(self, domain, is_secure=True, port=None, concurrency=1,
+                 retries=3, backoff=1.0):
         self.domain = domain
         self.is_secure = is_secure
+        self.port = port
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.backoff = backoff
 
-    def fetch_dumps(self, ids):
-        '''Fetch a set of dumps by ID'''
+    def _get_connection(self):
+        if self.is_secure:
+            return httplib.HTTPSConnection(self.domain, self.port or 443)
+        else:
+            return httplib.HTTPConnection(self.domain, self.port or 80)
 
-        def get_connection():
-            conn = None
-            if self.is_secure:
-                conn = httplib.HTTPSConnection(self.domain, 443)
-            else:
-                conn = httplib.HTTPConnection(self.domain, 80)
+    def _fetch(self, conn, id):
+        '''Fetch a single dump, retrying transient failures.
+
+        Returns a tuple of (connection, status, body). The connection is
+        the one to use for the next request; it is replaced after errors.
+        body is None unless status is 200. status is None if the server
+        could not be reached.
+        '''
+        status = None
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+
+            if conn is None:
+                conn = self._get_connection()
+
+            try:
+                conn.request('GET', '/dumps/%s.jsonz' % id)
+                response = conn.getresponse()
+
+                # Always drain the response so the connection can be reused.
+                body = response.read()
+                status = response.status
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                conn = None
+                continue
+
+            if response.will_close:
+                conn.close()
+                conn = None
+
+            if status == 200:
+                return conn, status, body
 
-            return conn
+            if status < 500:
+                break
 
+        return conn, status, None
+
+    def _put(self, results, result, stop):
+        '''Put a result unless the consumer stopped. Returns whether it was
+        put.'''
+        while not stop.is_set():
+            try:
+                results.put(result, timeout=0.1)
+                return True
+            except Full:
+                pass
+
+        return False
+
+    def _worker(self, ids, results, stop):
         conn = None
 
-        for id in ids:
-            if not conn:
-                conn = get_connection()
+        while not stop.is_set():
+            id = ids.get()
+            if id is None:
+                break
 
-            conn.request('GET', '/dumps/%s.jsonz' % id)
-            response = conn.getresponse()
+            conn, status, body = self._fetch(conn, id)
+            if not self._put(results, (id, status, body), stop):
+                break
+
+        if conn is not None:
+            conn.close()
+
+        self._put(results, None, stop)
+
+    def fetch_dumps(self, ids):
+        '''Fetch a set of dumps by ID
+
+        Yields (id, body) tuples. When fetching concurrently, they are
+        yielded in the order they complete.
+        '''
+        if self.concurrency == 1:
+            results = self._fetch_serial(ids)
+        else:
+            results = self._fetch_concurrent(ids)
 
-            if response.status != 200:
+        for id, status, body in results:
+            if status != 200:
                 # TODO don't print to stdout
-                print 'UUID not fetched: %s %d' % ( id, response.status )
-                conn = None
+                print 'UUID not fetched: %s %s' % ( id, status )
                 continue
 
-            yield (id, response.read())
+            yield (id, body)
+
+    def _fetch_serial(self, ids):
+        conn = None
+
+        for id in ids:
+            conn, status, body = self._fetch(conn, id)
+            yield (id, status, body)
+
+        if conn is not None:
+            conn.close()
+
+    def _fetch_concurrent(self, ids):
+        queue = Queue()
+        for id in ids:
+            queue.put(id)
+
+        # Bounded so fetched bodies can't pile up faster than they are
+        # consumed.
+        results = Queue(self.concurrency * 2)
+
+        # Set when the consumer stops iterating, so workers blocked on a
+        # full results queue give up instead of waiting forever.
+        stop = threading.Event()
+
+        workers = self.concurrency
+        for i in range(workers):
+            queue.put(None)
+
+            t = threading.Thread(target=self._worker,
+                                 args=(queue, results, stop))
+            t.daemon = True
+            t.start()
+
+        try:
+            while workers:
+                result = results.get()
+                if result is None:
+                    workers -= 1
+                    continue
 
+                yield result
+        finally:
+            stop.set()
@@ -0,0 +1,232 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+
+# This file contains compact sets of crash UUIDs, used to drop crashes seen
+# more than once.
+#
+# A Python set of UUID strings costs well over 100 bytes per UUID. UUIDSet
+# instead stores each UUID as 16 raw bytes in an open addressing hash table
+# held in a single bytearray. The table is kept at most half full and grows
+# fourfold, so it has 2 to 8 slots per UUID: 32 to 128 bytes, around 80 on
+# average. For runs too large even for that, BloomFilter answers
+# approximately in a couple of bytes per UUID, at the price of occasionally
+# treating a new UUID as seen.
+
+import math
+import struct
+
+from binascii import unhexlify
+from hashlib import md5
+
+KEY_SIZE = 16
+EMPTY_KEY = '\0' * KEY_SIZE
+
+# Most slots a UUIDSet allocates up front (4 MB), however large a capacity
+# it is given. Larger sets grow as keys are added.
+MAX_INITIAL_SLOTS = 1 << 18
+
+def uuid_key(uuid):
+    '''Returns the 16 byte key of a UUID string.
+
+    Strings that are not hex UUIDs are hashed to 16 bytes instead.
+    '''
+    if isinstance(uuid, unicode):
+        uuid = uuid.encode('utf-8')
+
+    try:
+        key = unhexlify(uuid.replace('-', ''))
+    except TypeError:
+        key = None
+
+    if key is None or len(key) != KEY_SIZE:
+        key = md5(uuid).digest()
+
+    return key
+
+class UUIDSet(object):
+    '''An exact set of 16 byte keys stored in a bytearray.
+
+    capacity is the number of keys expected. It sizes the initial table,
+    up to MAX_INITIAL_SLOTS.
+    '''
+
+    def __init__(self, capacity=1024):
+        size = 16
+        while size < capacity * 2 and size < MAX_INITIAL_SLOTS:
+            size <<= 1
+
+        self._table = bytearray(size * KEY_SIZE)
+        self._mask = size - 1
+        self._count = 0
+        self._has_empty_key = False
+
+    def __len__(self):
+        return self._count
+
+    def _insert(self, table, mask, key):
+        '''Insert a key into a table. Returns False if it was present.'''
+        i = hash(key) & mask
+
+        while True:
+            offset = i * KEY_SIZE
+            slot = table[offset:offset + KEY_SIZE]
+            if slot == key:
+                return False
+
+            if slot == EMPTY_KEY:
+                table[offset:offset + KEY_SIZE] = key
+                return True
+
+            i = (i + 1) & mask
+
+    def _grow(self):
+        old = self._table
+        # Growing is a Python loop over every slot, so grow by a lot.
+        size = (self._mask + 1) * 4
+        table = bytearray(size * KEY_SIZE)
+        mask = size - 1
+
+        data = str(old)
+        for offset in xrange(0, len(data), KEY_SIZE):
+            key = data[offset:offset + KEY_SIZE]
+            if key == EMPTY_KEY:
+                continue
+
+            i = hash(key) & mask
+            while table[i * KEY_SIZE] or \
+                  table[i * KEY_SIZE:(i + 1) * KEY_SIZE] != EMPTY_KEY:
+                i = (i + 1) & mask
+
+            table[i * KEY_SIZE:(i + 1) * KEY_SIZE] = key
+
+        self._table = table
+        self._mask = mask
+
+    def add(self, key):
+        '''Add a key. Returns whether it was new.'''
+        # The all zero key marks empty slots, so it is tracked separately.
+        if key == EMPTY_KEY:
+            if self._has_empty_key:
+                return False
+
+            self._has_empty_key = True
+            self._count += 1
+            return True
+
+        if not self._insert(self._table, self._mask, key):
+            return False
+
+        self._count += 1
+        if self._count * 2 > self._mask + 1:
+            self._grow()
+
+        return True
+
+class BloomFilter(object):
+    '''An approximate set of keys.
+
+    Sized so that after capacity keys, a new key is reported as already
+    present with probability error_rate.
+    '''
+
+    def __init__(self, capacity, error_rate=0.001):
+        bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.bits = max(bits, 64)
+        self.hashes = max(1, int(round(float(self.bits) / capacity * math.log(2))))
+        self._array = bytearray((self.bits + 7) // 8)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, key):
+        '''Add a key. Returns whether it was new, as far as can be told.'''
+        h1, h2 = struct.unpack('<QQ', md5(key).digest())
+        array = self._array
+        bits = self.bits
+
+        new = False
+        for i in xrange(self.hashes):
+            bit = (h1 + i * h2) % bits
+            byte = bit >> 3
+            mask = 1 << (bit & 7)
+            if not array[byte] & mask:
+                array[byte] |= mask
+                new = True
+
+        if new:
+            self._count += 1
+
+        return new
+
+class CrashDeduper(object):
+    '''Decides whether a crash should be counted.
+
+    Crashes with a UUID that was already accepted are dropped. If
+    drop_duplicate_of is True, crashes marked as a duplicate of another are
+    dropped too. If bloom_error_rate is given, UUIDs are remembered in a
+    BloomFilter of capacity, otherwise in a UUIDSet.
+    '''
+
+    def __init__(self, unique=True, drop_duplicate_of=False, capacity=1000000,
+                 bloom_error_rate=None):
+        self.unique = unique
+        self.drop_duplicate_of = drop_duplicate_of
+
+        if bloom_error_rate:
+            self.seen = BloomFilter(capacity, bloom_error_rate)
+        else:
+            self.seen = UUIDSet(capacity)
+
+        self.repeated = 0
+        self.duplicate_of = 0
+
+    def accept(self, crash):
+        '''Returns whether a crash should be counted. Crashes without a UUID
+        can't be told apart, so they are always counted.'''
+        if self.drop_duplicate_of and getattr(crash, 'duplicate_of', None):
+            self.duplicate_of += 1
+            return False
+
+        uuid = getattr(crash, 'uuid', None)
+        if self.unique and uuid and not self.seen.add(uuid_key(uuid)):
+            self.repeated += 1
+            return False
+
+        return True
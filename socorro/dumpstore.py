@@ -0,0 +1,225 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+# This file contains a packed store for crash dumps.
+#
+# Storing every dump as its own .json file costs an inode and a directory
+# entry per crash. A DumpStore instead appends zlib compressed dumps to a
+# single pack file and records where each one is in an index file:
+#
+#   <path>       Sequence of records. Each is a struct header of (id length,
+#                data length), followed by the id and the compressed data.
+#   <path>.idx   One line per record: "<id> <offset> <length>\n", where
+#                offset and length locate the compressed data in the pack.
+#
+# Both files are only ever appended to. If the index is behind the pack (say
+# because a write was interrupted), the missing entries are recovered by
+# scanning the pack, and a truncated trailing record is discarded. A torn
+# last line of the index is cut off before anything is appended after it.
+
+import os
+import struct
+import zlib
+
+from os.path import exists, getsize
+
+RECORD_HEADER = struct.Struct('>HI')
+
+def read_dumps(path, locations):
+    '''Yields (id, dump) for (id, offset, length) locations in a pack.
+
+    Unlike DumpStore, this doesn't load the index, which makes it suitable
+    for workers handed a share of DumpStore.locations().
+    '''
+    with open(path, 'rb') as fh:
+        for id, offset, length in locations:
+            fh.seek(offset)
+            yield id, zlib.decompress(fh.read(length))
+
+class DumpStore(object):
+    '''An append-only store of compressed crash dumps keyed by UUID.
+
+    Opened with mode 'r', the store is read only. With mode 'a', the pack
+    is created if needed and add() can be used.
+    '''
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.index_path = path + '.idx'
+        self.mode = mode
+
+        # id -> (offset, length) of the compressed data
+        self.index = {}
+
+        # Size of the index file up to its last complete line
+        self.index_size = 0
+
+        if mode == 'a':
+            if not exists(path):
+                open(path, 'wb').close()
+
+            self.fh = open(path, 'r+b')
+        else:
+            self.fh = open(path, 'rb')
+
+        end = self._load_index()
+
+        if mode == 'a' and exists(self.index_path) and \
+           getsize(self.index_path) > self.index_size:
+            with open(self.index_path, 'r+b') as fh:
+                fh.truncate(self.index_size)
+
+        self._recover(end)
+
+        if mode == 'a':
+            self.index_fh = open(self.index_path, 'ab')
+
+    def _set(self, id, offset, length):
+        self.index[id] = (offset, length)
+
+    def _load_index(self):
+        '''Load the index file. Returns the pack offset it covers up to.'''
+        end = 0
+
+        if not exists(self.index_path):
+            return end
+
+        with open(self.index_path, 'rb') as fh:
+            for line in fh:
+                fields = line.split()
+                if len(fields) != 3 or not line.endswith('\n') or \
+                   not fields[1].isdigit() or not fields[2].isdigit():
+                    break
+
+                id, offset, length = fields[0], int(fields[1]), int(fields[2])
+                self._set(id, offset, length)
+                end = max(end, offset + length)
+                self.index_size += len(line)
+
+        return end
+
+    def _recover(self, end):
+        '''Index records written after end that are missing from the index.'''
+        size = getsize(self.path)
+        if end >= size:
+            return
+
+        recovered = []
+        self.fh.seek(end)
+        while end < size:
+            header = self.fh.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+
+            id_length, length = RECORD_HEADER.unpack(header)
+            id = self.fh.read(id_length)
+            offset = end + RECORD_HEADER.size + id_length
+
+            if offset + length > size:
+                break
+
+            self.fh.seek(length, os.SEEK_CUR)
+            self._set(id, offset, length)
+            recovered.append((id, offset, length))
+            end = offset + length
+
+        if self.mode != 'a':
+            return
+
+        # Drop any partially written record and bring the index up to date.
+        self.fh.truncate(end)
+        with open(self.index_path, 'ab') as fh:
+            for record in recovered:
+                fh.write('%s %d %d\n' % record)
+
+    def __contains__(self, id):
+        return id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def _read(self, offset, length):
+        self.fh.seek(offset)
+        return zlib.decompress(self.fh.read(length))
+
+    def get(self, id):
+        '''Returns the dump for an id or None if it is not in the store.'''
+        location = self.index.get(id, None)
+        if location is None:
+            return None
+
+        return self._read(*location)
+
+    def add(self, id, data):
+        '''Append a dump to the store. A later dump for the same id replaces
+        an earlier one.'''
+        blob = zlib.compress(data)
+
+        self.fh.seek(0, os.SEEK_END)
+        start = self.fh.tell()
+        self.fh.write(RECORD_HEADER.pack(len(id), len(blob)))
+        self.fh.write(id)
+        self.fh.write(blob)
+        self.fh.flush()
+
+        offset = start + RECORD_HEADER.size + len(id)
+        self._set(id, offset, len(blob))
+        self.index_fh.write('%s %d %d\n' % ( id, offset, len(blob) ))
+        self.index_fh.flush()
+
+    def locations(self):
+        '''Returns (id, offset, length) for every dump, in pack order.'''
+        return sorted(((id, offset, length)
+                       for id, (offset, length) in self.index.iteritems()),
+                      key=lambda l: l[1])
+
+    def read_locations(self, locations):
+        '''Yields (id, dump) for (id, offset, length) tuples.'''
+        for id, offset, length in locations:
+            yield id, self._read(offset, length)
+
+    def __iter__(self):
+        '''Yields (id, dump) for every dump with a single sequential pass
+        over the pack.'''
+        return self.read_locations(self.locations())
+
+    def close(self):
+        self.fh.close()
+
+        if self.mode == 'a':
+            self.index_fh.close()
@@ -0,0 +1,399 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+
+# This file contains the SQLite export behind parse_crashdata.py
+# --export-sqlite.
+#
+# Every exported crash becomes a row of the crashes table. Crashes read from
+# dumps also get a row in the frames table per frame of their crashed
+# thread, and a row in the modules table per loaded module. Dates are stored
+# as 'YYYY-MM-DD HH:MM:SS' text, and list fields (signature, cpu_info, bugs)
+# are joined back into text. Columns a source does not have are NULL.
+#
+# Each input file is recorded in the sources table with its size and
+# modification time, and with the filter it was exported under. Exporting
+# again skips unchanged files and replaces the rows of changed ones.
+#
+# Rows are inserted with executemany in batches. Each file is exported
+# under a savepoint, and the transaction is committed between files once a
+# batch worth of rows has been written, so a file is either fully exported
+# or not at all.
+# Indexes are created once loading is done, which is much faster than
+# maintaining them row by row on a fresh database.
+
+import os
+import sqlite3
+import time
+
+# Number of rows to insert per executemany call and, roughly, per
+# transaction.
+BATCH_SIZE = 20000
+
+# (column, SQL type) of the crashes table after id and source_id. Column
+# names are CrashData slots.
+CRASH_COLUMNS = [
+    ('uuid', 'TEXT'),
+    ('signature', 'TEXT'),
+    ('product', 'TEXT'),
+    ('version', 'TEXT'),
+    ('build', 'TEXT'),
+    ('build_date', 'TEXT'),
+    ('branch', 'TEXT'),
+    ('release_channel', 'TEXT'),
+    ('date_processed', 'TEXT'),
+    ('crash_date', 'TEXT'),
+    ('os_name', 'TEXT'),
+    ('os_version', 'TEXT'),
+    ('cpu_name', 'TEXT'),
+    ('cpu_info', 'TEXT'),
+    ('address', 'TEXT'),
+    ('reason', 'TEXT'),
+    ('crashed_thread', 'TEXT'),
+    ('process_type', 'TEXT'),
+    ('uptime', 'INTEGER'),
+    ('install_age', 'INTEGER'),
+    ('last_crash', 'TEXT'),
+    ('adu_count', 'TEXT'),
+    ('bugs', 'TEXT'),
+    ('duplicate_of', 'TEXT'),
+    ('hangid', 'TEXT'),
+    ('plugin_filename', 'TEXT'),
+    ('plugin_name', 'TEXT'),
+    ('plugin_version', 'TEXT'),
+    ('flash_version', 'TEXT'),
+    ('addons_checked', 'TEXT'),
+    ('topmost_filenames', 'TEXT'),
+    ('distributor', 'TEXT'),
+    ('distributor_version', 'TEXT'),
+    ('app_notes', 'TEXT'),
+    ('user_comments', 'TEXT'),
+]
+
+FRAME_COLUMNS = ['frame_index', 'module', 'symbol', 'source', 'line', 'offset']
+
+MODULE_COLUMNS = ['filename', 'version', 'debug_file', 'debug_id',
+                  'base_address', 'max_address', 'is_main']
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS sources (
+        id INTEGER PRIMARY KEY,
+        path TEXT,
+        size INTEGER,
+        mtime REAL,
+        filter TEXT,
+        rows INTEGER,
+        exported TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS crashes (
+        id INTEGER PRIMARY KEY,
+        source_id INTEGER,
+        %s
+    )''' % ',\n        '.join('%s %s' % c for c in CRASH_COLUMNS),
+    '''CREATE TABLE IF NOT EXISTS frames (
+        crash_id INTEGER,
+        %s
+    )''' % ',\n        '.join(FRAME_COLUMNS),
+    '''CREATE TABLE IF NOT EXISTS modules (
+        crash_id INTEGER,
+        %s
+    )''' % ',\n        '.join(MODULE_COLUMNS),
+]
+
+INDEXES = [
+    'CREATE UNIQUE INDEX IF NOT EXISTS sources_path ON sources (path)',
+    'CREATE INDEX IF NOT EXISTS crashes_source_id ON crashes (source_id)',
+    'CREATE INDEX IF NOT EXISTS crashes_signature ON crashes (signature)',
+    'CREATE INDEX IF NOT EXISTS crashes_version ON crashes (version)',
+    'CREATE INDEX IF NOT EXISTS crashes_build_date ON crashes (build_date)',
+    'CREATE INDEX IF NOT EXISTS crashes_product ON crashes (product)',
+    'CREATE INDEX IF NOT EXISTS frames_crash_id ON frames (crash_id)',
+    'CREATE INDEX IF NOT EXISTS frames_symbol ON frames (symbol)',
+    'CREATE INDEX IF NOT EXISTS modules_crash_id ON modules (crash_id)',
+]
+
+# Settings for a bulk load by a single writer. WAL with synchronous off
+# survives the process dying (the last transactions are simply lost), not
+# the machine losing power.
+PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = OFF',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -262144',
+]
+
+def _join(v):
+    return ' | '.join(v)
+
+def _join_bugs(v):
+    return ','.join([str(b) for b in v])
+
+def _date(v):
+    return v.isoformat(' ')
+
+# Converters from CrashData values to SQLite values, for columns needing one.
+CONVERTERS = {
+    'signature': _join,
+    'cpu_info': _join,
+    'bugs': _join_bugs,
+    'build_date': _date,
+    'date_processed': _date,
+    'crash_date': _date,
+}
+
+class SQLiteExporter(object):
+    '''Writes crashes to a SQLite database.
+
+    Call begin_source() before the crashes of each input and end_source()
+    after them, add() for each crash, and close() when done.
+    '''
+
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+
+        # Transactions are managed explicitly.
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.text_factory = str
+
+        for pragma in PRAGMAS:
+            self.db.execute(pragma)
+
+        for statement in SCHEMA:
+            self.db.execute(statement)
+
+        self.next_id = self.db.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM crashes').fetchone()[0]
+
+        self.insert_crash = 'INSERT INTO crashes VALUES (%s)' % ', '.join(
+            ['?'] * (len(CRASH_COLUMNS) + 2))
+        self.insert_frame = 'INSERT INTO frames VALUES (%s)' % ', '.join(
+            ['?'] * (len(FRAME_COLUMNS) + 1))
+        self.insert_module = 'INSERT INTO modules VALUES (%s)' % ', '.join(
+            ['?'] * (len(MODULE_COLUMNS) + 1))
+
+        self.crashes = []
+        self.frames = []
+        self.modules = []
+
+        # decoder -> [(column, converter, whether the decoder provides it)]
+        self.plans = {}
+
+        self.source_id = None
+        self.source_rows = 0
+        self.in_transaction = False
+        self.uncommitted = 0
+
+        self.exported = 0
+        self.sources_exported = 0
+        self.sources_skipped = 0
+
+    def _source(self, path):
+        return self.db.execute('SELECT id, size, mtime, filter FROM sources WHERE path = ?',
+                               (path,)).fetchone()
+
+    def is_current(self, path, filter_key):
+        '''Returns whether a file was already exported, unchanged, under the
+        same filter.'''
+        path = os.path.abspath(path)
+        row = self._source(path)
+        if row is None:
+            return False
+
+        st = os.stat(path)
+        return (row[1], row[2], row[3]) == (st.st_size, st.st_mtime, filter_key)
+
+    def begin_source(self, path, filter_key=None):
+        '''Start exporting an input, replacing anything previously exported
+        from it.
+
+        path is None for stdin, which is always exported as a new source.
+        Its path is stored as NULL, so any number of stdin sources can sit
+        alongside each other under the unique index on path.
+        '''
+        if not self.in_transaction:
+            self.db.execute('BEGIN')
+            self.in_transaction = True
+
+        self.db.execute('SAVEPOINT source')
+
+        size = mtime = None
+        if path is not None:
+            path = os.path.abspath(path)
+            st = os.stat(path)
+            size, mtime = st.st_size, st.st_mtime
+
+            old = self._source(path)
+            if old is not None:
+                self._delete_source(old[0])
+
+        cursor = self.db.execute('INSERT INTO sources (path, size, mtime, filter, rows, exported) VALUES (?, ?, ?, ?, 0, ?)',
+                                 (path, size, mtime, filter_key,
+                                  time.strftime('%Y-%m-%d %H:%M:%S')))
+        self.source_id = cursor.lastrowid
+        self.source_rows = 0
+
+    def _delete_source(self, source_id):
+        ids = '(SELECT id FROM crashes WHERE source_id = ?)'
+        self.db.execute('DELETE FROM frames WHERE crash_id IN %s' % ids, (source_id,))
+        self.db.execute('DELETE FROM modules WHERE crash_id IN %s' % ids, (source_id,))
+        self.db.execute('DELETE FROM crashes WHERE source_id = ?', (source_id,))
+        self.db.execute('DELETE FROM sources WHERE id = ?', (source_id,))
+
+    def _plan(self, decoder):
+        plan = self.plans.get(decoder, None)
+        if plan is None:
+            slots = decoder.slots if decoder is not None else None
+            plan = [(name, CONVERTERS.get(name, None),
+                     slots is None or name in slots)
+                    for name, kind in CRASH_COLUMNS]
+            self.plans[decoder] = plan
+
+        return plan
+
+    def _crash_row(self, crash, id):
+        '''Returns the crashes table row for a crash.
+
+        Lazy crashes have every column their source provides loaded directly
+        from their decoder, which is much cheaper than faulting each one in
+        through attribute access. Values that fail to convert are stored as
+        NULL.
+        '''
+        decoder = crash._decoder
+        load = decoder.load if decoder is not None else None
+        row = [id, self.source_id]
+
+        for name, converter, provided in self._plan(decoder):
+            if not provided:
+                row.append(None)
+                continue
+
+            try:
+                if load is not None:
+                    load(crash, name)
+
+                v = getattr(crash, name, None)
+                if v is not None and converter is not None:
+                    v = converter(v)
+            except (TypeError, ValueError):
+                v = None
+
+            row.append(v)
+
+        return row
+
+    def add(self, crash):
+        '''Queue a crash for insertion.'''
+        id = self.next_id
+        row = self._crash_row(crash, id)
+
+        # Dumps are parsed before anything is queued, so a crash with a
+        # broken dump is skipped whole.
+        frames = modules = ()
+        if crash._dump is not None:
+            frames = [(id, f.index, f.module, f.symbol, f.source, f.line,
+                       f.offset) for f in crash.get_crashed_stack() or ()]
+            modules = [(id, m.filename, m.version, m.debug_file, m.debug_id,
+                        m.base_address, m.max_address, m.is_main)
+                       for m in crash.modules]
+
+        self.next_id += 1
+        self.crashes.append(row)
+        self.frames.extend(frames)
+        self.modules.extend(modules)
+        self.source_rows += 1
+
+        if len(self.crashes) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self.crashes:
+            self.db.executemany(self.insert_crash, self.crashes)
+            self.uncommitted += len(self.crashes)
+            self.crashes = []
+
+        if self.frames:
+            self.db.executemany(self.insert_frame, self.frames)
+            self.frames = []
+
+        if self.modules:
+            self.db.executemany(self.insert_module, self.modules)
+            self.modules = []
+
+    def end_source(self):
+        '''Finish the current input. Its rows are committed once enough rows
+        have accumulated.'''
+        self._flush()
+
+        self.db.execute('UPDATE sources SET rows = ? WHERE id = ?',
+                        (self.source_rows, self.source_id))
+        self.db.execute('RELEASE source')
+        self.exported += self.source_rows
+        self.sources_exported += 1
+        self.source_id = None
+
+        if self.uncommitted >= self.batch_size:
+            self._commit()
+
+    def _commit(self):
+        if self.in_transaction:
+            self.db.execute('COMMIT')
+            self.in_transaction = False
+
+        self.uncommitted = 0
+
+    def close(self):
+        '''Commit, build indexes and close the database.
+
+        An input left unfinished (begin_source() without end_source()) is
+        rolled back.
+        '''
+        if self.source_id is not None:
+            self.crashes = []
+            self.frames = []
+            self.modules = []
+            self.db.execute('ROLLBACK TO source')
+            self.db.execute('RELEASE source')
+            self.source_id = None
+
+        self._commit()
+
+        for statement in INDEXES:
+            self.db.execute(statement)
+
+        self.db.execute('ANALYZE')
+        self.db.close()
@@ -0,0 +1,547 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+
+# This file contains the filter expression language behind
+# parse_crashdata.py --where.
+#
+# An expression is a boolean combination of field comparisons:
+#
+#   product = Firefox and (version in (5.0, 6.0) or release_channel != beta)
+#   uptime < 60 and date_processed >= 2011-07-01 and signature ~ memcpy
+#
+# Fields are CrashData attributes, plus "stack", which matches symbols in
+# the crashed thread's stack. Values are bare words or quoted strings and
+# are converted to the field's type when the expression is compiled.
+#
+# Operators are = != < <= > >= in, ~ (contains) and !~ (does not contain).
+# Fields split on " | " (signature, cpu_info) match ~ against each component
+# and = against the whole string. A date without a time matches the whole
+# day with =.
+#
+# Compiling produces a single predicate. Operands of "and" and "or" are
+# reordered by estimated cost, so plain column comparisons run before
+# signature matching and both run before stacks are parsed.
+
+import re
+
+from datetime import datetime, timedelta
+
+from socorro.crashdata import FIELDS, HOOKS
+
+class ExpressionError(Exception):
+    '''Raised when a filter expression is invalid.'''
+
+# Field kinds that differ from a plain string.
+FIELD_KINDS = {
+    'bugs': 'bugs',
+    'build_date': 'date',
+    'completed_date': 'date',
+    'cpu_info': 'pipes',
+    'crash_date': 'date',
+    'date_processed': 'date',
+    'install_age': 'int',
+    'signature': 'pipes',
+    'started_time': 'date',
+    'uptime': 'int',
+}
+
+# Operators valid for each kind of field.
+KIND_OPERATORS = {
+    'str': set(['=', '!=', '<', '<=', '>', '>=', '~', '!~', 'in']),
+    'int': set(['=', '!=', '<', '<=', '>', '>=', 'in']),
+    'date': set(['=', '!=', '<', '<=', '>', '>=']),
+    'pipes': set(['=', '!=', '~', '!~', 'in']),
+    'bugs': set(['=', '!=', 'in']),
+    'stack': set(['~', '!~']),
+}
+
+# Relative cost of evaluating a comparison on each kind of field. Stacks
+# mean parsing the dump, so they dwarf everything else.
+KIND_COSTS = {
+    'str': 1,
+    'int': 1,
+    'bugs': 2,
+    'date': 2,
+    'pipes': 3,
+    'stack': 100,
+}
+
+DATE_FORMATS = (
+    ('%Y-%m-%d %H:%M:%S', False),
+    ('%Y-%m-%d %H:%M', False),
+    ('%Y%m%d%H%M', False),
+    ('%Y-%m-%d', True),
+)
+
+KEYWORDS = set(['and', 'or', 'not', 'in'])
+
+_TOKEN = re.compile(r'''\s*(?:
+    (?P<op><=|>=|!=|!~|==|=|<|>|~) |
+    (?P<punct>[(),]) |
+    '(?P<sq>[^']*)' |
+    "(?P<dq>[^"]*)" |
+    (?P<word>[^\s()=!<>~,'"]+)
+)''', re.VERBOSE)
+
+def field_kind(field):
+    '''Returns the kind of a field or None if it is unknown.'''
+    if field == 'stack':
+        return 'stack'
+
+    if field in FIELD_KINDS:
+        return FIELD_KINDS[field]
+
+    for slot, converter in FIELDS.itervalues():
+        if slot == field:
+            return 'str'
+
+    for hook, slots in HOOKS.itervalues():
+        if field in slots:
+            return 'str'
+
+    return None
+
+def _tokenize(text):
+    '''Returns a list of (type, value, start, end) tuples.
+
+    type is one of 'op', 'punct', 'keyword', 'string' or 'word'.
+    '''
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if m is None:
+            raise ExpressionError('Unexpected character at %d: %s' % (
+                pos, text[pos:].lstrip()[:20]))
+
+        start = m.start(m.lastgroup)
+        kind = m.lastgroup
+        value = m.group(kind)
+
+        if kind in ('sq', 'dq'):
+            kind = 'string'
+            start -= 1
+        elif kind == 'op' and value == '==':
+            value = '='
+        elif kind == 'word' and value.lower() in KEYWORDS:
+            kind = 'keyword'
+            value = value.lower()
+
+        tokens.append((kind, value, start, m.end()))
+        pos = m.end()
+
+    return tokens
+
+def _parse_date(value):
+    '''Returns (datetime, is whole day).'''
+    for format, whole_day in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, format), whole_day
+        except ValueError:
+            pass
+
+    raise ExpressionError('Not a date: %s' % value)
+
+class Node(object):
+    '''Base class of parsed expression nodes.'''
+
+    text = None
+    cost = 0
+
+    def conjuncts(self):
+        '''Returns the nodes that must all be true for this one to be.'''
+        return [self]
+
+    def needle(self):
+        '''Returns a string the raw field must contain for a match or None.'''
+        return None
+
+    def columns(self):
+        '''Returns the CSV columns a needle() applies to.'''
+        return []
+
+class Comparison(Node):
+    '''A comparison of a field against a value or list of values.'''
+
+    def __init__(self, field, op, value, text=None):
+        kind = field_kind(field)
+        if kind is None:
+            raise ExpressionError('Unknown field: %s' % field)
+
+        if op not in KIND_OPERATORS[kind]:
+            raise ExpressionError('Operator %s cannot be used with %s' % (
+                op, field))
+
+        self.field = field
+        self.op = op
+        self.kind = kind
+        self.cost = KIND_COSTS[kind]
+        self.text = text or '%s %s %s' % (field, op, value)
+
+        self.whole_day = False
+        if op == 'in':
+            self.value = [self._convert(v) for v in value]
+        else:
+            self.value = self._convert(value)
+
+    def _convert(self, value):
+        if self.kind in ('int', 'bugs'):
+            try:
+                return int(value)
+            except ValueError:
+                raise ExpressionError('Not an integer: %s' % value)
+
+        if self.kind == 'date':
+            value, self.whole_day = _parse_date(value)
+
+        return value
+
+    def columns(self):
+        if self.kind not in ('str', 'pipes'):
+            return []
+
+        for hook, slots in HOOKS.itervalues():
+            if self.field in slots:
+                return []
+
+        if self.field in FIELDS and FIELDS[self.field][0] == self.field:
+            return [self.field]
+
+        return []
+
+    def needle(self):
+        if self.kind in ('str', 'pipes', 'stack') and self.op in ('=', '~'):
+            return self.value or None
+
+        return None
+
+    def compile(self):
+        op = self.op
+        if op in ('!=', '!~'):
+            test = self._compile_positive(op[1])
+            return lambda crash: not test(crash)
+
+        return self._compile_positive(op)
+
+    def _compile_positive(self, op):
+        field = self.field
+        kind = self.kind
+        value = self.value
+
+        if kind == 'stack':
+            return lambda crash: crash.has_symbol_in_crashed_stack(value)
+
+        if kind == 'pipes':
+            if op == '~':
+                def test(crash):
+                    v = getattr(crash, field, None)
+                    if v is None:
+                        return False
+
+                    for component in v:
+                        if value in component:
+                            return True
+
+                    return False
+
+                return test
+
+            if op == 'in':
+                values = set(value)
+            else:
+                values = set([value])
+
+            def test(crash):
+                v = getattr(crash, field, None)
+                return v is not None and ' | '.join(v) in values
+
+            return test
+
+        if kind == 'bugs':
+            if op == 'in':
+                values = set(value)
+            else:
+                values = set([value])
+
+            def test(crash):
+                v = getattr(crash, field, None)
+                if v is None:
+                    return False
+
+                for bug in v:
+                    if bug in values:
+                        return True
+
+                return False
+
+            return test
+
+        if op == 'in':
+            values = set(value)
+
+            return lambda crash: getattr(crash, field, None) in values
+
+        if op == '~':
+            def test(crash):
+                v = getattr(crash, field, None)
+                return v is not None and value in v
+
+            return test
+
+        if op == '=' and self.whole_day:
+            end = value + timedelta(days=1)
+
+            def test(crash):
+                v = getattr(crash, field, None)
+                return v is not None and value <= v < end
+
+            return test
+
+        # None compares less than everything in Python 2, so it has to be
+        # excluded explicitly.
+        if op == '=':
+            return lambda crash: getattr(crash, field, None) == value
+        if op == '<':
+            def test(crash):
+                v = getattr(crash, field, None)
+                return v is not None and v < value
+        elif op == '<=':
+            def test(crash):
+                v = getattr(crash, field, None)
+                return v is not None and v <= value
+        elif op == '>':
+            def test(crash):
+                v = getattr(crash, field, None)
+                return v is not None and v > value
+        elif op == '>=':
+            def test(crash):
+                v = getattr(crash, field, None)
+                return v is not None and v >= value
+
+        return test
+
+class Not(Node):
+    def __init__(self, child, text=None):
+        self.child = child
+        self.cost = child.cost
+        self.text = text or 'not %s' % child.text
+
+    def compile(self):
+        test = self.child.compile()
+        return lambda crash: not test(crash)
+
+class And(Node):
+    '''Conjunction. Operands are evaluated cheapest first.'''
+
+    def __init__(self, children, text=None):
+        flat = []
+        for child in children:
+            if isinstance(child, And):
+                flat.extend(child.children)
+            else:
+                flat.append(child)
+
+        # sort() is stable, so equally expensive operands keep their order.
+        flat.sort(key=lambda child: child.cost)
+
+        self.children = flat
+        self.cost = sum(child.cost for child in flat)
+        self.text = text or ' and '.join('(%s)' % c.text for c in flat)
+
+    def conjuncts(self):
+        return list(self.children)
+
+    def compile(self):
+        tests = [child.compile() for child in self.children]
+
+        def test(crash):
+            for t in tests:
+                if not t(crash):
+                    return False
+
+            return True
+
+        return test
+
+class Or(Node):
+    '''Disjunction. Operands are evaluated cheapest first.'''
+
+    def __init__(self, children, text=None):
+        flat = []
+        for child in children:
+            if isinstance(child, Or):
+                flat.extend(child.children)
+            else:
+                flat.append(child)
+
+        flat.sort(key=lambda child: child.cost)
+
+        self.children = flat
+        self.cost = sum(child.cost for child in flat)
+        self.text = text or ' or '.join('(%s)' % c.text for c in flat)
+
+    def compile(self):
+        tests = [child.compile() for child in self.children]
+
+        def test(crash):
+            for t in tests:
+                if t(crash):
+                    return True
+
+            return False
+
+        return test
+
+class _Parser(object):
+    '''Recursive descent parser for filter expressions.'''
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise ExpressionError('Empty expression')
+
+        node = self._or()
+        if self.pos < len(self.tokens):
+            raise ExpressionError('Unexpected %s at %d' % (
+                self.tokens[self.pos][1], self.tokens[self.pos][2]))
+
+        return node
+
+    def _peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+
+        return (None, None, len(self.text), len(self.text))
+
+    def _take(self, kind=None, value=None):
+        token = self._peek()
+        if token[0] is None:
+            raise ExpressionError('Unexpected end of expression')
+
+        if (kind is not None and token[0] != kind) or \
+           (value is not None and token[1] != value):
+            raise ExpressionError('Expected %s at %d, found %s' % (
+                value or kind, token[2], token[1]))
+
+        self.pos += 1
+        return token
+
+    def _text(self, start):
+        return self.text[start:self.tokens[self.pos - 1][3]]
+
+    def _or(self):
+        start = self._peek()[2]
+        children = [self._and()]
+        while self._peek()[:2] == ('keyword', 'or'):
+            self.pos += 1
+            children.append(self._and())
+
+        if len(children) == 1:
+            return children[0]
+
+        return Or(children, self._text(start))
+
+    def _and(self):
+        start = self._peek()[2]
+        children = [self._not()]
+        while self._peek()[:2] == ('keyword', 'and'):
+            self.pos += 1
+            children.append(self._not())
+
+        if len(children) == 1:
+            return children[0]
+
+        return And(children, self._text(start))
+
+    def _not(self):
+        start = self._peek()[2]
+        if self._peek()[:2] == ('keyword', 'not'):
+            self.pos += 1
+            child = self._not()
+            return Not(child, self._text(start))
+
+        if self._peek()[:2] == ('punct', '('):
+            self.pos += 1
+            node = self._or()
+            self._take('punct', ')')
+            return node
+
+        return self._comparison()
+
+    def _value(self):
+        kind, value, start, end = self._peek()
+        if kind not in ('word', 'string'):
+            raise ExpressionError('Expected a value at %d' % start)
+
+        self.pos += 1
+        return value
+
+    def _comparison(self):
+        start = self._peek()[2]
+        field = self._take('word')[1]
+
+        kind, op, op_start, op_end = self._peek()
+        if kind == 'op':
+            self.pos += 1
+            value = self._value()
+        elif (kind, op) == ('keyword', 'in'):
+            self.pos += 1
+            self._take('punct', '(')
+            value = [self._value()]
+            while self._peek()[:2] == ('punct', ','):
+                self.pos += 1
+                value.append(self._value())
+            self._take('punct', ')')
+        else:
+            raise ExpressionError('Expected an operator after %s' % field)
+
+        return Comparison(field, op, value, self._text(start))
+
+def parse_expression(text):
+    '''Parse a filter expression into a tree of nodes.
+
+    Raises ExpressionError if the expression is invalid.
+    '''
+    return _Parser(text).parse()
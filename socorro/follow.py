@@ -0,0 +1,269 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+
+# This file contains the pieces of parse_crashdata.py --follow, which
+# watches a live feed of crashes instead of reading a fixed set of files.
+#
+# Crashes are counted over a sliding window of date_processed time. The
+# window is cut into buckets of a fixed number of seconds. Each bucket keeps
+# its own counts and the window keeps their sum, so expiring a bucket is a
+# subtraction and memory is bounded by the keys seen within the window.
+# Likewise, a followed directory only remembers the files it has read that
+# are within the window of the newest one.
+
+import calendar
+import os
+import time
+
+from os.path import join
+from sys import stdout
+
+class SlidingWindowCounter(object):
+    '''Counts keys over the last window seconds of event time.
+
+    Time only moves forward: the end of the window is the latest timestamp
+    added. Events older than the start of the window are ignored.
+    '''
+
+    def __init__(self, window=3600, bucket=60):
+        self.window = window
+        self.bucket = bucket
+
+        self.end = None
+        self.totals = {}
+        self.late = 0
+
+        # bucket start -> {key: count}
+        self._buckets = {}
+
+    def _expire(self):
+        cutoff = self.end - self.window
+        totals = self.totals
+
+        for start in [s for s in self._buckets if s + self.bucket <= cutoff]:
+            for key, n in self._buckets.pop(start).iteritems():
+                remaining = totals[key] - n
+                if remaining:
+                    totals[key] = remaining
+                else:
+                    del totals[key]
+
+    def advance(self, timestamp):
+        '''Move the end of the window to timestamp if it is later.'''
+        if self.end is None or timestamp > self.end:
+            self.end = timestamp
+            self._expire()
+
+    def add(self, timestamp, key, n=1):
+        self.advance(timestamp)
+
+        if timestamp <= self.end - self.window:
+            self.late += n
+            return
+
+        start = timestamp - timestamp % self.bucket
+        counts = self._buckets.get(start, None)
+        if counts is None:
+            counts = self._buckets[start] = {}
+
+        counts[key] = counts.get(key, 0) + n
+        self.totals[key] = self.totals.get(key, 0) + n
+
+    def top(self, n=None):
+        '''Returns (key, count) items, largest count first.'''
+        items = sorted(self.totals.iteritems(),
+                       key=lambda item: (-item[1], item[0]))
+
+        return items if n is None else items[:n]
+
+class WindowedCounts(object):
+    '''Version, signature and frame counts over a sliding window.
+
+    Crashes without a valid date_processed are not counted, only tallied
+    in undated.
+    '''
+
+    def __init__(self, window=3600, bucket=60):
+        self.window = window
+        self.crashes = SlidingWindowCounter(window, bucket)
+        self.versions = SlidingWindowCounter(window, bucket)
+        self.signatures = SlidingWindowCounter(window, bucket)
+        self.frames = SlidingWindowCounter(window, bucket)
+
+        self.undated = 0
+
+        self._last_date = None
+        self._last_timestamp = None
+
+    def _timestamp(self, date):
+        # Consecutive rows are usually processed in the same minute.
+        if date != self._last_date:
+            self._last_date = date
+            self._last_timestamp = calendar.timegm(date.utctimetuple())
+
+        return self._last_timestamp
+
+    def add(self, crash):
+        '''Count a crash. Returns False if it has no valid date.'''
+        try:
+            t = self._timestamp(crash.date_processed)
+        except (AttributeError, TypeError, ValueError):
+            self.undated += 1
+            return False
+
+        self.crashes.add(t, None)
+        self.versions.add(t, crash.version)
+        self.signatures.add(t, ' | '.join(crash.signature))
+
+        if crash.has_stacks():
+            stack = crash.get_crashed_stack()
+            if stack:
+                for frame in stack:
+                    self.frames.add(t, frame.symbol)
+
+        return True
+
+    def print_snapshot(self, fh=stdout, top=None):
+        '''Print the current counts.
+
+        A header line gives the window, followed by lines of report name,
+        count and key.
+        '''
+        end = self.crashes.end
+        if end is None:
+            return
+
+        print >>fh, '== %s - %s\t%d crashes\t%d late\t%d undated' % (
+            time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(end - self.window)),
+            time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(end)),
+            self.crashes.totals.get(None, 0), self.crashes.late, self.undated )
+
+        for name, counter, n in (('version', self.versions, None),
+                                 ('signature', self.signatures, top),
+                                 ('frame', self.frames, top)):
+            for key, count in counter.top(n):
+                print >>fh, '%s\t%d\t%s' % ( name, count, key )
+
+        fh.flush()
+
+def follow_lines(fh, poll_interval=1.0, on_idle=None):
+    '''Yields complete lines from a file as they are appended to it.
+
+    At end of file, on_idle is called and the file polled again after
+    poll_interval seconds. A pipe that is closed ends the lines.
+    '''
+    pending = ''
+    is_file = os.path.isfile(getattr(fh, 'name', ''))
+
+    while True:
+        line = fh.readline()
+
+        if not line:
+            if not is_file:
+                break
+
+            if on_idle is not None:
+                on_idle()
+
+            time.sleep(poll_interval)
+            continue
+
+        if line[-1] != '\n' and is_file:
+            # The writer is mid-line. Wait for the rest of it.
+            pending += line
+            continue
+
+        yield pending + line
+        pending = ''
+
+    if pending:
+        yield pending
+
+def follow_json_dir(directory, poll_interval=1.0, on_idle=None, settle=1.0,
+                    horizon=None):
+    '''Yields (filename, JSON text) for .json files as they appear in a
+    directory, oldest first.
+
+    Files modified within the last settle seconds may still be being
+    written, so they are left for a later poll. If horizon is given, files
+    modified more than horizon seconds before the newest file found are
+    skipped, and files read are forgotten once they fall that far behind.
+    '''
+    # name -> mtime of the files read, and the newest mtime found
+    seen = {}
+    newest = None
+
+    while True:
+        names = [p for p in os.listdir(directory)
+                 if p[-5:] == '.json' and p not in seen]
+
+        now = time.time()
+        paths = []
+        for name in names:
+            path = join(directory, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+
+            if now - mtime >= settle:
+                paths.append((mtime, name, path))
+
+        paths.sort()
+
+        if horizon is not None and paths:
+            if newest is None or paths[-1][0] > newest:
+                newest = paths[-1][0]
+
+            paths = [p for p in paths if p[0] >= newest - horizon]
+
+        for mtime, name, path in paths:
+            seen[name] = mtime
+            with open(path, 'rb') as fh:
+                yield path, fh.read()
+
+        if horizon is not None and newest is not None:
+            cutoff = newest - horizon
+            for name in [n for n, m in seen.iteritems() if m < cutoff]:
+                del seen[name]
+
+        if on_idle is not None:
+            on_idle()
+
+        time.sleep(poll_interval)
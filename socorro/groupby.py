@@ -0,0 +1,334 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+
+# This file contains the counting engine behind parse_crashdata.py
+# --group-by, which counts crashes by any combination of fields, e.g.
+# version,os_name,build_date.
+#
+# Rather than hashing a tuple of values per crash, each field's values are
+# encoded to small integer codes as crashes arrive, and the codes of a batch
+# of crashes are counted at once. With NumPy, a batch costs a few array
+# operations: the codes are combined into one integer per crash (as digits
+# of a mixed radix number) and counted with bincount, or with unique when
+# the space of combinations is too large for a dense count. Only the
+# combinations present in a batch are then decoded back to values.
+#
+# Crashes read from a columnar cache (see socorro.cache) are not decoded at
+# all for fields the cache stores dictionary encoded: only their row numbers
+# are kept, and at flush time each such field's codes are looked up for the
+# whole batch from the cache's column and translated to the counter's codes
+# through a table built once per cache.
+#
+# NumPy is optional. Without it, batches are counted with a dict.
+
+import heapq
+
+from array import array
+from itertools import izip
+
+from socorro.cache import CrashDataCache
+from socorro.expression import field_kind
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Number of crashes encoded before their codes are counted.
+BATCH_SIZE = 65536
+
+# Combination spaces up to this size (or the batch size, if larger) are
+# counted densely with bincount.
+DENSE_LIMIT = 1 << 20
+
+# Combined codes must fit a signed 64 bit integer.
+MAX_COMBINATIONS = 1 << 62
+
+class GroupByError(Exception):
+    '''Raised for an invalid list of fields to group by.'''
+
+def _join(v):
+    return ' | '.join(v)
+
+def _join_bugs(v):
+    return ','.join([str(b) for b in v])
+
+# Converters for field kinds whose values are lists.
+KIND_CONVERTERS = {
+    'pipes': _join,
+    'bugs': _join_bugs,
+}
+
+def parse_group_by(text):
+    '''Returns the tuple of field names in a comma separated list.'''
+    fields = tuple([f.strip() for f in text.split(',') if f.strip()])
+    if not fields:
+        raise GroupByError('No fields to group by')
+
+    for field in fields:
+        kind = field_kind(field)
+        if kind is None or kind == 'stack':
+            raise GroupByError('Unknown field: %s' % field)
+
+    if len(set(fields)) != len(fields):
+        raise GroupByError('Fields are repeated: %s' % text)
+
+    return fields
+
+def _sort_key(item):
+    # None sorts first and is never compared to other values.
+    return [(v is not None, v) for v in item[0]]
+
+def _format(v):
+    if v is None:
+        return ''
+
+    return str(v)
+
+class GroupCounter(object):
+    '''Counts crashes by the combined values of a tuple of fields.
+
+    counts maps tuples of values to crash counts. It only includes crashes
+    up to the last flush(); pending crashes are counted when a batch fills
+    up, before pickling and before printing.
+    '''
+
+    def __init__(self, fields, batch_size=BATCH_SIZE):
+        self.fields = tuple(fields)
+        self.batch_size = batch_size
+        self.counts = {}
+
+        # (field, converter, value -> code, code -> value, pending codes)
+        self.columns = [(f, KIND_CONVERTERS.get(field_kind(f), None), {}, [],
+                         array('l'))
+                        for f in self.fields]
+        self.pending = 0
+
+        # The decoder of the last crash added, and the cache pending crashes
+        # come from, if any.
+        self.decoder = None
+        self.source = None
+
+        # For a source, per column (cache codes, cache code -> code) or None
+        # if the field isn't dictionary encoded; the row numbers of pending
+        # crashes; and the columns to read from crashes.
+        self.encoded = [None] * len(self.columns)
+        self.rows = array('l')
+        self.decoded = self.columns
+
+    def __getstate__(self):
+        self.flush()
+
+        state = self.__dict__.copy()
+        state['decoder'] = None
+        state['source'] = None
+        state['encoded'] = [None] * len(self.columns)
+        state['decoded'] = self.columns
+        return state
+
+    def _code(self, codes, values, v):
+        code = codes.get(v, None)
+        if code is None:
+            code = codes[v] = len(values)
+            values.append(v)
+
+        return code
+
+    def _set_decoder(self, decoder):
+        self.decoder = decoder
+
+        source = decoder if isinstance(decoder, CrashDataCache) else None
+        if source is self.source:
+            return
+
+        self.flush()
+        self.source = source
+        self.encoded = [None] * len(self.columns)
+        self.decoded = self.columns
+        if source is None:
+            return
+
+        for i, (field, converter, codes, values, p) in enumerate(self.columns):
+            encoded = source.encoded(field)
+            if encoded is None:
+                continue
+
+            cache_codes, cache_values = encoded
+            translate = array('l')
+            for v in cache_values:
+                if v is not None and converter is not None:
+                    v = converter(v)
+
+                translate.append(self._code(codes, values, v))
+
+            if numpy is not None:
+                cache_codes = numpy.frombuffer(cache_codes, dtype=cache_codes.typecode)
+                translate = numpy.frombuffer(translate, dtype=numpy.int_)
+
+            self.encoded[i] = (cache_codes, translate)
+
+        self.decoded = [c for c, e in izip(self.columns, self.encoded)
+                        if e is None]
+
+    def add(self, crash):
+        decoder = getattr(crash, '_decoder', None)
+        if decoder is not self.decoder:
+            self._set_decoder(decoder)
+
+        if self.source is not None:
+            self.rows.append(crash._raw)
+
+        for field, converter, codes, values, pending in self.decoded:
+            v = getattr(crash, field, None)
+            if v is not None and converter is not None:
+                v = converter(v)
+
+            pending.append(self._code(codes, values, v))
+
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def _batches(self):
+        '''Returns the codes of the pending crashes for each column.'''
+        batches = []
+        for (f, c, codes, values, pending), encoded in izip(self.columns,
+                                                            self.encoded):
+            if encoded is None:
+                batches.append(pending)
+                continue
+
+            cache_codes, translate = encoded
+            if numpy is not None:
+                rows = numpy.frombuffer(self.rows, dtype=numpy.int_)
+                batches.append(translate[cache_codes[rows]])
+            else:
+                batches.append([translate[cache_codes[r]] for r in self.rows])
+
+        return batches
+
+    def flush(self):
+        '''Count the pending crashes.'''
+        if not self.pending:
+            return
+
+        batches = self._batches()
+        radixes = [len(values) for f, c, codes, values, p in self.columns]
+
+        combinations = 1
+        for radix in radixes:
+            combinations *= radix
+
+        if numpy is not None and combinations < MAX_COMBINATIONS:
+            groups = self._count_numpy(batches, radixes, combinations)
+        else:
+            groups = self._count_dict(batches)
+
+        counts = self.counts
+        lookups = [values for f, c, codes, values, p in self.columns]
+        for codes, n in groups:
+            key = tuple([lookup[code] for lookup, code in izip(lookups, codes)])
+            counts[key] = counts.get(key, 0) + n
+
+        for f, c, codes, values, pending in self.columns:
+            del pending[:]
+
+        del self.rows[:]
+        self.pending = 0
+
+    def _count_numpy(self, batches, radixes, combinations):
+        '''Returns (codes, count) pairs for batches of codes.'''
+        combined = None
+        for batch, radix in izip(batches, radixes):
+            if isinstance(batch, array):
+                batch = numpy.frombuffer(batch, dtype=numpy.int_)
+
+            a = batch.astype(numpy.int64)
+            if combined is None:
+                combined = a
+            else:
+                combined *= radix
+                combined += a
+
+        if combinations <= max(DENSE_LIMIT, len(combined)):
+            counts = numpy.bincount(combined)
+            keys = numpy.flatnonzero(counts)
+            counts = counts[keys]
+        else:
+            keys, counts = numpy.unique(combined, return_counts=True)
+
+        # Peel the per-field codes back off, last field first.
+        digits = [None] * len(radixes)
+        for i in range(len(radixes) - 1, 0, -1):
+            digits[i] = (keys % radixes[i]).tolist()
+            keys = keys // radixes[i]
+        digits[0] = keys.tolist()
+
+        return izip(izip(*digits), counts.tolist())
+
+    def _count_dict(self, batches):
+        '''Returns (codes, count) pairs for batches of codes.'''
+        counts = {}
+        for codes in izip(*batches):
+            counts[codes] = counts.get(codes, 0) + 1
+
+        return counts.iteritems()
+
+    def merge(self, other):
+        '''Add the counts of another GroupCounter for the same fields.'''
+        other.flush()
+
+        counts = self.counts
+        for k, v in other.counts.iteritems():
+            counts[k] = counts.get(k, 0) + v
+
+    def items(self, top=None):
+        '''Returns (values, count) pairs sorted by values, or the top most
+        frequent sorted by count.'''
+        self.flush()
+
+        if top is None:
+            return sorted(self.counts.iteritems(), key=_sort_key)
+
+        return heapq.nsmallest(top, self.counts.iteritems(),
+                               key=lambda item: (-item[1], _sort_key(item)))
+
+    def print_counts(self, fh, top=None):
+        for values, count in self.items(top):
+            print >>fh, '%d\t%s' % ( count, '\t'.join([_format(v) for v in values]) )
@@ -0,0 +1,104 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+
+# This file contains a bounded memo for field conversions.
+#
+# Values like build_date, version and signature repeat across thousands of
+# rows of a daily file. Remembering the result of converting each raw string
+# saves the conversion (strptime is particularly slow) and makes every crash
+# with the same raw value share one converted object, which matters when
+# many crashes are kept in memory.
+
+_MISSING = object()
+
+# Default number of values each memo remembers.
+MEMO_CAPACITY = 16384
+
+class LRUMemo(object):
+    '''Remembers the results of a conversion, keyed on its input.
+
+    At most capacity results are kept. Eviction approximates least recently
+    used with two generations: results are entered in the current
+    generation, and when it is full the previous generation is discarded
+    and the current one takes its place. A result used again while in the
+    previous generation is carried into the current one, so only results
+    unused for a whole generation are evicted. This costs one or two dict
+    lookups per call, where a linked list LRU would cost more than most of
+    the conversions it saves.
+
+    Results are shared between callers, so they must not be modified.
+    Inputs the conversion rejects are not remembered; the exception is
+    raised each time.
+    '''
+
+    def __init__(self, converter, name=None, capacity=MEMO_CAPACITY):
+        self.converter = converter
+        self.name = name or converter.__name__
+        self.generation_size = max(1, capacity / 2)
+
+        self.current = {}
+        self.previous = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, v):
+        result = self.current.get(v, _MISSING)
+        if result is not _MISSING:
+            self.hits += 1
+            return result
+
+        result = self.previous.get(v, _MISSING)
+        if result is _MISSING:
+            self.misses += 1
+            result = self.converter(v)
+        else:
+            self.hits += 1
+
+        current = self.current
+        if len(current) >= self.generation_size:
+            self.previous = current
+            self.current = current = {}
+
+        current[v] = result
+        return result
+
+    def hit_rate(self):
+        calls = self.hits + self.misses
+        return float(self.hits) / calls if calls else 0.0
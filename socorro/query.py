@@ -0,0 +1,287 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+
+# This file contains the filter and report half of parse_crashdata.py: the
+# command line options choosing which crashes to look at and what to print
+# about them, and the Query object that carries them out. The query server
+# (serve_crashdata.py) answers with the same code, so its output is the same
+# as the command line's for the same options and inputs.
+
+from sys import stderr, stdout
+
+from socorro.analysis import CrashAggregator, CrashFilter
+from socorro.dedupe import CrashDeduper
+from socorro.expression import ExpressionError
+from socorro.groupby import GroupByError, parse_group_by
+from socorro.sample import print_build_estimates, print_group_estimates
+from socorro.sample import print_signature_estimates, print_version_estimates
+
+class QueryError(Exception):
+    '''Raised when query options are invalid.'''
+
+def add_query_options(op):
+    '''Add the filter and report options to an OptionParser.'''
+    op.add_option('--signature', '-s', dest='signature', default=None,
+                  help='Filter crashes by those containing this string in signature')
+    op.add_option('--filter-stack-symbol', dest='filter_stack_symbol', default=None,
+                  help='Filter by the presence of a symbol on the stack. Performs substring matching')
+    op.add_option('--where', '-w', dest='where', default=None,
+                  help='Filter crashes by an expression, e.g. "product = Firefox and uptime < 60". See socorro/expression.py for the syntax')
+    op.add_option('--dedupe', dest='dedupe', default=False, action='store_true',
+                  help='Only count the first crash seen with each UUID')
+    op.add_option('--dedupe-duplicate-of', dest='dedupe_duplicate_of',
+                  default=False, action='store_true',
+                  help='Drop crashes marked as a duplicate of another crash')
+    op.add_option('--dedupe-capacity', dest='dedupe_capacity', default=1000000,
+                  type='int',
+                  help='Number of UUIDs --dedupe should expect. Sizes the Bloom filter for --dedupe-bloom; exact sets start small and grow as needed')
+    op.add_option('--dedupe-bloom', dest='dedupe_bloom', default=None,
+                  type='float',
+                  help='Remember UUIDs for --dedupe in a Bloom filter sized for --dedupe-capacity. Uses far less memory, but this fraction of unique crashes may be dropped as repeats')
+    op.add_option('--print-versions', dest='print_versions', default=False,
+                  action='store_true',
+                  help='Print a summary of version counts')
+    op.add_option('--print-builds', dest='print_builds', default=False,
+                  action='store_true',
+                  help='Print a summary of crashes by builds')
+    op.add_option('--print-frame-counts', dest='print_frame_counts', default=False,
+                  action='store_true',
+                  help='Print a count of symols seen in crashed stacks')
+    op.add_option('--print-frame-position-counts', dest='print_frame_position_counts',
+                  default=False, action='store_true',
+                  help='Like --print-frame-counts but groups frames by stack position')
+    op.add_option('--print-signatures', dest='print_signatures', default=False,
+                  action='store_true',
+                  help='Print a count of crashes per signature, most frequent first')
+    op.add_option('--group-by', dest='group_by', default=None,
+                  help='Print a count of crashes for each combination of these comma separated fields, e.g. "version,os_name,build_date"')
+    op.add_option('--cluster-stacks', dest='cluster_stacks', default=False,
+                  action='store_true',
+                  help='Print clusters of crashes with similar crashed thread stacks. Requires --json-dir or --dump-pack')
+    op.add_option('--cluster-threshold', dest='cluster_threshold', default=0.5,
+                  type='float',
+                  help='Fraction of top frame symbols two stacks must share to be clustered (default 0.5)')
+    op.add_option('--cluster-depth', dest='cluster_depth', default=10, type='int',
+                  help='Number of frames from the top of each stack to compare (default 10)')
+    op.add_option('--cluster-min-size', dest='cluster_min_size', default=2,
+                  type='int',
+                  help='Smallest cluster to print (default 2)')
+    op.add_option('--top', dest='top', default=None, type='int',
+                  help='Only print this many of the most frequent signatures, frames or groups')
+    op.add_option('--approx', dest='approx', default=False, action='store_true',
+                  help='With --top, count signatures and frames in bounded memory. Counts are upper bounds and are followed by their maximum overcount')
+    op.add_option('--approx-capacity', dest='approx_capacity', default=None,
+                  type='int',
+                  help='Number of keys each --approx report tracks. Defaults to 20 times --top')
+
+class Query(object):
+    '''The filter, aggregation and reports requested by query options.
+
+    UUIDs of matching crashes are printed to out as they are handled, unless
+    a report was requested. Reports go to out and notes about them to err.
+
+    If exporter is set, it is also given every crash counted (see
+    socorro.export).
+
+    If strata is set to the strata of a sampled run (see socorro.sample),
+    reports print estimated counts with confidence intervals instead.
+    '''
+
+    def __init__(self, options, collect_stats=False, out=stdout, err=stderr):
+        if options.approx and not options.top:
+            raise QueryError('--approx requires --top')
+
+        self.options = options
+        self.out = out
+        self.err = err
+        self.print_uuids = True
+        self.exporter = None
+        self.strata = None
+
+        collect_frames = False
+        collect_builds = False
+
+        if options.print_versions:
+            self.print_uuids = False
+
+        if options.print_builds:
+            self.print_uuids = False
+            collect_builds = True
+
+        if options.print_frame_counts or options.print_frame_position_counts:
+            self.print_uuids = False
+            collect_frames = True
+
+        collect_signatures = False
+        if options.print_signatures:
+            self.print_uuids = False
+            collect_signatures = True
+
+        group_by = None
+        if options.group_by:
+            self.print_uuids = False
+            try:
+                group_by = parse_group_by(options.group_by)
+            except GroupByError, e:
+                raise QueryError('Invalid --group-by: %s' % e)
+
+        cluster_threshold = None
+        if options.cluster_stacks:
+            self.print_uuids = False
+            cluster_threshold = options.cluster_threshold
+
+        approx_capacity = None
+        if options.approx:
+            approx_capacity = options.approx_capacity or options.top * 20
+
+        try:
+            self.crash_filter = CrashFilter(signature=options.signature,
+                                            stack_symbol=options.filter_stack_symbol,
+                                            where=options.where)
+        except ExpressionError, e:
+            raise QueryError('Invalid --where expression: %s' % e)
+
+        self.aggregator = CrashAggregator(collect_builds=collect_builds,
+                                          collect_frames=collect_frames,
+                                          collect_signatures=collect_signatures,
+                                          approx_capacity=approx_capacity,
+                                          cluster_threshold=cluster_threshold,
+                                          cluster_depth=options.cluster_depth,
+                                          group_by=group_by,
+                                          collect_stats=collect_stats)
+
+        self.deduper = None
+        if options.dedupe or options.dedupe_duplicate_of:
+            self.deduper = CrashDeduper(unique=options.dedupe,
+                                        drop_duplicate_of=options.dedupe_duplicate_of,
+                                        capacity=options.dedupe_capacity,
+                                        bloom_error_rate=options.dedupe_bloom)
+
+    def settings(self):
+        '''Returns the aggregator settings for pool workers.'''
+        settings = self.aggregator.settings()
+        settings['collect_uuids'] = self.print_uuids
+
+        return settings
+
+    def handle(self, crash):
+        '''Count a crash that passed the filter.'''
+        if self.deduper is not None and not self.deduper.accept(crash):
+            return
+
+        # data collection
+        self.aggregator.add(crash)
+
+        if self.exporter is not None:
+            self.exporter.add(crash)
+
+        # individual printing
+        if self.print_uuids:
+            print >>self.out, crash.uuid
+
+    def merge(self, result):
+        '''Merge an aggregator returned by a pool worker.'''
+        for uuid in result.uuids:
+            print >>self.out, uuid
+
+        self.aggregator.merge(result)
+
+    def print_reports(self):
+        if self.strata is not None:
+            self.print_estimates()
+            return
+
+        options = self.options
+        aggregator = self.aggregator
+        fh = self.out
+
+        if options.print_versions:
+            aggregator.print_versions(fh)
+
+        if options.print_builds:
+            aggregator.print_builds(fh)
+
+        if options.print_signatures:
+            aggregator.print_signatures(fh, top=options.top)
+
+        if options.print_frame_counts:
+            aggregator.print_frame_counts(fh, top=options.top)
+
+        if options.print_frame_position_counts:
+            aggregator.print_frame_position_counts(fh, top=options.top)
+
+        if options.group_by:
+            aggregator.print_groups(fh, top=options.top)
+
+        if options.cluster_stacks:
+            aggregator.print_stack_clusters(fh, min_size=options.cluster_min_size)
+
+        for name, error in aggregator.approx_error_bounds():
+            print >>self.err, 'Approximate %s counts are at most %d too high' % ( name, error )
+
+        deduper = self.deduper
+        if deduper is not None:
+            print >>self.err, 'Dropped %d repeated UUIDs and %d crashes marked as duplicates' % (
+                deduper.repeated, deduper.duplicate_of )
+
+            if aggregator.stats is not None:
+                aggregator.stats.count('dropped_repeated_uuid', deduper.repeated)
+                aggregator.stats.count('dropped_duplicate_of', deduper.duplicate_of)
+
+    def print_estimates(self):
+        options = self.options
+        strata = self.strata
+        fh = self.out
+
+        if options.print_versions:
+            print_version_estimates(fh, strata)
+
+        if options.print_builds:
+            print_build_estimates(fh, strata)
+
+        if options.print_signatures:
+            print_signature_estimates(fh, strata, top=options.top)
+
+        if options.group_by:
+            print_group_estimates(fh, strata, top=options.top)
+
+        seen = sum(s[0] for s in strata)
+        sampled = sum(s[1] for s in strata)
+        print >>self.err, 'Sampled %d of %d rows from %d strata. Counts are estimates followed by their 95%% confidence interval' % (
+            sampled, seen, len(strata) )
@@ -0,0 +1,307 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+
+# This file contains the sampling behind parse_crashdata.py --sample.
+#
+# Rows of daily CSV files are sampled as raw text, before any CSV parsing or
+# CrashData construction. A fixed size reservoir is kept either over all
+# rows (uniform sampling) or per day of date_processed (stratified
+# sampling), so every day of a long history is represented by the same
+# number of rows however unevenly crashes are spread over days. Only the
+# sampled rows are then parsed and aggregated, one aggregator per stratum.
+#
+# Counts are estimated by scaling each stratum's counts by the number of
+# rows it had over the number sampled from it. The 95% confidence
+# intervals use the normal approximation with finite population correction.
+# A stratum sampled whole contributes its exact counts and no error.
+
+import csv
+import random
+
+from cStringIO import StringIO
+from math import exp, floor, log, sqrt
+
+from socorro.analysis import CrashAggregator, process_csv_handle
+
+# z score for 95% confidence intervals.
+Z = 1.96
+
+class SampleError(Exception):
+    '''Raised when inputs cannot be sampled together.'''
+
+def _open_uniform(rng):
+    '''Returns a random number in (0, 1).'''
+    u = rng.random()
+    while u == 0.0:
+        u = rng.random()
+
+    return u
+
+class Reservoir(object):
+    '''A uniform random sample of fixed size over a stream of items.
+
+    Uses Algorithm L: once the reservoir is full, the number of items to
+    skip before the next replacement is drawn directly, so skipped items
+    cost a counter decrement rather than a random number each.
+    '''
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.items = []
+        self.seen = 0
+
+        self.w = 1.0
+        self.skip = 0
+
+    def _next_skip(self):
+        self.w *= exp(log(_open_uniform(self.rng)) / self.size)
+        self.skip = int(floor(log(_open_uniform(self.rng)) / log(1.0 - self.w)))
+
+    def add(self, item):
+        self.seen += 1
+
+        if self.skip:
+            self.skip -= 1
+            return
+
+        items = self.items
+        if len(items) < self.size:
+            items.append(item)
+            if len(items) == self.size:
+                self._next_skip()
+            return
+
+        items[self.rng.randrange(self.size)] = item
+        self._next_skip()
+
+def _records(lines):
+    '''Yields raw CSV records, joining the lines of quoted fields that span
+    lines. Blank lines are dropped.'''
+    pending = None
+
+    for line in lines:
+        if pending is not None:
+            pending.append(line)
+            if line.count('"') % 2:
+                yield ''.join(pending)
+                pending = None
+            continue
+
+        if '"' in line and line.count('"') % 2:
+            pending = [line]
+            continue
+
+        if line.strip():
+            yield line
+
+    if pending is not None:
+        yield ''.join(pending)
+
+class CSVSampler(object):
+    '''Reservoir samples the rows of daily CSV files.
+
+    size is the number of rows sampled in total or, if per_day is True, from
+    each day of date_processed. All inputs must share a header.
+    '''
+
+    def __init__(self, size, per_day=False, seed=None):
+        self.size = size
+        self.per_day = per_day
+        self.rng = random.Random(seed)
+        self.header = None
+
+        # stratum -> Reservoir. The stratum is None for uniform sampling and
+        # the YYYYMMDD day otherwise.
+        self.reservoirs = {}
+
+    def add_lines(self, lines, name='stdin'):
+        '''Sample the rows from a stream of CSV lines, header first.'''
+        lines = iter(lines)
+        try:
+            header = lines.next()
+        except StopIteration:
+            return
+
+        if self.header is None:
+            self.header = header
+        elif header != self.header:
+            raise SampleError('%s does not have the same columns as the inputs before it' % name)
+
+        if not self.per_day:
+            reservoir = self.reservoirs.get(None, None)
+            if reservoir is None:
+                reservoir = self.reservoirs[None] = Reservoir(self.size, self.rng)
+
+            add = reservoir.add
+            for record in _records(lines):
+                add(record)
+
+            return
+
+        columns = csv.reader([header], delimiter='\t').next()
+        if 'date_processed' not in columns:
+            raise SampleError('%s has no date_processed column to sample days by' % name)
+
+        i = columns.index('date_processed')
+        reservoirs = self.reservoirs
+
+        for record in _records(lines):
+            fields = record.split('\t', i + 1)
+            day = fields[i][:8] if len(fields) > i else ''
+
+            reservoir = reservoirs.get(day, None)
+            if reservoir is None:
+                reservoir = reservoirs[day] = Reservoir(self.size, self.rng)
+
+            reservoir.add(record)
+
+    def seen(self):
+        return sum(r.seen for r in self.reservoirs.itervalues())
+
+    def sampled(self):
+        return sum(len(r.items) for r in self.reservoirs.itervalues())
+
+def aggregate_sample(sampler, crash_filter, settings):
+    '''Parse and aggregate the sampled rows of each stratum.
+
+    Yields (rows seen, rows sampled, CrashAggregator) for each stratum, in
+    stratum order.
+    '''
+    for key in sorted(sampler.reservoirs):
+        reservoir = sampler.reservoirs[key]
+        aggregator = CrashAggregator(**settings)
+
+        fh = StringIO(sampler.header + ''.join(reservoir.items))
+        process_csv_handle(fh, crash_filter, aggregator.add, aggregator.stats)
+
+        yield reservoir.seen, len(reservoir.items), aggregator
+
+def estimate_counts(strata, counts_of):
+    '''Estimate population counts from per-stratum sample counts.
+
+    strata is a list of (rows seen, rows sampled, CrashAggregator) and
+    counts_of returns the dict of counts to estimate from an aggregator.
+    Returns a dict of key to (estimate, low, high). low is never less than
+    the number of sampled crashes having the key.
+    '''
+    totals = {}
+
+    for seen, sampled, aggregator in strata:
+        if not sampled:
+            continue
+
+        scale = float(seen) / sampled
+        # Finite population correction over the sample variance of a
+        # proportion.
+        factor = 0.0
+        if sampled > 1:
+            factor = float(seen) * seen * (1.0 - float(sampled) / seen) / (sampled - 1)
+
+        for key, count in counts_of(aggregator).iteritems():
+            p = float(count) / sampled
+            estimate, variance, observed = totals.get(key, (0.0, 0.0, 0))
+            totals[key] = (estimate + scale * count,
+                           variance + factor * p * (1.0 - p),
+                           observed + count)
+
+    estimates = {}
+    for key, (estimate, variance, observed) in totals.iteritems():
+        margin = Z * sqrt(variance)
+        estimates[key] = (estimate, max(observed, estimate - margin),
+                          estimate + margin)
+
+    return estimates
+
+def _group_key(values):
+    # None sorts first and is never compared to other values.
+    return [(v is not None, v) for v in values]
+
+def _top_estimates(estimates, top, key=lambda k: k):
+    '''Returns (key, estimate) items, largest estimate first.'''
+    items = sorted(estimates.iteritems(),
+                   key=lambda item: (-item[1][0], key(item[0])))
+    if top is not None:
+        items = items[:top]
+
+    return items
+
+# The print functions below write one line per key: the estimated count and
+# the low and high ends of its 95% confidence interval, then the key.
+
+def print_version_estimates(fh, strata):
+    estimates = estimate_counts(strata, lambda a: a.version_counts)
+
+    for k in sorted(estimates):
+        estimate, low, high = estimates[k]
+        print >>fh, '%.0f\t%.0f\t%.0f\t%s' % ( estimate, low, high, k )
+
+def print_build_estimates(fh, strata):
+    estimates = estimate_counts(strata, lambda a: a.build_counts)
+    totals = estimate_counts(strata, lambda a: a.version_counts)
+
+    versions = {}
+    for version, date in estimates:
+        versions.setdefault(version, []).append(date)
+
+    for version in sorted(versions):
+        for date in sorted(versions[version]):
+            estimate, low, high = estimates[(version, date)]
+            print >>fh, '%s\t%s\t%s\t%.0f\t%.0f' % ( version.ljust(12), str(date).ljust(20), ('%.0f' % estimate).rjust(7), low, high )
+
+        estimate, low, high = totals[version]
+        print >>fh, '%s\t%s\t%s\t%.0f\t%.0f' % ( version.ljust(12), 'Total'.ljust(20), ('%.0f' % estimate).rjust(7), low, high )
+
+def print_signature_estimates(fh, strata, top=None):
+    estimates = estimate_counts(strata, lambda a: a.signature_counts)
+
+    for k, (estimate, low, high) in _top_estimates(estimates, top):
+        print >>fh, '%.0f\t%.0f\t%.0f\t%s' % ( estimate, low, high, k )
+
+def print_group_estimates(fh, strata, top=None):
+    estimates = estimate_counts(strata, lambda a: dict(a.groups.items()))
+
+    if top is None:
+        items = sorted(estimates.iteritems(),
+                       key=lambda item: _group_key(item[0]))
+    else:
+        items = _top_estimates(estimates, top, _group_key)
+
+    for values, (estimate, low, high) in items:
+        print >>fh, '%.0f\t%.0f\t%.0f\t%s' % ( estimate, low, high, '\t'.join(['' if v is None else str(v) for v in values]) )
@@ -0,0 +1,328 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+
+# This file contains the resident query server behind serve_crashdata.py and
+# query_crashdata.py.
+#
+# The server loads its inputs once. Daily CSV files are read through their
+# columnar caches, which are built into a private directory for files that
+# have none. Both their rows and dumps are kept as lazily decoded CrashData
+# instances, so each field and stack is decoded at most once over the life
+# of the server.
+#
+# A request is a single line of JSON, {"args": [...]}, holding the same
+# filter and report options parse_crashdata.py takes. The reply is a line
+# "<exit status> <stdout length> <stderr length>\n" followed by the text
+# parse_crashdata.py would have written to stdout and stderr. Requests are
+# answered one at a time.
+
+import hashlib
+import json
+import os
+import socket
+import SocketServer
+import traceback
+
+from cStringIO import StringIO
+from optparse import OptionParser
+from os.path import abspath, exists, join
+from sys import stderr
+
+from socorro.analysis import open_csv_file, process_cache
+from socorro.cache import CrashDataCache, SignatureIndex, build_cache
+from socorro.cache import build_signature_index, open_cache
+from socorro.cache import open_signature_index
+from socorro.crashdata import CrashData
+from socorro.query import Query, QueryError, add_query_options
+
+class _ParserExit(Exception):
+    def __init__(self, status):
+        Exception.__init__(self, status)
+        self.status = status
+
+class QueryOptionParser(OptionParser):
+    '''Parses query options, writing help and errors to buffers instead of
+    the process' stdout and stderr, and raising instead of exiting.'''
+
+    def __init__(self, out, err):
+        OptionParser.__init__(self, prog='parse_crashdata.py')
+        add_query_options(self)
+
+        self.out = out
+        self.err = err
+
+    def print_help(self, file=None):
+        OptionParser.print_help(self, file or self.out)
+
+    def exit(self, status=0, msg=None):
+        if msg:
+            self.err.write(msg)
+
+        raise _ParserExit(status)
+
+    def error(self, msg):
+        self.print_usage(self.err)
+        self.exit(2, '%s: error: %s\n' % (self.get_prog_name(), msg))
+
+class ResidentCrashes(object):
+    '''Crash inputs held in memory to be queried repeatedly.
+
+    Inputs follow parse_crashdata.py's precedence: a JSON directory, else a
+    dump pack, else CSV files. cache_dir is where caches are built for CSV
+    files that have no current cache of their own.
+    '''
+
+    def __init__(self, csv_files=(), json_dir=None, dump_pack=None,
+                 cache_dir=None, log=stderr):
+        self.log = log
+        self.cache_dir = cache_dir
+
+        # (cache, signature index, crashes for all rows) for each CSV file
+        self.caches = []
+
+        # (name, CrashData) for each dump. The crash is None if the dump
+        # could not be loaded, in which case its data is kept instead.
+        self.dumps = []
+
+        if json_dir:
+            self._load_dumps(self._read_json_dir(json_dir))
+        elif dump_pack:
+            from socorro.dumpstore import DumpStore
+
+            store = DumpStore(dump_pack)
+            try:
+                self._load_dumps(iter(store))
+            finally:
+                store.close()
+        else:
+            for filename in csv_files:
+                self._load_csv(filename)
+
+    def _read_json_dir(self, directory):
+        for p in os.listdir(directory):
+            if p[-5:] != '.json':
+                continue
+
+            filename = join(directory, p)
+            with open(filename, 'rb') as fh:
+                yield filename, fh.read()
+
+    def _load_dumps(self, items):
+        for name, data in items:
+            try:
+                self.dumps.append((name, CrashData(json=data, lazy=True), None))
+            except Exception:
+                self.dumps.append((name, None, data))
+
+    def _load_csv(self, filename):
+        cache = open_cache(filename)
+        if cache is not None:
+            self._add_cache(cache, open_signature_index(filename, cache))
+            return
+
+        key = hashlib.sha1(abspath(filename)).hexdigest()
+        cache_path = join(self.cache_dir, '%s.cache' % key)
+        index_path = join(self.cache_dir, '%s.sigindex' % key)
+
+        with open_csv_file(filename) as fh:
+            build_cache(fh, filename, cache_path)
+
+        cache = CrashDataCache(cache_path)
+        build_signature_index(cache, index_path)
+
+        self._add_cache(cache, SignatureIndex(index_path, cache))
+
+    def _add_cache(self, cache, index):
+        self.caches.append((cache, index, list(cache.crashes())))
+
+    def __len__(self):
+        return sum(cache.rows for cache, i, c in self.caches) + len(self.dumps)
+
+    def process(self, crash_filter, handle, err):
+        '''Calls handle for every crash that passes a filter.
+
+        As with parse_crashdata.py, dumps that fail to load or handle are
+        reported on err and skipped.
+        '''
+        for cache, index, cached in self.caches:
+            process_cache(cache, crash_filter, handle, index=index,
+                          crashes=cached)
+
+        prefilters = crash_filter.json_prefilters()
+
+        for name, crash, data in self.dumps:
+            try:
+                if crash is None:
+                    if [s for s in prefilters if s not in data]:
+                        continue
+
+                    raise ValueError(name)
+
+                if crash_filter.matches(crash):
+                    handle(crash)
+            except:
+                print >>err, 'Error loading crash data: %s' % name
+
+    def close(self):
+        for cache, index, cached in self.caches:
+            if index is not None:
+                index.close()
+
+            cache.close()
+
+def run_query(crashes, args):
+    '''Answer a query over resident crashes.
+
+    args are parse_crashdata.py filter and report options. Returns the exit
+    status and the text written to stdout and stderr. A query that fails
+    has status 1, with the traceback on stderr.
+    '''
+    out = StringIO()
+    err = StringIO()
+    op = QueryOptionParser(out, err)
+
+    try:
+        options, rest = op.parse_args(args)
+        if rest:
+            op.error('Inputs are chosen by the server, not the query: %s' % ' '.join(rest))
+
+        try:
+            query = Query(options, out=out, err=err)
+        except QueryError, e:
+            op.error(str(e))
+
+        if options.cluster_stacks and not crashes.dumps:
+            op.error('--cluster-stacks requires --json-dir or --dump-pack')
+
+        crashes.process(query.crash_filter, query.handle, err)
+        query.print_reports()
+        status = 0
+    except _ParserExit, e:
+        status = e.status
+    except Exception:
+        err.write(traceback.format_exc())
+        status = 1
+
+    return status, out.getvalue(), err.getvalue()
+
+class _QueryHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # The peer connected without asking anything, e.g. to see
+            # whether the server is alive.
+            return
+
+        try:
+            args = [a.encode('utf-8') for a in json.loads(line)['args']]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self._reply(2, '', 'Malformed query\n')
+            return
+
+        self._reply(*run_query(self.server.crashes, args))
+
+    def _reply(self, status, out, err):
+        self.wfile.write('%d %d %d\n' % (status, len(out), len(err)))
+        self.wfile.write(out)
+        self.wfile.write(err)
+
+class UnixQueryServer(SocketServer.UnixStreamServer):
+    '''Answers queries over a Unix socket.'''
+
+    def __init__(self, path, crashes):
+        # A socket file nobody is listening on is left over from a server
+        # that died. Anything else is in use.
+        if exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except socket.error:
+                os.unlink(path)
+            else:
+                raise socket.error('Socket in use: %s' % path)
+            finally:
+                probe.close()
+
+        SocketServer.UnixStreamServer.__init__(self, path, _QueryHandler)
+        self.crashes = crashes
+
+class TCPQueryServer(SocketServer.TCPServer):
+    '''Answers queries over TCP on the loopback interface.'''
+
+    allow_reuse_address = True
+
+    def __init__(self, port, crashes):
+        SocketServer.TCPServer.__init__(self, ('127.0.0.1', port), _QueryHandler)
+        self.crashes = crashes
+
+def connect(address):
+    '''Connect to a query server. address is a Unix socket path or
+    HOST:PORT.'''
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        return socket.create_connection((host or '127.0.0.1', int(port)))
+
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(address)
+    return s
+
+def _read_exactly(fh, n):
+    data = fh.read(n)
+    if len(data) != n:
+        raise IOError('Connection closed by server')
+
+    return data
+
+def send_query(address, args):
+    '''Send a query to a server. Returns (status, stdout text, stderr text).'''
+    s = connect(address)
+    try:
+        s.sendall(json.dumps({'args': args}) + '\n')
+
+        fh = s.makefile('rb')
+        header = fh.readline().split()
+        if len(header) != 3:
+            raise IOError('Malformed reply from server')
+
+        status, out_length, err_length = [int(v) for v in header]
+
+        return (status, _read_exactly(fh, out_length),
+                _read_exactly(fh, err_length))
+    finally:
+        s.close()
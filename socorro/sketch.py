@@ -0,0 +1,158 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+
+# This file contains bounded memory summaries of large streams.
+#
+# SpaceSaving implements the Space-Saving algorithm of Metwally, Agrawal and
+# El Abbadi. It monitors at most capacity keys. When a key that is not
+# monitored arrives and the summary is full, the key with the smallest count
+# is replaced and the newcomer inherits that count as its error. Each
+# reported count is an upper bound of the true count that exceeds it by at
+# most the reported error, and no error exceeds total / capacity. Any key
+# occurring more often than that is guaranteed to be monitored.
+
+import heapq
+
+class SpaceSaving(object):
+    '''Approximate counts of the most frequent keys in a stream.'''
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('capacity must be positive')
+
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+
+        # (count, key) for every monitored key. Counts only ever grow, so an
+        # entry may be stale, in which case it is lower than the real count.
+        # Stale entries are fixed up when they reach the top.
+        self._heap = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def _pop_min(self):
+        heap = self._heap
+        counts = self.counts
+
+        while True:
+            count, key = heapq.heappop(heap)
+            actual = counts[key]
+            if actual == count:
+                return count, key
+
+            heapq.heappush(heap, (actual, key))
+
+    def add(self, key, n=1):
+        self.total += n
+
+        counts = self.counts
+        if key in counts:
+            counts[key] += n
+            return
+
+        if len(counts) < self.capacity:
+            counts[key] = n
+            self.errors[key] = 0
+            heapq.heappush(self._heap, (n, key))
+            return
+
+        count, victim = self._pop_min()
+        del counts[victim]
+        del self.errors[victim]
+
+        counts[key] = count + n
+        self.errors[key] = count
+        heapq.heappush(self._heap, (count + n, key))
+
+    def min_count(self):
+        '''Returns the count an unmonitored key may have at most.'''
+        if len(self.counts) < self.capacity:
+            return 0
+
+        count, key = self._pop_min()
+        heapq.heappush(self._heap, (count, key))
+
+        return count
+
+    def max_error(self):
+        '''Returns the bound on the error of every count.'''
+        return self.total // self.capacity
+
+    def merge(self, other):
+        '''Add the keys counted by another summary to this one.
+
+        Keys missing from a full summary may have occurred up to its minimum
+        count times there, so that is added to both their count and error.
+        The merged summary keeps the capacity largest counts.
+        '''
+        ours_min = self.min_count()
+        theirs_min = other.min_count()
+
+        counts = {}
+        errors = {}
+        for key in set(self.counts) | set(other.counts):
+            counts[key] = (self.counts.get(key, ours_min) +
+                           other.counts.get(key, theirs_min))
+            errors[key] = (self.errors.get(key, ours_min) +
+                           other.errors.get(key, theirs_min))
+
+        if len(counts) > self.capacity:
+            keep = heapq.nlargest(self.capacity, counts.iteritems(),
+                                  key=lambda item: item[1])
+            counts = dict(keep)
+            errors = dict((k, errors[k]) for k in counts)
+
+        self.total += other.total
+        self.counts = counts
+        self.errors = errors
+        self._heap = [(v, k) for k, v in counts.iteritems()]
+        heapq.heapify(self._heap)
+
+    def top(self, n):
+        '''Returns up to n (key, count, error) tuples, largest count first.'''
+        items = heapq.nsmallest(n, self.counts.iteritems(),
+                                key=lambda item: (-item[1], item[0]))
+
+        return [(k, v, self.errors[k]) for k, v in items]
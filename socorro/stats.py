@@ -0,0 +1,229 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+
+# This file contains the instrumentation behind parse_crashdata.py --stats.
+#
+# A Stats instance holds counters and the time spent in each stage of a run.
+# Stages nest: reading a line happens inside CSV parsing, which happens inside
+# CrashData construction. Time is always charged to the innermost stage that
+# is active, so the per-stage figures add up to the instrumented total
+# instead of counting the same second several times.
+
+import json
+import time
+
+from sys import stderr
+
+# Stages in pipeline order. Used to order reports.
+STAGES = ('sample', 'read', 'prefilter', 'csv', 'construct', 'filter',
+          'aggregate')
+
+class Stats(object):
+    '''Counters and per-stage timings for a run.
+
+    If progress_interval is given, progress() prints a line to stderr at most
+    once per that many seconds.
+    '''
+
+    def __init__(self, progress_interval=None):
+        self.counts = {}
+        self.times = {}
+        self.started = time.time()
+        self.progress_interval = progress_interval
+
+        self._stack = []
+        self._last = self.started
+        self._next_progress = self.started + (progress_interval or 0)
+
+    def __getstate__(self):
+        # Stats travel back from pool workers. A worker's stack is empty by
+        # the time it returns, and progress is only printed by the parent.
+        return {'counts': self.counts, 'times': self.times,
+                'started': self.started}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.progress_interval = None
+        self._stack = []
+        self._last = time.time()
+        self._next_progress = 0
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def push(self, stage):
+        '''Enter a stage. Must be paired with pop().'''
+        now = time.time()
+        stack = self._stack
+        if stack:
+            top = stack[-1]
+            self.times[top] = self.times.get(top, 0.0) + now - self._last
+
+        stack.append(stage)
+        self._last = now
+
+    def pop(self):
+        '''Leave the current stage.'''
+        now = time.time()
+        top = self._stack.pop()
+        self.times[top] = self.times.get(top, 0.0) + now - self._last
+        self._last = now
+
+    def depth(self):
+        return len(self._stack)
+
+    def unwind(self, depth):
+        '''Leave stages until only depth are active.
+
+        Used after an exception skipped the matching pop() calls.
+        '''
+        while len(self._stack) > depth:
+            self.pop()
+
+    def timed(self, iterable, stage):
+        '''Yields the items of an iterable, charging the time taken to
+        produce each one to a stage.'''
+        next_item = iter(iterable).next
+        push = self.push
+        pop = self.pop
+
+        while True:
+            push(stage)
+            try:
+                item = next_item()
+            finally:
+                pop()
+
+            yield item
+
+    def lines(self, lines):
+        '''Yields raw lines, timing them as the read stage and counting
+        lines and bytes.
+
+        For .gz files this is where decompression happens, so bytes_read is
+        the uncompressed size.
+        '''
+        n = 0
+        size = 0
+        try:
+            for line in self.timed(lines, 'read'):
+                n += 1
+                size += len(line)
+                yield line
+        finally:
+            self.count('lines_read', n)
+            self.count('bytes_read', size)
+
+    def merge(self, other):
+        '''Add the counts and timings from another Stats to this one.'''
+        for ours, theirs in ((self.counts, other.counts),
+                             (self.times, other.times)):
+            for k, v in theirs.iteritems():
+                ours[k] = ours.get(k, 0) + v
+
+    def progress(self):
+        '''Print a progress line if progress_interval has passed.'''
+        if not self.progress_interval:
+            return
+
+        now = time.time()
+        if now < self._next_progress:
+            return
+
+        self._next_progress = now + self.progress_interval
+
+        elapsed = now - self.started
+        read = self.counts.get('crashes_read', 0)
+        print >>stderr, 'progress: %.1fs, %d crashes read, %d matched, %.0f crashes/s' % (
+            elapsed, read, self.counts.get('crashes_matched', 0),
+            read / elapsed if elapsed else 0)
+
+    def _stage_names(self):
+        names = [s for s in STAGES if s in self.times]
+        names.extend(sorted(s for s in self.times if s not in STAGES))
+        return names
+
+    def to_dict(self):
+        wall = time.time() - self.started
+
+        return {
+            'wall_seconds': wall,
+            'stages': dict(self.times),
+            'counts': dict(self.counts),
+        }
+
+    def write_json(self, path):
+        with open(path, 'wb') as fh:
+            json.dump(self.to_dict(), fh, indent=2, sort_keys=True)
+            fh.write('\n')
+
+    def print_summary(self, fh=stderr):
+        wall = time.time() - self.started
+        total = sum(self.times.values())
+
+        print >>fh, '%s\t%s\t%s' % ( 'Stage'.ljust(28), 'Seconds'.rjust(10), 'Share'.rjust(7) )
+        for stage in self._stage_names():
+            t = self.times[stage]
+            share = 100.0 * t / total if total else 0.0
+            print >>fh, '%s\t%s\t%s' % ( stage.ljust(28), ('%.3f' % t).rjust(10), ('%.1f%%' % share).rjust(7) )
+
+        print >>fh, '%s\t%s' % ( 'Total'.ljust(28), ('%.3f' % total).rjust(10) )
+        print >>fh, '%s\t%s' % ( 'Wall time'.ljust(28), ('%.3f' % wall).rjust(10) )
+        print >>fh
+
+        print >>fh, '%s\t%s' % ( 'Counter'.ljust(28), 'Value'.rjust(10) )
+        for name in sorted(self.counts):
+            print >>fh, '%s\t%s' % ( name.ljust(28), str(self.counts[name]).rjust(10) )
+
+        memos = sorted(set(name.split('.', 1)[1] for name in self.counts
+                           if name.startswith('memo_hits.') or
+                              name.startswith('memo_misses.')))
+        if memos:
+            print >>fh
+            print >>fh, '%s\t%s' % ( 'Memo'.ljust(28), 'Hit rate'.rjust(10) )
+            for name in memos:
+                hits = self.counts.get('memo_hits.%s' % name, 0)
+                misses = self.counts.get('memo_misses.%s' % name, 0)
+                print >>fh, '%s\t%s' % ( name.ljust(28), ('%.1f%%' % (100.0 * hits / (hits + misses))).rjust(10) )
+
+        if wall > 0:
+            print >>fh
+            print >>fh, '%.0f crashes/s, %.2f MB/s' % (
+                self.counts.get('crashes_read', 0) / wall,
+                self.counts.get('bytes_read', 0) / wall / 1048576)
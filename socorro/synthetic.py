@@ -0,0 +1,299 @@
+# ***** BEGIN LICENSE BLOCK *****
+# Version: MPL 1.1/GPL 2.0/LGPL 2.1
+#
+# The contents of this file are subject to the Mozilla Public License Version
+# 1.1 (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at
+# http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS" basis,
+# WITHOUT WARRANTY OF ANY KIND, either express or implied. See the License
+# for the specific language governing rights and limitations under the
+# License.
+#
+# The Original Code is Breakpad Tools
+#
+# The Initial Developer of the Original Code is Mozilla Foundation.
+#
+# Portions created by the Initial Developer are Copyright (C) 2011
+# the Initial Developer. All Rights Reserved.
+#
+# Contributor(s):
+#  Gregory Szorc <gps@mozilla.com>
+#
+# Alternatively, the contents of this file may be used under the terms of
+# either the GNU General Public License Version 2 or later (the "GPL"), or
+# the GNU Lesser General Public License Version 2.1 or later (the "LGPL"),
+# in which case the provisions of the GPL or the LGPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of either the GPL or the LGPL, and not to allow others to
+# use your version of this file under the terms of the MPL, indicate your
+# decision by deleting the provisiwons above and replace them with the notice
+# and other provisions required by the GPL or the LGPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the MPL, the GPL or the LGPL.
+#
+# ***** END LICENSE BLOCK *****
+
+
+# This file contains a generator of synthetic crash data.
+#
+# The data mimics the daily CSV files and the JSON dumps from the crash
+# server closely enough to exercise every code path in this package. It is
+# deterministic for a given seed, so benchmark runs are comparable.
+
+import gzip
+import json
+import os
+
+from datetime import datetime, timedelta
+from random import Random
+
+CSV_HEADER = [
+    'signature',
+    'URL (removed)',
+    'uuid_url',
+    'client_crash_date',
+    'date_processed',
+    'last_crash',
+    'product',
+    'version',
+    'build',
+    'build_date',
+    'branch',
+    'os_name',
+    'os_version',
+    'cpu_name',
+    'cpu_info',
+    'address',
+    'bug_list',
+    'user_comments',
+    'uptime_seconds',
+    'adu_count',
+    'topmost_filenames',
+    'addons_checked',
+    'flash_version',
+    'hangid',
+    'reason',
+    'process_type',
+    'app_notes',
+    'install_age',
+    'duplicate_of',
+    'release_channel',
+]
+
+PRODUCTS = [
+    ('Firefox', ['5.0', '6.0', '7.0a2', '8.0a1'], ['release', 'beta', 'aurora', 'nightly']),
+    ('Thunderbird', ['5.0', '6.0'], ['release', 'beta']),
+    ('SeaMonkey', ['2.2'], ['release']),
+]
+
+PLATFORMS = [
+    ('Windows NT', ['5.1.2600 Service Pack 3', '6.1.7600', '6.1.7601 Service Pack 1'],
+     'x86', 'GenuineIntel family 6 model 23 stepping 10 | 2'),
+    ('Mac OS X', ['10.6.8 10K549', '10.7.0 11A511'],
+     'amd64', 'family 6 model 23 stepping 10 | 2'),
+    ('Linux', ['0.0.0 Linux 2.6.38 #1 SMP x86_64'],
+     'amd64', 'family 6 model 15 stepping 11 | 4'),
+]
+
+REASONS = [
+    'EXCEPTION_ACCESS_VIOLATION_READ',
+    'EXCEPTION_ACCESS_VIOLATION_WRITE',
+    'EXC_BAD_ACCESS / KERN_INVALID_ADDRESS',
+    'SIGSEGV',
+]
+
+class CrashGenerator(object):
+    '''Generates synthetic crash CSV rows and JSON dumps.
+
+    signatures is the number of distinct signatures. Their frequencies
+    follow a long-tailed distribution like real crash data. stack_depth is
+    the number of frames in each thread and modules the number of distinct
+    modules frames are attributed to.
+    '''
+
+    def __init__(self, seed=0, signatures=1000, stack_depth=20, modules=50,
+                 threads=4):
+        self.random = Random(seed)
+        self.stack_depth = stack_depth
+        self.threads = threads
+
+        rng = self.random
+
+        self.modules = ['module%d.dll' % i for i in range(modules)]
+        self.modules[0] = 'xul.dll'
+
+        self.symbols = []
+        for i in range(max(100, signatures * 2)):
+            self.symbols.append('ns%s%d::%s(%s)' % (
+                rng.choice(['Frame', 'Thread', 'Layout', 'Socket', 'JS']), i,
+                rng.choice(['Run', 'Init', 'Destroy', 'Reflow', 'Invoke']),
+                rng.choice(['', 'int', 'void*', 'nsISupports*'])))
+
+        self.symbols[0] = 'memcpy'
+        self.symbols[1] = 'js::Interpret(JSContext*, StackFrame*, unsigned int, js::InterpMode)'
+
+        # Signatures are the top 1 to 3 frames of the crashing stack.
+        self.signatures = []
+        for i in range(signatures):
+            frames = [self.symbols[(i + j * signatures) % len(self.symbols)]
+                      for j in range(rng.randint(1, 3))]
+            self.signatures.append(frames)
+
+        self.builds = []
+        for i in range(10):
+            self.builds.append(datetime(2011, 7, 1) + timedelta(days=i * 3))
+
+        self.count = 0
+
+    def _pick_signature(self):
+        # Pareto distributed index, so a handful of signatures dominate.
+        i = int(self.random.paretovariate(0.8)) - 1
+        return self.signatures[i % len(self.signatures)]
+
+    def _uuid(self):
+        self.count += 1
+        return '%08x-%04x-%04x-%04x-%012x' % (
+            self.random.getrandbits(32), self.random.getrandbits(16),
+            self.random.getrandbits(16), self.random.getrandbits(16),
+            self.count)
+
+    def crash(self, day):
+        '''Returns a dict of CSV column values for a crash on a day.'''
+        rng = self.random
+
+        product, versions, channels = rng.choice(PRODUCTS)
+        os_name, os_versions, cpu_name, cpu_info = rng.choice(PLATFORMS)
+        build = rng.choice(self.builds)
+        processed = day + timedelta(seconds=rng.randint(0, 86399))
+        crashed = processed - timedelta(seconds=rng.randint(0, 3600))
+        uuid = self._uuid()
+
+        return {
+            'signature': ' | '.join(self._pick_signature()),
+            'URL (removed)': '',
+            'uuid_url': 'https://crash-stats.mozilla.com/report/index/' + uuid,
+            'client_crash_date': crashed.strftime('%Y%m%d%H%M'),
+            'date_processed': processed.strftime('%Y%m%d%H%M'),
+            'last_crash': str(rng.randint(0, 100000)),
+            'product': product,
+            'version': rng.choice(versions),
+            'build': build.strftime('%Y%m%d%H%M%S'),
+            'build_date': build.strftime('%Y%m%d%H%M'),
+            'branch': '2.2',
+            'os_name': os_name,
+            'os_version': rng.choice(os_versions),
+            'cpu_name': cpu_name,
+            'cpu_info': cpu_info,
+            'address': '0x%x' % rng.getrandbits(32),
+            'bug_list': ','.join(str(rng.randint(600000, 680000))
+                                 for i in range(rng.choice([0, 0, 0, 1, 2]))),
+            'user_comments': rng.choice(['', '', '', 'It crashed again']),
+            'uptime_seconds': str(rng.randint(0, 200000)),
+            'adu_count': '',
+            'topmost_filenames': '',
+            'addons_checked': rng.choice(['', 't', 'f']),
+            'flash_version': rng.choice(['10.3.181.34', '10.2.159.1', '[blank]']),
+            'hangid': '',
+            'reason': rng.choice(REASONS),
+            'process_type': rng.choice(['', '', '', 'plugin']),
+            'app_notes': '',
+            'install_age': str(rng.randint(0, 1000000)),
+            'duplicate_of': '\\N',
+            'release_channel': rng.choice(channels),
+        }
+
+    def write_csv(self, path, rows, day):
+        '''Write a daily CSV file. It is gzipped if path ends in .gz.'''
+        if path[-3:] == '.gz':
+            fh = gzip.open(path, 'wb')
+        else:
+            fh = open(path, 'wb')
+
+        fh.write('\t'.join(CSV_HEADER))
+        fh.write('\n')
+
+        for i in range(rows):
+            crash = self.crash(day)
+            fh.write('\t'.join(crash[k] for k in CSV_HEADER))
+            fh.write('\n')
+
+        fh.close()
+
+    def _frame_line(self, thread, index, signature):
+        rng = self.random
+
+        if index < len(signature):
+            symbol = signature[index]
+        else:
+            symbol = rng.choice(self.symbols)
+
+        return '%d|%d|%s|%s|%s|%d|0x%x' % (
+            thread, index, rng.choice(self.modules), symbol,
+            'hg:hg.mozilla.org/mozilla-central:src/%s.cpp:abcdef' % symbol[:6],
+            rng.randint(1, 5000), rng.getrandbits(16))
+
+    def dump(self, day):
+        '''Returns a dict like the JSON served for a single crash.'''
+        rng = self.random
+
+        crash = self.crash(day)
+        signature = crash['signature'].split(' | ')
+        crashed_thread = rng.randint(0, self.threads - 1)
+
+        lines = [
+            'OS|%s|%s' % ( crash['os_name'], crash['os_version'] ),
+            'CPU|%s|%s' % ( crash['cpu_name'], crash['cpu_info'] ),
+            'Crash|%s|%s|%d' % ( crash['reason'], crash['address'], crashed_thread ),
+        ]
+
+        for i, module in enumerate(self.modules):
+            lines.append('Module|%s|1.0.0.%d|%s.pdb|%032X|0x%x|0x%x|%d' % (
+                module, i, module, rng.getrandbits(128),
+                0x10000000 + i * 0x100000, 0x10000000 + i * 0x100000 + 0xfffff,
+                1 if i == 0 else 0))
+
+        lines.append('')
+
+        for thread in range(self.threads):
+            # Only the crashed thread starts with the signature frames.
+            frames = signature if thread == crashed_thread else []
+            for index in range(self.stack_depth):
+                lines.append(self._frame_line(thread, index, frames))
+
+        build = datetime.strptime(crash['build_date'], '%Y%m%d%H%M')
+        processed = datetime.strptime(crash['date_processed'], '%Y%m%d%H%M')
+        uuid = crash['uuid_url'].split('/')[-1]
+
+        return {
+            'uuid': uuid,
+            'signature': crash['signature'],
+            'product': crash['product'],
+            'version': crash['version'],
+            'build': crash['build'],
+            'build_date': build.strftime('%Y-%m-%d %H:%M:%S.000000'),
+            'date_processed': processed.strftime('%Y-%m-%d %H:%M:%S.123456'),
+            'os_name': crash['os_name'],
+            'os_version': crash['os_version'],
+            'reason': crash['reason'],
+            'address': crash['address'],
+            'crashedThread': crashed_thread,
+            'uptime': int(crash['uptime_seconds']),
+            'install_age': int(crash['install_age']),
+            'user_comments': crash['user_comments'] or None,
+            'dump': '\n'.join(lines),
+        }
+
+    def write_dumps(self, directory, count, day):
+        '''Write dumps to <directory>/<uuid>.json. Returns the UUIDs.'''
+        uuids = []
+
+        for i in range(count):
+            dump = self.dump(day)
+            with open(os.path.join(directory, '%s.json' % dump['uuid']), 'wb') as fh:
+                json.dump(dump, fh)
+
+            uuids.append(dump['uuid'])
+
+        return uuids